@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the HTML-to-text extractors
+Times the lxml single-pass extractor against the BeautifulSoup/html5lib
+reference on the saved source pages
+
+Usage:
+    python benchmark_html_to_text.py                  # readability-cleaned pages
+    python benchmark_html_to_text.py --raw            # full pages, no readability
+    python benchmark_html_to_text.py --repeat 50 --scale 10
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Dict, List
+
+from rag_pipeline import TextProcessor
+from test_html_to_text import FIXTURE_DIR
+
+EXTRACTORS = {
+    "bs4_html5lib": TextProcessor.html_to_text_keep_headers_bs4,
+    "lxml_single_pass": TextProcessor.html_to_text_keep_headers,
+}
+
+
+def time_extractor(fn: Callable[[str], str], html: str, repeat: int) -> float:
+    """Best-of-3 mean seconds per call"""
+    fn(html)  # warm-up
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn(html)
+        best = min(best, (time.perf_counter() - t0) / repeat)
+    return best
+
+
+def scale_page(html: str, factor: int) -> str:
+    """Repeat the body content to simulate a longer page"""
+    start, end = html.find("<body"), html.rfind("</body>")
+    if factor <= 1 or start < 0 or end < 0:
+        return html
+    start = html.find(">", start) + 1
+    return html[:start] + html[start:end] * factor + html[end:]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark HTML-to-text extractors")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1,
+                        help="repeat each page body N times")
+    parser.add_argument("--raw", action="store_true",
+                        help="time on full pages instead of readability output")
+    parser.add_argument("--json", type=str, default="",
+                        help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    pages = sorted(FIXTURE_DIR.glob("*.html"))
+    if not pages:
+        print(f"❌ No pages in {FIXTURE_DIR}")
+        sys.exit(1)
+
+    results: List[Dict] = []
+    for path in pages:
+        html = scale_page(path.read_text(encoding="utf-8"), args.scale)
+        if not args.raw:
+            html = TextProcessor.readability_clean(html)
+        row = {"page": path.stem, "kb": len(html.encode("utf-8")) / 1024}
+        for name, fn in EXTRACTORS.items():
+            row[f"{name}_ms"] = 1000 * time_extractor(fn, html, args.repeat)
+        row["speedup"] = row["bs4_html5lib_ms"] / row["lxml_single_pass_ms"]
+        results.append(row)
+
+    print(f"\n{'page':<32} {'KB':>8} {'bs4 ms':>10} {'lxml ms':>10} {'speedup':>9}")
+    print("-" * 73)
+    for r in results:
+        print(f"{r['page']:<32} {r['kb']:>8.1f} {r['bs4_html5lib_ms']:>10.3f} "
+              f"{r['lxml_single_pass_ms']:>10.3f} {r['speedup']:>8.1f}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
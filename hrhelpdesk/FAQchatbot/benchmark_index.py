@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Recall / latency benchmark for the RAG vector index types
+Compares flat, IVF-Flat, HNSW and IVF-PQ against exact flat search
+
+Usage:
+    python benchmark_index.py                      # vectors from the built index
+    python benchmark_index.py --synthetic 50000    # clustered random vectors
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import numpy as np
+import faiss
+
+from index_versions import SnapshotError, check_snapshot, current_version
+from rag_pipeline import (EMB_DIM, FAISS_PATH, INDEX_DIR, META_PATH, FaissIndex,
+                          active_index_dir, make_index, apply_search_params)
+
+
+def load_index_vectors() -> np.ndarray:
+    """Reconstruct every stored vector from the served index
+
+    That is the CURRENT version, checked against its manifest, or the
+    index directly in INDEX_DIR when there are no versions yet.
+    """
+    index_dir = active_index_dir()
+    manifest = check_snapshot(index_dir) if current_version(INDEX_DIR) else None
+    index_path = index_dir / FAISS_PATH.name
+    idx = FaissIndex(faiss.read_index(str(index_path)).d, index_path, index_dir / META_PATH.name)
+    idx.load()
+    if manifest is not None and idx.ntotal != manifest["vectors"]:
+        raise SnapshotError(
+            f"{index_dir.name}: {idx.ntotal} vectors loaded, manifest says {manifest['vectors']}")
+    ids = np.fromiter(idx.metadata.keys(), dtype=np.int64)
+    if isinstance(idx.index, faiss.IndexIDMap2) or idx.params.get("type") != "flat":
+        return np.vstack([idx.index.reconstruct(int(i)) for i in ids])
+    return idx.index.reconstruct_n(0, idx.index.ntotal)
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Normalized gaussian-mixture vectors, roughly shaped like text embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + \
+        0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def make_queries(base: np.ndarray, n: int, noise: float = 0.03, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of stored vectors (stand-ins for paraphrased questions)"""
+    rng = np.random.default_rng(seed)
+    q = base[rng.integers(0, len(base), n)] + \
+        noise * rng.standard_normal((n, base.shape[1])).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return q.astype(np.float32)
+
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(e[:k]) - {-1}) for a, e in zip(approx, exact))
+    return hits / (k * len(exact))
+
+
+def run_config(base: np.ndarray, queries: np.ndarray, exact: np.ndarray, k: int,
+               index_type: str, sweep: List[Dict], dtype: str = "float32") -> List[Dict]:
+    """Build one index type and measure each search setting in the sweep"""
+    t0 = time.perf_counter()
+    index, params = make_index(index_type, base.shape[1], base, {"vector_dtype": dtype})
+    index.add_with_ids(base, np.arange(len(base), dtype=np.int64))
+    build_s = time.perf_counter() - t0
+    if params["type"] != index_type:
+        return []
+
+    rows = []
+    for knobs in sweep:
+        p = {**params, **knobs}
+        apply_search_params(index, p)
+        index.search(queries[:10], k)  # warm-up
+        t0 = time.perf_counter()
+        _, I = index.search(queries, k)
+        batch_s = time.perf_counter() - t0
+        # Serving does one query at a time, so measure that too
+        n_single = min(len(queries), 200)
+        t0 = time.perf_counter()
+        for i in range(n_single):
+            index.search(queries[i:i + 1], k)
+        single_s = time.perf_counter() - t0
+        rows.append({
+            "type": index_type,
+            "dtype": p["vector_dtype"],
+            "knobs": knobs,
+            f"recall@{k}": recall_at_k(I, exact, k),
+            "qps_batch": len(queries) / batch_s,
+            "latency_ms": 1000 * single_s / n_single,
+            "build_s": build_s,
+            "params": p,
+        })
+    return rows
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="use N synthetic vectors instead of the built index")
+    parser.add_argument("--dim", type=int, default=EMB_DIM)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--dtype", choices=("float32", "float16", "int8"), default="float32",
+                        help="vector storage precision for flat / IVF-Flat / HNSW")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="FAISS OpenMP threads (0 = library default)")
+    parser.add_argument("--json", type=str, default="",
+                        help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    if args.synthetic:
+        base = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        base = load_index_vectors().astype(np.float32)
+    queries = make_queries(base, args.queries)
+    k = args.k
+
+    print(f"📊 {len(base)} vectors × {base.shape[1]} dims, {len(queries)} queries, k={k}")
+    exact_index = faiss.IndexFlatIP(base.shape[1])
+    exact_index.add(base)
+    _, exact = exact_index.search(queries, k)
+
+    results = []
+    results += run_config(base, queries, exact, k, "flat", [{}], args.dtype)
+    results += run_config(base, queries, exact, k, "ivf_flat",
+                          [{"nprobe": n} for n in (1, 4, 8, 16, 32, 64)], args.dtype)
+    results += run_config(base, queries, exact, k, "hnsw",
+                          [{"ef_search": e} for e in (16, 32, 64, 128, 256)], args.dtype)
+    results += run_config(base, queries, exact, k, "ivf_pq",
+                          [{"nprobe": n} for n in (4, 16, 64)])
+
+    print(f"\n{'type':<10} {'dtype':<8} {'knobs':<20} {'recall@' + str(k):>10} {'QPS(batch)':>12} "
+          f"{'ms/query':>10} {'build s':>9}")
+    print("-" * 85)
+    for r in results:
+        knobs = ", ".join(f"{a}={b}" for a, b in r["knobs"].items()) or "-"
+        print(f"{r['type']:<10} {r['dtype']:<8} {knobs:<20} {r[f'recall@{k}']:>10.3f} "
+              f"{r['qps_batch']:>12.0f} {r['latency_ms']:>10.3f} {r['build_s']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
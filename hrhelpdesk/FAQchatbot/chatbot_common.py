@@ -0,0 +1,124 @@
+"""
+Shared pieces of the Flask (chatbot_service) and ASGI (chatbot_service_async)
+chatbot services: language handling, the low-confidence hand-off, response
+formatting and the database schema
+"""
+
+import hmac
+import json
+import logging
+
+from deep_translator import GoogleTranslator
+
+# Answers below this retrieval confidence are queued for the HR team instead
+LOW_CONFIDENCE = 0.3
+LOW_CONFIDENCE_ANSWERS = {
+    'ar': 'عذرًا، لم أجد إجابة مناسبة لسؤالك، لقد أرسلنا سؤالك لفريقنا للإجابة عليه في أقرب وقت ممكن.',
+    'en': 'Sorry, I could not find a suitable answer to your question, we sent this question to our team to answer you as soon as possible.',
+}
+
+COMMON_QUESTIONS = {
+    'ar': [
+        {"id": "working_hours", "text": "كم ساعات العمل في اليوم؟"},
+        {"id": "work_schedule", "text": "ما هي أوقات الدوام؟"},
+        {"id": "overtime", "text": "كيف يتم حساب ساعات العمل الإضافي؟"},
+        {"id": "remote_work", "text": "هل يمكنني العمل من المنزل؟"},
+        {"id": "vacation", "text": "كم لي من إجازات متبقية؟"},
+        {"id": "sick_leave", "text": "ما هي سياسة الإجازة المرضية？"},
+        {"id": "payday", "text": "متى يتم صرف الراتب؟"},
+        {"id": "department", "text": "أريد تغيير قسمي"},
+        {"id": "resignation", "text": "أريد تقديم استقالة"},
+    ],
+    'en': [
+        {"id": "working_hours", "text": "What are the working hours per day?"},
+        {"id": "work_schedule", "text": "What is the work schedule?"},
+        {"id": "overtime", "text": "How is overtime calculated?"},
+        {"id": "remote_work", "text": "Can I work from home?"},
+        {"id": "vacation", "text": "How many vacation days do I have remaining?"},
+        {"id": "sick_leave", "text": "What is the sick leave policy?"},
+        {"id": "payday", "text": "When is payday?"},
+        {"id": "department", "text": "I want to change my department"},
+        {"id": "resignation", "text": "I want to submit a resignation"},
+    ],
+}
+
+QUESTIONS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS questions (
+        question_id BIGSERIAL PRIMARY KEY,
+        question_text TEXT NOT NULL,
+        answer_text TEXT,
+        status VARCHAR(20) DEFAULT 'pending',
+        confidence_score FLOAT DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+FEEDBACK_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS feedback (
+        feed_id BIGSERIAL PRIMARY KEY,
+        question_id BIGINT NOT NULL,
+        is_good BOOLEAN NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (question_id) REFERENCES questions (question_id) ON DELETE CASCADE
+    )
+'''
+
+# Initialize translators
+translator_ar = GoogleTranslator(source='en', target='ar')
+translator_en = GoogleTranslator(source='ar', target='en')
+
+
+def detect_language(text: str) -> str:
+    """Detect if text is Arabic or English"""
+    try:
+        arabic_chars = sum(1 for char in text if '\u0600' <= char <= '\u06FF')
+        if arabic_chars > len(text) * 0.3:
+            return 'ar'
+        return 'en'
+    except Exception as e:
+        logging.error(f"Language detection error: {e}")
+        return 'en'
+
+
+def translate_text(text: str, target_lang: str = 'ar') -> str:
+    """Translate text to target language"""
+    try:
+        if target_lang == 'ar':
+            return translator_ar.translate(text)
+        else:
+            return translator_en.translate(text)
+    except Exception as e:
+        logging.error(f"Translation error: {e}")
+        return text
+
+
+def format_rag_sources(retrieved):
+    """Top retrieved chunks as returned to the client"""
+    return [{
+        "url": doc.get("url", ""),
+        "urls": doc.get("urls") or [doc.get("url", "")],
+        "section": doc.get("section", ""),
+        "score": float(score)
+    } for score, doc in (retrieved or [])[:3]]
+
+
+def finalize_answer(rag_answer, confidence, user_language):
+    """(answer shown to the user, status): translated, or the hand-off message"""
+    if confidence < LOW_CONFIDENCE:
+        return LOW_CONFIDENCE_ANSWERS['ar' if user_language == 'ar' else 'en'], 'pending'
+    if user_language == 'en':
+        rag_answer = translate_text(rag_answer, 'en')
+    return rag_answer, 'answered'
+
+
+def is_admin(admin_token, given_token, remote_addr):
+    """Whether a request may use the admin endpoints: it must carry admin_token
+    in X-Admin-Token, or come from localhost when no token is configured"""
+    if admin_token:
+        return hmac.compare_digest(given_token or '', admin_token)
+    return remote_addr in ('127.0.0.1', '::1')
+
+
+def sse_event(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -15,7 +15,7 @@ from deep_translator import GoogleTranslator
 from pyarabic.araby import strip_tashkeel
 
 # Import our RAG pipeline
-from rag_pipeline import answer_question, get_rag_pipeline
+from rag_service import answer_question, get_rag_pipeline
 
 # Load environment variables
 load_dotenv()
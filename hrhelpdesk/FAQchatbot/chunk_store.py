@@ -0,0 +1,189 @@
+"""
+Memory-mapped columnar store for chunk metadata
+Replaces the pickled metadata list so workers load it in constant time and
+share its pages through the OS page cache instead of each building dicts
+
+Layout of a store directory:
+    chunks.json    field names and row count
+    faiss_ids.npy  int64, sorted; row r holds the chunk stored under that FAISS id
+    <int>.npy      one int64 column per integer field
+    offsets.npy    int64 (rows, n_str_fields + 1) byte offsets into strings.bin;
+                   the strings of a row are contiguous, field f spans
+                   offsets[r, f]:offsets[r, f + 1]
+    strings.bin    every string field, utf-8 encoded; list fields (urls) are
+                   stored newline-joined
+    vectors.npy    optional float32 (rows, dim) full-precision embeddings, kept
+                   when the FAISS index stores reduced-precision vectors
+"""
+
+import os
+import json
+import shutil
+import pathlib
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+STR_FIELDS = ("id", "url", "section", "text", "urls")
+INT_FIELDS = ("chunk_id",)
+# String fields that hold a list of single-line strings
+LIST_FIELDS = ("urls",)
+STORE_FORMAT = 1
+
+
+class ChunkStore(Mapping):
+    """Read-only FAISS id -> chunk metadata mapping backed by mmapped columns"""
+
+    def __init__(self, store_dir: pathlib.Path):
+        self.store_dir = pathlib.Path(store_dir)
+        with open(self.store_dir / "chunks.json", "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != STORE_FORMAT:
+            raise RuntimeError(f"Unsupported chunk store format in {self.store_dir}")
+        self.str_fields: List[str] = header["str_fields"]
+        self.int_fields: List[str] = header["int_fields"]
+        self.count: int = header["count"]
+
+        self.faiss_ids = np.load(self.store_dir / "faiss_ids.npy", mmap_mode="r")
+        self.offsets = np.load(self.store_dir / "offsets.npy", mmap_mode="r")
+        self.int_columns = {
+            name: np.load(self.store_dir / f"{name}.npy", mmap_mode="r")
+            for name in self.int_fields
+        }
+        blob_path = self.store_dir / "strings.bin"
+        # np.memmap refuses zero-length files
+        if blob_path.stat().st_size:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+        vectors_path = self.store_dir / "vectors.npy"
+        self.vectors = np.load(vectors_path, mmap_mode="r") if vectors_path.exists() else None
+
+    @staticmethod
+    def exists(store_dir: pathlib.Path) -> bool:
+        return (pathlib.Path(store_dir) / "chunks.json").exists()
+
+    def _row_of(self, fid: int) -> int:
+        row = int(np.searchsorted(self.faiss_ids, fid))
+        if row < self.count and int(self.faiss_ids[row]) == fid:
+            return row
+        return -1
+
+    def vector(self, fid: int) -> Optional[np.ndarray]:
+        """Full-precision vector stored for a FAISS id, if the store has them"""
+        if self.vectors is None:
+            return None
+        row = self._row_of(int(fid))
+        return self.vectors[row] if row >= 0 else None
+
+    def row(self, row: int) -> Dict:
+        """Decode one row into the metadata dict the pipeline works with"""
+        bounds = self.offsets[row]
+        raw = bytes(self.blob[int(bounds[0]):int(bounds[-1])])
+        base = int(bounds[0])
+        out = {}
+        for f, name in enumerate(self.str_fields):
+            value = raw[int(bounds[f]) - base:int(bounds[f + 1]) - base].decode("utf-8")
+            out[name] = value.split("\n") if name in LIST_FIELDS else value
+        for name, col in self.int_columns.items():
+            out[name] = int(col[row])
+        return out
+
+    def __getitem__(self, fid: int) -> Dict:
+        row = self._row_of(int(fid))
+        if row < 0:
+            raise KeyError(fid)
+        return self.row(row)
+
+    def __contains__(self, fid) -> bool:
+        return self._row_of(int(fid)) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in self.faiss_ids)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def to_dict(self) -> Dict[int, Dict]:
+        """Materialize every row (only needed when the index is modified)"""
+        return {int(fid): self.row(r) for r, fid in enumerate(self.faiss_ids)}
+
+
+def write_chunk_store(store_dir: pathlib.Path, metadata: Mapping,
+                      vector_of: Callable[[int], np.ndarray] = None, dim: int = 0):
+    """Write metadata ({faiss_id: chunk dict}) as a new store, replacing any old one
+
+    With vector_of, the full-precision vector of every chunk is written too.
+    """
+    store_dir = pathlib.Path(store_dir)
+    tmp_dir = prepare_tmp_dir(store_dir)
+
+    fids = np.array(sorted(int(k) for k in metadata.keys()), dtype=np.int64)
+    n = len(fids)
+    offsets = np.zeros((n, len(STR_FIELDS) + 1), dtype=np.int64)
+    int_columns = {name: np.zeros(n, dtype=np.int64) for name in INT_FIELDS}
+
+    pos = 0
+    with open(tmp_dir / "strings.bin", "wb") as blob:
+        for r, fid in enumerate(fids.tolist()):
+            m = metadata[fid]
+            for f, name in enumerate(STR_FIELDS):
+                offsets[r, f] = pos
+                value = m.get(name, "")
+                if name in LIST_FIELDS:
+                    value = "\n".join(value or [m.get("url", "")])
+                data = str(value).encode("utf-8")
+                blob.write(data)
+                pos += len(data)
+            offsets[r, -1] = pos
+            for name in INT_FIELDS:
+                int_columns[name][r] = int(m.get(name, 0))
+
+    if vector_of is not None:
+        # Written row by row so the whole matrix never has to sit in RAM
+        vectors = np.lib.format.open_memmap(
+            tmp_dir / "vectors.npy", mode="w+", dtype=np.float32, shape=(n, dim))
+        for r, fid in enumerate(fids.tolist()):
+            vectors[r] = vector_of(fid)
+        vectors.flush()
+        del vectors
+
+    np.save(tmp_dir / "faiss_ids.npy", fids)
+    np.save(tmp_dir / "offsets.npy", offsets)
+    for name, col in int_columns.items():
+        np.save(tmp_dir / f"{name}.npy", col)
+    with open(tmp_dir / "chunks.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "format": STORE_FORMAT,
+            "count": n,
+            "str_fields": list(STR_FIELDS),
+            "int_fields": list(INT_FIELDS),
+        }, f, indent=1)
+
+    swap_in_dir(tmp_dir, store_dir)
+
+
+def prepare_tmp_dir(target_dir: pathlib.Path) -> pathlib.Path:
+    """Fresh sibling directory to write a replacement for target_dir into"""
+    tmp_dir = target_dir.with_name(target_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    return tmp_dir
+
+
+def swap_in_dir(tmp_dir: pathlib.Path, target_dir: pathlib.Path):
+    """Replace target_dir with tmp_dir by rename
+
+    Files of the old directory are unlinked, not truncated, so processes that
+    still have them memory-mapped keep reading valid data.
+    """
+    old_dir = target_dir.with_name(target_dir.name + ".old")
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    if target_dir.exists():
+        os.rename(target_dir, old_dir)
+    os.rename(tmp_dir, target_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
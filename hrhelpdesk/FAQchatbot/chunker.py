@@ -0,0 +1,214 @@
+"""
+Sentence- and token-aware chunking for the RAG pipeline
+Text is cut at sentence boundaries (Arabic ؟ ؛ ، as well as . ! ?), whole
+sentences are packed up to a token budget and consecutive chunks overlap by
+whole sentences instead of by raw characters
+
+Policies:
+    sentence  split on sentence ends and line breaks; a sentence longer than
+              the budget is split further on clauses, then on words
+    clause    split on clause punctuation (، , ؛ ; :) as well
+    chars     the original fixed-size character windows
+"""
+
+import re
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or the BPE file can't be downloaded
+    _ENCODING = None
+
+CHUNK_POLICIES = ("sentence", "clause", "chars")
+
+# Boundary = end of the punctuation run plus any following whitespace
+_SENTENCE_END = re.compile(r"(?:[.!?؟؛…]+[\"'”»)\]]*(?=\s|$)|\n)\s*")
+_CLAUSE_END = re.compile(r"(?:[.!?؟؛…،,;:]+[\"'”»)\]]*(?=\s|$)|\n)\s*")
+_WORD_END = re.compile(r"\s+")
+_POLICY_SPLITTERS = {
+    "sentence": (_SENTENCE_END, _CLAUSE_END, _WORD_END),
+    "clause": (_CLAUSE_END, _WORD_END),
+}
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", flags=re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the OpenAI cl100k encoding, or an estimate without tiktoken
+
+    The estimate counts punctuation as one token and words as one token per
+    ~4 Latin or ~2.5 Arabic characters, which is close to cl100k for both.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    n = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isascii():
+            n += max(1, math.ceil(len(piece) / 4))
+        else:
+            n += max(1, math.ceil(len(piece) / 2.5))
+    return n
+
+
+def boundary_offsets(text: str, splitter: re.Pattern, start: int = 0, end: int = None) -> List[int]:
+    """Offsets where the segments of text[start:end] end (the last one is `end`)"""
+    end = len(text) if end is None else end
+    cuts = [m.end() for m in splitter.finditer(text, start, end) if start < m.end() < end]
+    cuts.append(end)
+    return cuts
+
+
+def _segments(text: str, splitters: Tuple[re.Pattern, ...], max_tokens: int,
+              start: int = 0, end: int = None, level: int = 0) -> List[Tuple[int, int, int]]:
+    """(start, end, tokens) spans of text, each within max_tokens where possible
+
+    Spans come from the coarsest splitter; only spans over budget are cut
+    again with the next finer one.
+    """
+    end = len(text) if end is None else end
+    out: List[Tuple[int, int, int]] = []
+    prev = start
+    for cut in boundary_offsets(text, splitters[level], start, end):
+        tokens = count_tokens(text[prev:cut])
+        if tokens > max_tokens and level + 1 < len(splitters):
+            out.extend(_segments(text, splitters, max_tokens, prev, cut, level + 1))
+        else:
+            out.append((prev, cut, tokens))
+        prev = cut
+    return out
+
+
+def pack_segments(text: str, segments: List[Tuple[int, int, int]], max_tokens: int,
+                  overlap_tokens: int) -> List[str]:
+    """Greedily pack consecutive segments into chunks of at most max_tokens
+
+    Each chunk after the first starts with the trailing segments of the
+    previous one, up to overlap_tokens. Linear in the number of segments:
+    both window ends only move forward.
+    """
+    n = len(segments)
+    if not n:
+        return []
+    tokens = np.fromiter((t for _, _, t in segments), dtype=np.int64, count=n)
+    prefix = np.concatenate(([0], np.cumsum(tokens)))
+
+    chunks = []
+    start = 0
+    while start < n:
+        # Largest end with sum(tokens[start:end]) <= max_tokens, at least one segment
+        end = int(np.searchsorted(prefix, prefix[start] + max_tokens, side="right")) - 1
+        end = max(end, start + 1)
+        chunk = text[segments[start][0]:segments[end - 1][1]].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= n:
+            break
+        # Step back over whole segments that fit in the overlap budget, but
+        # always make progress
+        nxt = end
+        while nxt - 1 > start and prefix[end] - prefix[nxt - 1] <= overlap_tokens:
+            nxt -= 1
+        start = nxt
+    return chunks
+
+
+def chunk_chars(text: str, max_len: int, overlap: int) -> List[str]:
+    """Fixed-size character windows (the original chunker)"""
+    text = text.strip()
+    if len(text) <= max_len:
+        return [text]
+    out, start = [], 0
+    while start < len(text):
+        end = min(start + max_len, len(text))
+        out.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(0, end - overlap)
+    return out
+
+
+def chunk_text(text: str, policy: str = "sentence", max_tokens: int = 200,
+               overlap_tokens: int = 40, max_chars: int = 350, overlap_chars: int = 60) -> List[str]:
+    """Split text into overlapping chunks according to the policy"""
+    if policy == "chars":
+        return chunk_chars(text, max_chars, overlap_chars)
+    if policy not in _POLICY_SPLITTERS:
+        raise ValueError(f"Unknown chunk policy {policy!r}, expected one of {CHUNK_POLICIES}")
+    text = text.strip()
+    if not text:
+        return [text]
+    segments = _segments(text, _POLICY_SPLITTERS[policy], max_tokens)
+    return pack_segments(text, segments, max_tokens, overlap_tokens)
+
+
+def merge_overlapping(first: str, second: str, min_overlap: int = 16) -> str:
+    """Join consecutive chunks, keeping the text they share only once"""
+    if not second:
+        return first
+    # The longest suffix of first that second starts with is the overlap
+    i = first.find(second[0], max(0, len(first) - len(second)))
+    while 0 <= i <= len(first) - min_overlap:
+        if second.startswith(first[i:]):
+            return first + second[len(first) - i:]
+        i = first.find(second[0], i + 1)
+    return f"{first}\n{second}"
+
+
+class ChunkStats:
+    """Running chunk-count / chunk-size summary for an ingest"""
+
+    BUCKETS = (32, 64, 128, 192, 256, 384, 512)
+
+    def __init__(self):
+        self.per_source: Dict[str, int] = {}
+        self.tokens: List[int] = []
+        self.chars: List[int] = []
+
+    def add(self, url: str, chunks: List[str]):
+        self.per_source[url] = self.per_source.get(url, 0) + len(chunks)
+        for c in chunks:
+            self.tokens.append(count_tokens(c))
+            self.chars.append(len(c))
+
+    def report(self) -> Dict:
+        if not self.tokens:
+            return {"chunks": 0, "sources": len(self.per_source)}
+        tokens = np.asarray(self.tokens)
+        edges = [0, *self.BUCKETS, max(int(tokens.max()), self.BUCKETS[-1]) + 1]
+        hist, _ = np.histogram(tokens, bins=edges)
+        counts = np.asarray(list(self.per_source.values()))
+        return {
+            "chunks": int(len(tokens)),
+            "sources": len(self.per_source),
+            "chunks_per_source": {"min": int(counts.min()), "mean": float(counts.mean()),
+                                  "max": int(counts.max())},
+            "tokens": {"min": int(tokens.min()), "mean": float(tokens.mean()),
+                       "p50": float(np.percentile(tokens, 50)),
+                       "p95": float(np.percentile(tokens, 95)), "max": int(tokens.max())},
+            "chars_mean": float(np.mean(self.chars)),
+            "histogram": {(f"{lo}-{hi - 1}" if hi <= self.BUCKETS[-1] else f"{lo}+"): int(c)
+                          for lo, hi, c in zip(edges[:-1], edges[1:], hist)},
+            "exact_tokens": _ENCODING is not None,
+        }
+
+    def format(self) -> str:
+        """Multi-line text summary for the ingest log"""
+        r = self.report()
+        if not r["chunks"]:
+            return "Chunks: none"
+        t, cps = r["tokens"], r["chunks_per_source"]
+        lines = [
+            f"Chunks: {r['chunks']} from {r['sources']} sources "
+            f"(per source min {cps['min']} / mean {cps['mean']:.1f} / max {cps['max']})",
+            f"Chunk tokens{'' if r['exact_tokens'] else ' (estimated)'}: min {t['min']} / "
+            f"p50 {t['p50']:.0f} / mean {t['mean']:.1f} / p95 {t['p95']:.0f} / max {t['max']}",
+        ]
+        peak = max(r["histogram"].values())
+        for bucket, count in r["histogram"].items():
+            bar = "#" * (round(30 * count / peak) if peak else 0)
+            lines.append(f"  {bucket:>9} | {count:>6} {bar}")
+        return "\n".join(lines)
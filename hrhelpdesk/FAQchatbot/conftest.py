@@ -0,0 +1,85 @@
+"""
+Shared pytest setup for the RAG pipeline tests
+Every test runs offline: the index root is a throwaway directory (set
+before rag_pipeline is imported) and embeddings come from FakeEmbedder
+"""
+
+import os
+import hashlib
+import tempfile
+from typing import List
+
+import numpy as np
+import pytest
+
+# rag_pipeline reads RAG_INDEX_DIR at import; never touch the real index
+os.environ["RAG_INDEX_DIR"] = tempfile.mkdtemp(prefix="rag-test-index-")
+
+import rag_pipeline  # noqa: E402
+import rag_service  # noqa: E402
+from rag_pipeline import BaseEmbedder  # noqa: E402
+
+# Scripts that call the live OpenAI API (run them by hand)
+collect_ignore = ["test_env.py", "test_rag_openai.py", "test_rag_simple.py"]
+
+
+def fake_vector(text: str, dim: int) -> np.ndarray:
+    """Deterministic unit vector for a text"""
+    seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class FakeEmbedder(BaseEmbedder):
+    """Offline embedder; `calls` records the texts of every backend call"""
+
+    backend_id = "fake:test"
+
+    def __init__(self, cache=None, dim: int = 32):
+        super().__init__(cache)
+        self.dim = dim
+        self.calls: List[List[str]] = []
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([fake_vector(t, self.dim) for t in texts])
+
+    @property
+    def embedded(self) -> List[str]:
+        """Every text sent to the backend, in order"""
+        return [t for call in self.calls for t in call]
+
+
+CORPUS = {
+    "leave.md": "# Annual leave\nEmployees accrue two and a half days of annual leave per month.\n\n"
+                "# Sick leave\nSick leave requires a medical certificate after the second day.\n",
+    "hours.md": "# Working hours\nThe working hours regulations set eight hours a day, five days a week.\n",
+}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """rag_service on its own index root, serving a small corpus with FakeEmbedder"""
+    root = tmp_path / "index"
+    corpus = tmp_path / "corpus"
+    root.mkdir()
+    corpus.mkdir()
+    for name, text in CORPUS.items():
+        (corpus / name).write_text(text, encoding="utf-8")
+
+    for module in (rag_pipeline, rag_service):
+        monkeypatch.setattr(module, "INDEX_DIR", root)
+        monkeypatch.setattr(module, "INGEST_CHECKPOINT_DIR", root / "ingest_checkpoint")
+    monkeypatch.setattr(rag_pipeline, "EMB_CACHE_PATH", root / "embedding_cache.sqlite")
+    monkeypatch.setattr(rag_pipeline, "CORPUS_DIR", str(corpus))
+    monkeypatch.setattr(rag_pipeline, "WEB_SOURCES", False)
+    monkeypatch.setattr(rag_pipeline, "CORPUS_WORKERS", 1)
+    monkeypatch.setattr(rag_pipeline, "make_embedder", lambda cache=None: FakeEmbedder(cache))
+    monkeypatch.setattr(rag_pipeline, "AnswerGenerator", lambda: None)
+    monkeypatch.setattr(rag_service, "_rag_pipeline", None)
+    monkeypatch.setattr(rag_service, "_rebuild_thread", None)
+    monkeypatch.setattr(rag_service, "_rebuild_status", {"state": "idle"})
+    monkeypatch.setattr(rag_service, "_retired", [])
+    return rag_service
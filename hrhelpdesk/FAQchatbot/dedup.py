@@ -0,0 +1,138 @@
+"""
+Near-duplicate chunk detection with MinHash + LSH
+Chunks are compared on Arabic-normalized word shingles, so the same clause
+quoted by two sources (or repeated within one) is indexed once and keeps
+every URL it appeared under
+
+Signatures are computed with vectorized universal hashing; LSH banding
+picks candidate pairs and the estimated Jaccard similarity of the full
+signatures decides.
+"""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lexical_index import tokenize
+
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _lsh_shape(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm whose S-curve midpoint is closest to threshold"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1.0 / bands) ** (1.0 / rows)
+        err = abs(midpoint - threshold)
+        if best is None or err < best[0]:
+            best = (err, bands, rows)
+    return best[1], best[2]
+
+
+class NearDupIndex:
+    """Incremental MinHash/LSH index: add() returns the chunk a new one duplicates"""
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash family: odd multiplier, random offset, mod 2**64
+        self._a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+        self.bands, self.rows = _lsh_shape(num_perm, threshold)
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the text's word shingles"""
+        tokens = tokenize(text)
+        if not tokens:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        n = max(1, len(tokens) - self.shingle + 1)
+        shingles = {" ".join(tokens[i:i + self.shingle]) for i in range(n)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod 2**64 (uint64 wraps), high 32 bits
+        perm = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return perm.min(axis=1)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, text: str) -> Tuple[Optional[str], float, np.ndarray]:
+        """(most similar indexed key at or above threshold or None, similarity, signature)"""
+        sig = self.signature(text)
+        if (sig == _MAX_HASH).all():  # no words, so nothing to be a duplicate of
+            return None, 0.0, sig
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            candidates.update(band.get(key, ()))
+        best, best_sim = None, 0.0
+        for key in candidates:
+            sim = float(np.mean(self._signatures[key] == sig))
+            if sim > best_sim:
+                best, best_sim = key, sim
+        if best_sim < self.threshold:
+            return None, best_sim, sig
+        return best, best_sim, sig
+
+    def insert(self, key: str, sig: np.ndarray):
+        self._signatures[key] = sig
+        for band, bkey in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(bkey, []).append(key)
+
+    def add(self, key: str, text: str) -> Tuple[Optional[str], float]:
+        """Index text under key unless it duplicates an indexed chunk; returns (that chunk, similarity)"""
+        dup_of, sim, sig = self.query(text)
+        if dup_of is None:
+            self.insert(key, sig)
+        return dup_of, sim
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+class DedupReport:
+    """What was merged into what during one ingest"""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.checked = 0
+        self.merges: List[Dict] = []
+
+    def record(self, kept_id: str, kept_url: str, dup: Dict, similarity: float) -> Dict:
+        merge = {
+            "kept_id": kept_id,
+            "dropped_id": dup["id"],
+            "kept_url": kept_url,
+            "dropped_url": dup["url"],
+            "similarity": round(similarity, 3),
+            "dropped_text": dup["text"][:160],
+        }
+        self.merges.append(merge)
+        return merge
+
+    def summary(self) -> Dict:
+        cross = sum(1 for m in self.merges if m["kept_url"] != m["dropped_url"])
+        return {
+            "threshold": self.threshold,
+            "chunks_checked": self.checked,
+            "merged": len(self.merges),
+            "merged_across_sources": cross,
+            "merged_ratio": len(self.merges) / self.checked if self.checked else 0.0,
+        }
+
+    def format(self, examples: int = 3) -> str:
+        s = self.summary()
+        lines = [f"Near-duplicates: {s['merged']} of {s['chunks_checked']} chunks merged "
+                 f"({s['merged_ratio']:.0%}, {s['merged_across_sources']} across sources, "
+                 f"threshold {s['threshold']})"]
+        for m in self.merges[:examples]:
+            lines.append(f"  {m['similarity']:.2f} {m['dropped_id']} → {m['kept_id']}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict:
+        return {**self.summary(), "merges": self.merges}
@@ -0,0 +1,199 @@
+"""
+Concurrent, conditional HTML fetching for the RAG sources
+Every source is downloaded in parallel over one pooled session; raw HTML is
+kept on disk with its ETag / Last-Modified so an unchanged page costs a 304,
+and a copy younger than max_age seconds is served without any request
+
+Layout of the cache directory:
+    <sha1(url)>.html  raw page body as last downloaded
+    <sha1(url)>.json  {"url", "etag", "last_modified", "encoding", "fetched_at"}
+"""
+
+import os
+import json
+import time
+import threading
+import hashlib
+import logging
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import backoff_delay
+
+USER_AGENT = "RAG/1.0"
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class HtmlFetcher:
+    """Pooled, cache-validating HTTP fetcher with exponential backoff"""
+
+    def __init__(self, cache_dir: Optional[pathlib.Path], workers: int = 8,
+                 retries: int = 3, timeout: int = 30, backoff_base: float = 1.0,
+                 backoff_max: float = 20.0, max_age: float = 0):
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.stats = {"downloaded": 0, "not_modified": 0, "fresh": 0, "stale": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self.last_run_stats: Dict[str, int] = {}
+
+    def _count(self, what: str):
+        with self._stats_lock:
+            self.stats[what] += 1
+
+    def _cache_paths(self, url: str):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.html", self.cache_dir / f"{key}.json"
+
+    def _load_cached(self, url: str) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+        html_path, meta_path = self._cache_paths(url)
+        if not (html_path.exists() and meta_path.exists()):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["html"] = html_path.read_bytes().decode(meta.get("encoding") or "utf-8", "replace")
+            return meta
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable HTML cache entry for {url}: {e}")
+            return None
+
+    @staticmethod
+    def _write(path: pathlib.Path, data: bytes):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _store_cached(self, url: str, resp: requests.Response, html: str):
+        if not self.cache_dir:
+            return
+        html_path, meta_path = self._cache_paths(url)
+        meta = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "encoding": "utf-8",
+            "fetched_at": time.time(),
+        }
+        # Write body first and swap both in by rename, so a crash never pairs
+        # a new validator with an old body
+        self._write(html_path, html.encode("utf-8"))
+        self._write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _touch_cached(self, url: str, cached: Dict):
+        """Restart the max_age clock of a copy the server confirmed (304)"""
+        meta = {k: v for k, v in cached.items() if k != "html"}
+        meta["fetched_at"] = time.time()
+        try:
+            self._write(self._cache_paths(url)[1], json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            logging.warning(f"Could not update HTML cache entry for {url}: {e}")
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Exponential backoff with full jitter, honouring Retry-After seconds"""
+        seconds = float(retry_after) if retry_after and retry_after.isdigit() else None
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max, seconds)
+
+    def fetch(self, url: str, retries: Optional[int] = None,
+              timeout: Optional[float] = None) -> str:
+        """HTML of a URL, revalidating the cached copy when there is one
+
+        retries / timeout override the fetcher's settings for this call.
+        """
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+        cached = self._load_cached(url)
+        if cached and self.max_age > 0 and time.time() - cached.get("fetched_at", 0) < self.max_age:
+            self._count("fresh")
+            return cached["html"]
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        last_error: Exception = None
+        for attempt in range(retries):
+            try:
+                r = self.session.get(url, timeout=timeout, headers=headers)
+                if r.status_code == 304 and cached:
+                    if self.max_age > 0:
+                        self._touch_cached(url, cached)
+                    self._count("not_modified")
+                    return cached["html"]
+                if r.status_code in RETRY_STATUSES:
+                    raise requests.HTTPError(f"{r.status_code} {r.reason}", response=r)
+                r.raise_for_status()
+                # requests falls back to ISO-8859-1 for text/html without a
+                # charset, which garbles Arabic pages
+                if not r.encoding or r.encoding.lower() == "iso-8859-1":
+                    r.encoding = r.apparent_encoding
+                html = r.text
+                self._store_cached(url, r, html)
+                self._count("downloaded")
+                return html
+            except requests.RequestException as e:
+                last_error = e
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and status not in RETRY_STATUSES:
+                    break
+                if attempt + 1 < retries:
+                    retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+                    delay = self._backoff(attempt, retry_after)
+                    logging.warning(f"Fetch failed ({attempt+1}/{retries}) {url}: {e}—retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+        if cached:
+            self._count("stale")
+            logging.warning(f"Fetch failed for {url} ({last_error}), using cached copy")
+            return cached["html"]
+        self._count("failed")
+        raise RuntimeError(f"Could not fetch {url}: {last_error}")
+
+    def fetch_all(self, urls: List[str]) -> Dict[str, Union[str, Exception]]:
+        """Fetch every URL concurrently; failures are returned, not raised"""
+        def one(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                return e
+
+        started = time.perf_counter()
+        before = self.stats_snapshot()
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(urls)))) as pool:
+            results = dict(zip(urls, pool.map(one, urls)))
+        # self.stats is cumulative over the process; report this run only
+        run = {k: v - before[k] for k, v in self.stats_snapshot().items()}
+        self.last_run_stats = run
+        logging.info(
+            f"Fetched {len(urls)} sources in {time.perf_counter() - started:.2f}s "
+            f"({run['downloaded']} downloaded, {run['not_modified']} not modified, "
+            f"{run['fresh']} fresh, {run['stale']} stale, {run['failed']} failed)")
+        return results
+
+    def stats_snapshot(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for k in self.stats:
+                self.stats[k] = 0
@@ -0,0 +1,181 @@
+"""
+Versioned, immutable index snapshots
+Every build writes a complete index into its own directory under
+<index root>/versions and finishes it with manifest.json; the CURRENT file
+names the version being served. Switching versions (a new build or a
+rollback) is one atomic rename of CURRENT, so a reader never sees a
+half-written index, and a published version is never modified again.
+
+Layout of the index root:
+    CURRENT                 name of the served version
+    versions/<name>/        faiss.index, index_params.json, chunks/, bm25/, ...
+                            manifest.json (build settings, counts, and size,
+                            mtime and SHA-256 of every file)
+    embedding_cache.sqlite  shared by every version (as are html_cache/ and
+                            ingest_checkpoint/)
+
+An index root from before snapshots (faiss.index directly inside it, no
+CURRENT) is still served as the "legacy" version, without a manifest.
+
+Validating a snapshot at startup only stats its files against the manifest;
+verify_checksums() re-hashes them.
+"""
+
+import os
+import json
+import time
+import hashlib
+import uuid
+import shutil
+import pathlib
+from typing import Dict, Iterable, List, Optional
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_FORMAT = 1
+LEGACY_VERSION = "legacy"
+# Everything that belongs to one index (as opposed to the shared caches)
+INDEX_FILES = ("faiss.index", "index_params.json", "chunks", "bm25", "metadata.pkl",
+               "sources.json", "dedup_report.json")
+
+
+def new_version_name() -> str:
+    """Unique version name that sorts by creation time (to the millisecond)"""
+    now = time.time()
+    return (f"{time.strftime('%Y%m%d%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+            f"-{uuid.uuid4().hex[:8]}")
+
+
+def version_dir(root: pathlib.Path, name: str) -> pathlib.Path:
+    return pathlib.Path(root) / VERSIONS_DIR / name
+
+
+def list_versions(root: pathlib.Path) -> List[str]:
+    """Version names on disk, oldest first"""
+    base = pathlib.Path(root) / VERSIONS_DIR
+    if not base.is_dir():
+        return []
+    return sorted(p.name for p in base.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def current_version(root: pathlib.Path) -> Optional[str]:
+    """The served version, or None for an index root without versions"""
+    try:
+        name = (pathlib.Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name if name and version_dir(root, name).is_dir() else None
+
+
+def set_current_version(root: pathlib.Path, name: str):
+    """Atomically point CURRENT at a version"""
+    if not version_dir(root, name).is_dir():
+        raise FileNotFoundError(f"No index version {name!r} under {root}")
+    tmp = pathlib.Path(root) / f".{CURRENT_FILE}.{uuid.uuid4().hex[:8]}"
+    tmp.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp, pathlib.Path(root) / CURRENT_FILE)
+
+
+def copy_index_files(src: pathlib.Path, dst: pathlib.Path):
+    """Seed dst with the index in src (for an incremental rebuild)"""
+    dst.mkdir(parents=True, exist_ok=True)
+    for name in INDEX_FILES:
+        path = pathlib.Path(src) / name
+        if path.is_dir():
+            shutil.copytree(path, dst / name)
+        elif path.exists():
+            shutil.copy2(path, dst / name)
+
+
+def prune_versions(root: pathlib.Path, keep: int, protect: Iterable[str] = ()) -> List[str]:
+    """Delete all but the newest `keep` versions, never CURRENT or `protect`"""
+    spare = set(protect) | {current_version(root)}
+    names = list_versions(root)
+    removed = []
+    for name in names[:max(0, len(names) - keep)]:
+        if name in spare:
+            continue
+        shutil.rmtree(version_dir(root, name), ignore_errors=True)
+        removed.append(name)
+    return removed
+
+
+class SnapshotError(RuntimeError):
+    """An index snapshot is incomplete, altered or built for another setup"""
+
+
+def _sha256(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _snapshot_files(directory: pathlib.Path) -> List[pathlib.Path]:
+    return sorted(p for p in directory.rglob("*")
+                  if p.is_file() and p.name != MANIFEST_FILE and not p.name.endswith(".tmp"))
+
+
+def write_manifest(directory: pathlib.Path, info: Dict) -> Dict:
+    """Seal a finished build: info plus size, mtime and SHA-256 of every file"""
+    directory = pathlib.Path(directory)
+    files = {}
+    for path in _snapshot_files(directory):
+        st = path.stat()
+        files[path.relative_to(directory).as_posix()] = {
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(path)}
+    manifest = {"format": MANIFEST_FORMAT, "version": directory.name,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **info, "files": files}
+    tmp = directory / f".{MANIFEST_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, directory / MANIFEST_FILE)
+    return manifest
+
+
+def read_manifest(directory: pathlib.Path) -> Dict:
+    try:
+        with open(pathlib.Path(directory) / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"{pathlib.Path(directory).name}: no manifest (unfinished build?)")
+    except ValueError as e:
+        raise SnapshotError(f"{pathlib.Path(directory).name}: unreadable manifest ({e})")
+
+
+def check_snapshot(directory: pathlib.Path, expected: Dict = None) -> Dict:
+    """Cheap validation: manifest fields and file sizes / mtimes; returns the manifest
+
+    expected maps manifest keys to the values this process needs (e.g. the
+    embedding backend and dimension). Raises SnapshotError on any mismatch.
+    """
+    directory = pathlib.Path(directory)
+    manifest = read_manifest(directory)
+    name = directory.name
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise SnapshotError(f"{name}: manifest format {manifest.get('format')} is not supported")
+    for key, want in (expected or {}).items():
+        if manifest.get(key) != want:
+            raise SnapshotError(f"{name}: built with {key}={manifest.get(key)!r}, need {want!r}")
+    for rel, meta in manifest["files"].items():
+        try:
+            st = (directory / rel).stat()
+        except FileNotFoundError:
+            raise SnapshotError(f"{name}: {rel} is missing")
+        if st.st_size != meta["size"] or st.st_mtime_ns != meta["mtime_ns"]:
+            raise SnapshotError(f"{name}: {rel} changed since the snapshot was written")
+    return manifest
+
+
+def verify_checksums(directory: pathlib.Path) -> List[str]:
+    """Files whose SHA-256 no longer matches the manifest (reads every byte)"""
+    directory = pathlib.Path(directory)
+    manifest = read_manifest(directory)
+    bad = []
+    for rel, meta in manifest["files"].items():
+        path = directory / rel
+        if not path.is_file() or _sha256(path) != meta["sha256"]:
+            bad.append(rel)
+    return bad
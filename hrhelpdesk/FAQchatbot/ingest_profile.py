@@ -0,0 +1,205 @@
+"""
+Per-stage resource profile of an ingest
+Records wall time, CPU time, item counts, throughput and memory for every
+ingest stage, so a slow rebuild shows whether the time went to fetching,
+readability, text extraction, chunking, embedding or writing the index
+
+Streaming stages (StagePipeline) overlap, so for them:
+    wall_s      time spent producing items, excluding waits on the stage
+                before it and on the stage after it
+    cpu_s       CPU time of the stage's own thread (work handed to thread or
+                process pools, e.g. downloads and corpus parsing, is not in it)
+Serial phases (adding to the index, training, saving, ...) measure CPU time
+of the whole process, including FAISS / BLAS worker threads.
+
+Memory: rss_mb is the process high-water mark when the stage finished.
+With trace_memory (the profile-only mode, where stages run one after another)
+py_peak_mb is the peak of Python/numpy allocations during the stage itself.
+"""
+
+import sys
+import time
+import json
+import pathlib
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """Process resident-set high-water mark (0 where unavailable)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageStats:
+    """Counters for one stage"""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind  # "stream" | "phase"
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items_in = 0
+        self.items_out = 0
+        self.started = None
+        self.finished = None
+        self.rss_mb = 0.0
+        self.py_peak_mb = None
+
+    def to_dict(self) -> Dict:
+        out = {
+            "stage": self.name,
+            "kind": self.kind,
+            "wall_s": round(self.wall, 4),
+            "cpu_s": round(self.cpu, 4),
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "items_per_s": round(self.items_out / self.wall, 2) if self.wall > 0 and self.items_out else None,
+            "rss_mb": round(self.rss_mb, 1),
+        }
+        if self.started is not None and self.finished is not None:
+            out["span_s"] = round(self.finished - self.started, 4)
+        if self.py_peak_mb is not None:
+            out["py_peak_mb"] = round(self.py_peak_mb, 1)
+        return out
+
+
+class IngestProfiler:
+    """Collects StageStats for one ingest and writes the report"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, StageStats] = {}
+        self.extra: Dict = {}
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._own_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+
+    def _stats(self, name: str, kind: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, kind)
+        return self.stages[name]
+
+    def _start_memory(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+        return None
+
+    def _end_memory(self, st: StageStats, base):
+        st.rss_mb = peak_rss_mb()
+        if base is not None:
+            peak = (tracemalloc.get_traced_memory()[1] - base) / (1024 * 1024)
+            st.py_peak_mb = max(st.py_peak_mb or 0.0, peak)
+
+    @contextmanager
+    def phase(self, name: str, items: int = 0):
+        """Time a serial step; repeated phases of one name accumulate"""
+        st = self._stats(name, "phase")
+        base = self._start_memory()
+        t0, c0 = time.perf_counter(), time.process_time()
+        if st.started is None:
+            st.started = t0 - self._t0
+        try:
+            yield st
+        finally:
+            st.wall += time.perf_counter() - t0
+            st.cpu += time.process_time() - c0
+            st.items_out += items
+            st.finished = time.perf_counter() - self._t0
+            self._end_memory(st, base)
+
+    def wrap(self, name: str, fn: Callable[[Iterator], Iterable]) -> Callable[[Iterator], Iterator]:
+        """Instrument a StagePipeline stage function"""
+        st = self._stats(name, "stream")
+
+        def timed(items: Iterator) -> Iterator:
+            waited = [0.0]
+
+            def inputs():
+                it = iter(items)
+                while True:
+                    t0 = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        waited[0] += time.perf_counter() - t0
+                        return
+                    waited[0] += time.perf_counter() - t0
+                    st.items_in += 1
+                    yield item
+
+            base = self._start_memory()
+            st.started = time.perf_counter() - self._t0
+            gen = iter(fn(inputs()))
+            while True:
+                t0, c0, w0 = time.perf_counter(), time.thread_time(), waited[0]
+                try:
+                    result = next(gen)
+                except StopIteration:
+                    result = done = StopIteration
+                else:
+                    done = None
+                # Time blocked on the upstream queue is not this stage's work
+                st.wall += time.perf_counter() - t0 - (waited[0] - w0)
+                st.cpu += time.thread_time() - c0
+                if done is not None:
+                    break
+                st.items_out += 1
+                # The downstream put happens while we are suspended here: not timed
+                yield result
+            st.finished = time.perf_counter() - self._t0
+            self._end_memory(st, base)
+
+        return timed
+
+    def report(self) -> Dict:
+        stages = sorted(self.stages.values(), key=lambda s: (s.started is None, s.started or 0))
+        return {
+            "total_wall_s": round(time.perf_counter() - self._t0, 4),
+            "total_cpu_s": round(time.process_time() - self._cpu0, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "traced_memory": self.trace_memory,
+            "stages": [s.to_dict() for s in stages],
+            **self.extra,
+        }
+
+    def format(self) -> str:
+        """Summary table for the log / terminal"""
+        r = self.report()
+        header = f"{'stage':<14} {'wall s':>9} {'cpu s':>9} {'in':>7} {'out':>7} {'items/s':>9} {'rss MB':>8}"
+        if self.trace_memory:
+            header += f" {'py peak MB':>11}"
+        lines = [f"Ingest profile: {r['total_wall_s']:.2f}s wall, {r['total_cpu_s']:.2f}s CPU, "
+                 f"peak RSS {r['peak_rss_mb']:.0f} MB", header, "-" * len(header)]
+        for s in r["stages"]:
+            rate = f"{s['items_per_s']:.1f}" if s["items_per_s"] is not None else "-"
+            line = (f"{s['stage']:<14} {s['wall_s']:>9.3f} {s['cpu_s']:>9.3f} {s['items_in']:>7} "
+                    f"{s['items_out']:>7} {rate:>9} {s['rss_mb']:>8.0f}")
+            if self.trace_memory:
+                line += f" {s.get('py_peak_mb', 0.0):>11.1f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def save(self, path: pathlib.Path):
+        tmp = pathlib.Path(path).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+        tmp.replace(path)
+
+    def close(self):
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
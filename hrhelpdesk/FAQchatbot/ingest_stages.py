@@ -0,0 +1,225 @@
+"""
+Threaded generator pipeline for ingestion
+Each stage is a generator function (iterator in -> iterator out) running in
+its own thread; stages are linked by bounded queues, so a slow stage blocks
+the ones before it and at most `maxsize` items wait between any two stages
+
+With sequential=True every stage instead runs to completion before the next
+one starts (used when profiling, so memory can be attributed to a stage).
+
+Completed batches are checkpointed by BatchCheckpoint so an interrupted
+ingest picks up after the last batch that made it to disk.
+"""
+
+import os
+import json
+import queue
+import shutil
+import logging
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: checkpoints are not locked
+    fcntl = None
+
+_END = object()
+_POLL_SECONDS = 0.1
+
+Stage = Tuple[str, Callable[[Iterator], Iterable]]
+
+
+class _Stopped(Exception):
+    """Raised inside a stage thread when the pipeline is being torn down"""
+
+
+class StagePipeline:
+    """Run stages concurrently and yield the last stage's output in the caller"""
+
+    def __init__(self, stages: List[Stage], maxsize: int = 4, profiler=None,
+                 sequential: bool = False):
+        if profiler is not None:
+            stages = [(name, profiler.wrap(name, fn)) for name, fn in stages]
+        self.stages = stages
+        self.sequential = sequential
+        self.maxsize = max(1, maxsize)
+        self.counts: Dict[str, int] = {name: 0 for name, _ in stages}
+        self._stop = threading.Event()
+        self._error: Tuple[str, BaseException] = None
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _drain(self, q: queue.Queue) -> Iterator:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _run_stage(self, name: str, fn: Callable, items: Iterable, out: queue.Queue):
+        try:
+            for result in fn(items):
+                self._put(out, result)
+                self.counts[name] += 1
+            self._put(out, _END)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = (name, e)
+            self._stop.set()
+
+    def _run_sequential(self, source: Iterable) -> Iterator:
+        items: Iterable = source
+        for name, fn in self.stages:
+            try:
+                items = list(fn(iter(items)))
+            except Exception as e:
+                raise RuntimeError(f"Ingest stage '{name}' failed: {e}") from e
+            self.counts[name] = len(items)
+        return iter(items)
+
+    def run(self, source: Iterable) -> Iterator:
+        """Feed `source` through every stage; re-raises the first stage failure"""
+        if self.sequential:
+            yield from self._run_sequential(source)
+            return
+        threads = []
+        items: Iterable = source
+        out = None
+        for name, fn in self.stages:
+            out = queue.Queue(maxsize=self.maxsize)
+            t = threading.Thread(target=self._run_stage, args=(name, fn, items, out),
+                                 name=f"ingest-{name}", daemon=True)
+            threads.append(t)
+            items = self._drain(out)
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                if self._error is not None:
+                    break
+                try:
+                    item = out.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                yield item
+        finally:
+            # Also reached when the consumer stops early or raises
+            self._stop.set()
+            for t in threads:
+                t.join()
+        if self._error is not None:
+            name, exc = self._error
+            raise RuntimeError(f"Ingest stage '{name}' failed: {exc}") from exc
+        counts = ", ".join(f"{name} {n}" for name, n in self.counts.items())
+        logging.info(f"Ingest stages finished in {time.perf_counter() - started:.2f}s ({counts})")
+
+
+class BatchCheckpoint:
+    """Completed (vectors, docs) batches on disk so a failed ingest can resume
+
+    Layout of the checkpoint directory:
+        state.json        {"fingerprint": ..., "batches": [name, ...]}
+        <name>.npy        float32 embeddings of the batch
+        <name>.json       {"docs": [...], "sources": {url: state}, "extra": {...}}
+
+    A checkpoint written under a different fingerprint (other embedding
+    backend, sources, index or chunking settings, ...) is discarded instead
+    of resumed. Hold locked() while using it: the lock file sits next to the
+    directory, so two builds never write the same checkpoint.
+    """
+
+    def __init__(self, directory: pathlib.Path, fingerprint: Dict):
+        self.directory = pathlib.Path(directory)
+        self.fingerprint = fingerprint
+        self.batches: List[str] = []
+
+    @contextmanager
+    def locked(self):
+        """Exclusive use of the checkpoint; raises RuntimeError if another build has it"""
+        if fcntl is None:
+            yield self
+            return
+        self.directory.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.directory.with_name(self.directory.name + ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise RuntimeError(
+                    f"Another build is using the ingest checkpoint in {self.directory}") from None
+            try:
+                yield self
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_state(self):
+        tmp = self.directory / "state.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "batches": self.batches}, f)
+        os.replace(tmp, self.directory / "state.json")
+
+    def load(self) -> List[Tuple[np.ndarray, List[Dict], Dict[str, Dict], Dict]]:
+        """Batches completed by an earlier run, oldest first"""
+        state_path = self.directory / "state.json"
+        if not state_path.exists():
+            return []
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable ingest checkpoint: {e}")
+            self.clear()
+            return []
+        if state.get("fingerprint") != self.fingerprint:
+            logging.info("Ingest checkpoint was written with other settings—starting over")
+            self.clear()
+            return []
+
+        out = []
+        for name in state["batches"]:
+            with open(self.directory / f"{name}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(self.directory / f"{name}.npy", mmap_mode="r")
+            out.append((vectors, meta["docs"], meta["sources"], meta.get("extra", {})))
+        self.batches = list(state["batches"])
+        return out
+
+    def append(self, vectors: np.ndarray, docs: List[Dict], sources: Dict[str, Dict],
+               extra: Dict = None):
+        """Persist one batch; it only counts once state.json lists it"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"batch_{len(self.batches):05d}"
+        np.save(self.directory / f"{name}.npy", np.asarray(vectors, dtype=np.float32))
+        with open(self.directory / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump({"docs": docs, "sources": sources, "extra": extra or {}}, f, ensure_ascii=False)
+        self.batches.append(name)
+        self._write_state()
+
+    def clear(self):
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.batches = []
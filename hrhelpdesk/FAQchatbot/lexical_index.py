@@ -0,0 +1,136 @@
+"""
+BM25 lexical index for the RAG pipeline
+Catches exact legal terms and article numbers that dense retrieval misses,
+with Arabic normalization so spelling variants of the same word match
+
+Postings are stored CSR-style in flat numpy arrays with the BM25 weight of
+every (term, doc) pair precomputed, so scoring a query is one vectorized
+scatter-add per query term.
+"""
+
+import re
+import json
+import pathlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+from pyarabic.araby import strip_tashkeel, strip_tatweel
+
+from chunk_store import prepare_tmp_dir, swap_in_dir
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_ALEF_RE = re.compile("[آأإٱ]")  # آ أ إ ٱ -> ا
+_TOKEN_RE = re.compile(r"\w+", flags=re.UNICODE)
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+
+def normalize_arabic(text: str) -> str:
+    """Strip diacritics/tatweel and fold alef, ya and ta-marbuta variants"""
+    text = strip_tatweel(strip_tashkeel(text))
+    text = _ALEF_RE.sub("ا", text)
+    text = text.replace("ى", "ي")  # ى -> ي
+    text = text.replace("ة", "ه")  # ة -> ه
+    return text.translate(_DIGITS)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, Arabic-normalized word tokens"""
+    return _TOKEN_RE.findall(normalize_arabic(text).lower())
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, keyed by the same ids as the FAISS index"""
+
+    def __init__(self, vocab: Dict[str, int], term_offsets: np.ndarray,
+                 post_docs: np.ndarray, post_weights: np.ndarray, doc_ids: np.ndarray):
+        self.vocab = vocab
+        self.term_offsets = term_offsets  # int64 (V + 1,)
+        self.post_docs = post_docs        # int32 row numbers
+        self.post_weights = post_weights  # float32 BM25 contribution
+        self.doc_ids = doc_ids            # int64 row -> FAISS id
+
+    @classmethod
+    def build(cls, doc_ids: List[int], texts: List[str],
+              k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """Build the index from (id, text) pairs"""
+        vocab: Dict[str, int] = {}
+        rows_terms, rows_tfs, doc_lens = [], [], []
+        for text in texts:
+            tf = Counter(tokenize(text))
+            rows_terms.append(np.fromiter((vocab.setdefault(t, len(vocab)) for t in tf),
+                                          dtype=np.int64, count=len(tf)))
+            rows_tfs.append(np.fromiter(tf.values(), dtype=np.float32, count=len(tf)))
+            doc_lens.append(sum(tf.values()))
+
+        n_docs = len(texts)
+        if not n_docs:
+            return cls(vocab, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                       np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))
+        terms = np.concatenate(rows_terms)
+        tfs = np.concatenate(rows_tfs)
+        docs = np.repeat(np.arange(n_docs, dtype=np.int32), [len(r) for r in rows_terms])
+        doc_lens = np.asarray(doc_lens, dtype=np.float32)
+        avgdl = max(float(doc_lens.mean()), 1.0)
+
+        df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * doc_lens[docs] / avgdl)
+        weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        # Group postings by term (CSR)
+        order = np.argsort(terms, kind="stable")
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=term_offsets[1:])
+        return cls(vocab, term_offsets, docs[order], weights[order],
+                   np.asarray(doc_ids, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, int]]:
+        """Top-k (bm25 score, FAISS id) pairs for a query"""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids or not len(self.doc_ids):
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for t in term_ids:
+            lo, hi = self.term_offsets[t], self.term_offsets[t + 1]
+            # A term's postings hold each doc at most once, so no np.add.at
+            scores[self.post_docs[lo:hi]] += self.post_weights[lo:hi]
+
+        nonzero = np.flatnonzero(scores)
+        if len(nonzero) > top_k:
+            nonzero = nonzero[np.argpartition(-scores[nonzero], top_k - 1)[:top_k]]
+        nonzero = nonzero[np.argsort(-scores[nonzero])]
+        return [(float(scores[r]), int(self.doc_ids[r])) for r in nonzero]
+
+    def save(self, out_dir: pathlib.Path):
+        out_dir = pathlib.Path(out_dir)
+        tmp_dir = prepare_tmp_dir(out_dir)
+        np.save(tmp_dir / "term_offsets.npy", self.term_offsets)
+        np.save(tmp_dir / "post_docs.npy", self.post_docs)
+        np.save(tmp_dir / "post_weights.npy", self.post_weights)
+        np.save(tmp_dir / "doc_ids.npy", self.doc_ids)
+        with open(tmp_dir / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        swap_in_dir(tmp_dir, out_dir)
+
+    @classmethod
+    def load(cls, in_dir: pathlib.Path) -> "BM25Index":
+        in_dir = pathlib.Path(in_dir)
+        with open(in_dir / "vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(
+            vocab,
+            np.load(in_dir / "term_offsets.npy", mmap_mode="r"),
+            np.load(in_dir / "post_docs.npy", mmap_mode="r"),
+            np.load(in_dir / "post_weights.npy", mmap_mode="r"),
+            np.load(in_dir / "doc_ids.npy", mmap_mode="r"),
+        )
+
+    @staticmethod
+    def exists(in_dir: pathlib.Path) -> bool:
+        return (pathlib.Path(in_dir) / "vocab.json").exists()
@@ -0,0 +1,185 @@
+"""
+Local-directory corpus for the RAG pipeline
+HTML, Markdown, text and PDF files under a directory are indexed next to (or
+instead of) the web sources, without any network access
+
+A file's source id is its file:// URI. Files are parsed in a process pool
+(readability + lxml and PDF text extraction are CPU-bound), and each parse
+also returns the SHA-256 of the bytes it read, so incremental ingest can
+skip unchanged files without parsing them.
+
+PDF support needs the optional pypdf package.
+"""
+
+import io
+import os
+import re
+import hashlib
+import logging
+import pathlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDFs are skipped with a warning
+    PdfReader = None
+
+FILE_KINDS = {
+    ".html": "html",
+    ".htm": "html",
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".txt": "text",
+    ".pdf": "pdf",
+}
+
+_MD_FRONT_MATTER = re.compile(r"\A---\n.*?\n---\n", flags=re.DOTALL)
+_MD_COMMENT = re.compile(r"<!--.*?-->", flags=re.DOTALL)
+_MD_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_MD_SETEXT = re.compile(r"^(?!#)(\S[^\n]*)\n(=+|-+)[ \t]*$", flags=re.MULTILINE)
+_MD_EMPHASIS = re.compile(r"(\*{1,3}|_{2,3})(\S(?:.*?\S)?)\1")
+_MD_FENCE = re.compile(r"^```[^\n]*$", flags=re.MULTILINE)
+_MD_HTML_TAG = re.compile(r"</?[a-zA-Z][^>]*>")
+
+
+def is_local_source(source: str) -> bool:
+    return source.startswith("file://")
+
+
+def source_id(path: pathlib.Path) -> str:
+    """Source id (file:// URI) of a corpus file"""
+    return path.resolve().as_uri()
+
+
+def source_path(source: str) -> pathlib.Path:
+    """Inverse of source_id"""
+    return pathlib.Path(unquote(urlparse(source).path))
+
+
+def scan_corpus(root: Union[str, pathlib.Path]) -> List[str]:
+    """Source ids of every supported file under root (hidden entries skipped), sorted"""
+    root = pathlib.Path(root)
+    if not root.is_dir():
+        raise FileNotFoundError(f"Corpus directory not found: {root}")
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            path = pathlib.Path(dirpath) / name
+            if not name.startswith(".") and path.suffix.lower() in FILE_KINDS:
+                found.append(source_id(path))
+    return sorted(found)
+
+
+def file_hash(path: pathlib.Path) -> str:
+    """SHA-256 of the file's bytes"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def decode_bytes(data: bytes) -> str:
+    """UTF-8 (with or without BOM), falling back to Windows Arabic"""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1256", errors="replace")
+
+
+def markdown_to_text(md: str) -> str:
+    """Plain text with the '#' headings the section splitter expects"""
+    text = md.replace("\r\n", "\n")
+    text = _MD_FRONT_MATTER.sub("", text)
+    text = _MD_COMMENT.sub("", text)
+    text = _MD_FENCE.sub("", text)
+    text = _MD_SETEXT.sub(lambda m: f"{'#' if m.group(2)[0] == '=' else '##'} {m.group(1)}", text)
+    text = _MD_IMAGE.sub("", text)
+    text = _MD_LINK.sub(r"\1", text)
+    text = _MD_EMPHASIS.sub(r"\2", text)
+    text = _MD_HTML_TAG.sub("", text)
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def pdf_to_text(data: bytes) -> str:
+    """Text of every page, pages separated by blank lines"""
+    if PdfReader is None:
+        raise RuntimeError("pypdf is not installed (pip install pypdf) - cannot read PDF files")
+    reader = PdfReader(io.BytesIO(data))
+    pages = [(page.extract_text() or "").strip() for page in reader.pages]
+    text = "\n\n".join(p for p in pages if p)
+    return re.sub(r"[ \t]+", " ", text)
+
+
+def parse_file(source: str, html_to_text: Callable[[str], str]) -> Tuple[str, str]:
+    """(header-preserving text, sha256 of the bytes read) for one corpus file
+
+    Runs in a worker process; html_to_text must be picklable (a module-level
+    function or a static method of a module-level class).
+    """
+    path = source_path(source)
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    kind = FILE_KINDS.get(path.suffix.lower())
+    if kind == "html":
+        return html_to_text(decode_bytes(data)), digest
+    if kind == "markdown":
+        return markdown_to_text(decode_bytes(data)), digest
+    if kind == "text":
+        text = decode_bytes(data).replace("\r\n", "\n")
+        return re.sub(r"\n{3,}", "\n\n", text).strip(), digest
+    if kind == "pdf":
+        return pdf_to_text(data), digest
+    raise ValueError(f"Unsupported corpus file type: {path.name}")
+
+
+class CorpusParser:
+    """Process pool that turns corpus files into text"""
+
+    def __init__(self, html_to_text: Callable[[str], str], workers: int = 0):
+        self.html_to_text = html_to_text
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+
+    def __enter__(self) -> "CorpusParser":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def submit(self, source: str) -> Future:
+        """Future for parse_file(source)"""
+        return self._get_pool().submit(parse_file, source, self.html_to_text)
+
+    def parse_all(self, sources: List[str]) -> Dict[str, Union[Tuple[str, str], Exception]]:
+        """Parse every file; failures are returned, not raised"""
+        if len(sources) <= 1 or self.workers == 1:
+            futures = None
+        else:
+            futures = {s: self.submit(s) for s in sources}
+        out: Dict[str, Union[Tuple[str, str], Exception]] = {}
+        for s in sources:
+            try:
+                out[s] = futures[s].result() if futures else parse_file(s, self.html_to_text)
+            except Exception as e:
+                out[s] = e
+        return out
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def log_parse_failure(source: str, error: Exception):
+    logging.warning(f"{source_path(source)}: skipped ({type(error).__name__}: {error})")
@@ -0,0 +1,304 @@
+"""
+Caching helpers for the RAG pipeline
+Keeps embedding work proportional to what actually changed between builds
+"""
+
+import hashlib
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a question so trivial variations share a cache entry"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split())
+
+
+def content_key(model: str, text: str) -> str:
+    """Content-addressed cache key for (model, text)"""
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by hash(model, text)"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for every text already in the cache"""
+        keys = [content_key(model, t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                part = list(set(keys[i:i + 500]))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            out = {pos: found[key] for pos, key in enumerate(keys) if key in found}
+            # Ingest threads share the cache; += is not atomic
+            self.hits += len(out)
+            self.misses += len(texts) - len(out)
+        return out
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """Store vectors for texts (rows of vectors align with texts)"""
+        rows = [
+            (content_key(model, t), int(v.shape[0]),
+             np.ascontiguousarray(v, dtype=np.float32).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def reset_stats(self):
+        """Reset hit/miss counters (e.g. at the start of an ingest)"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for the current process"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": (hits / total) if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU + TTL cache of normalized query -> embedding
+
+    Vectors live in one preallocated float32 matrix; the LRU map only holds
+    slot numbers, so entries cost dim * 4 bytes each and nothing else.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024, ttl_seconds: float = 3600.0):
+        self.dim = dim
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """Return a (1, dim) copy of the cached embedding, or None"""
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            slot, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._free.append(slot)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._vectors[slot:slot + 1].copy()
+
+    def put(self, query: str, vector: np.ndarray):
+        """Cache the embedding for a query, evicting the LRU entry if full"""
+        if self.capacity <= 0:
+            return
+        key = normalize_query(query)
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                slot = entry[0]
+            elif self._free:
+                slot = self._free.pop()
+            else:
+                _, (slot, _) = self._entries.popitem(last=False)
+                self.evictions += 1
+            self._vectors[slot] = np.asarray(vector, dtype=np.float32).reshape(-1)
+            self._entries[key] = (slot, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "memory_bytes": int(self._vectors.nbytes),
+        }
+
+
+class SemanticAnswerCache:
+    """Question embedding -> final answer cache for near-duplicate questions
+
+    A lookup is one (capacity x dim) matrix-vector product over the stored
+    question embeddings; the best match above `threshold` cosine similarity
+    is returned. Entries expire after `ttl_seconds` and only match lookups
+    for the index version they were answered from. Entries of other
+    versions are dropped lazily, as the first slots reused, so a hot swap
+    (with requests still finishing on the old index) flushes nothing.
+    """
+
+    def __init__(self, dim: int, capacity: int = 512, threshold: float = 0.95,
+                 ttl_seconds: float = 6 * 3600.0):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._entries: List[Optional[Tuple[Dict, Optional[int]]]] = [None] * capacity
+        # Index version of each slot, as a small int (see _version_id)
+        self._slot_version = np.full(capacity, -1, dtype=np.int32)
+        self._version_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.unmetered_hits = 0  # hits on answers whose cost was not reported
+        self.invalidations = 0  # entries of another index version dropped
+
+    def _version_id(self, index_version: str) -> int:
+        vid = self._version_ids.get(index_version)
+        if vid is None:
+            # Forget versions no slot holds any more
+            live = set(self._slot_version[self._valid].tolist())
+            self._version_ids = {v: i for v, i in self._version_ids.items() if i in live}
+            vid = max(self._version_ids.values(), default=-1) + 1
+            self._version_ids[index_version] = vid
+        return vid
+
+    def lookup(self, q_emb: np.ndarray, index_version: str) -> Optional[Dict]:
+        """Cached answer for a question embedding, or None"""
+        if self.capacity <= 0:
+            return None
+        q = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        now = time.monotonic()
+        with self._lock:
+            self._valid &= self._expires > now
+            usable = self._valid & (self._slot_version == self._version_id(index_version))
+            if not usable.any():
+                self.misses += 1
+                return None
+            sims = self._vectors @ q
+            sims[~usable] = -np.inf
+            slot = int(np.argmax(sims))
+            if sims[slot] < self.threshold:
+                self.misses += 1
+                return None
+            result, tokens = self._entries[slot]
+            self._last_used[slot] = now
+            self.hits += 1
+            if tokens is None:
+                self.unmetered_hits += 1
+            else:
+                self.saved_tokens += tokens
+        return {**result, "cache_hit": True, "cache_similarity": float(sims[slot])}
+
+    def store(self, q_emb: np.ndarray, result: Dict, tokens: Optional[int], index_version: str):
+        """Remember an answer; `tokens` is what generating it cost (None if unknown)"""
+        if self.capacity <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            vid = self._version_id(index_version)
+            self._valid &= self._expires > now
+            free = np.flatnonzero(~self._valid)
+            stale = np.flatnonzero(self._valid & (self._slot_version != vid))
+            if len(free):
+                slot = int(free[0])
+            elif len(stale):
+                # Least recently used entry of another index version
+                slot = int(stale[np.argmin(self._last_used[stale])])
+                self.invalidations += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._vectors[slot] = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+            self._entries[slot] = (result, tokens)
+            self._valid[slot] = True
+            self._slot_version[slot] = vid
+            self._expires[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = int(self._valid.sum())
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "unmetered_hits": self.unmetered_hits,
+            "invalidations": self.invalidations,
+        }
+
+
+def open_embedding_cache(path: pathlib.Path) -> Optional[EmbeddingCache]:
+    """Open the embedding cache, or run uncached if the file is unusable"""
+    try:
+        return EmbeddingCache(path)
+    except sqlite3.Error as e:
+        logging.warning(f"Embedding cache disabled ({path}): {e}")
+        return None
@@ -4,44 +4,178 @@ Based on the RAG_Egypt_Labour_Law_Colab.ipynb implementation
 """
 
 import os
+import asyncio
 import re
+import sys
+import json
 import time
 import pickle
+import uuid
+import hashlib
 import pathlib
 import logging
-from typing import List, Dict, Tuple
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Generator, Iterator, List, Dict, Optional, Tuple, Union
 import numpy as np
 import faiss
-import requests
+import lxml.html
+from lxml import etree
 from bs4 import BeautifulSoup
 from readability import Document
 import openai
 from dotenv import load_dotenv
 
+from chunk_store import ChunkStore, write_chunk_store
+from chunker import ChunkStats, count_tokens, merge_overlapping, chunk_text as split_into_chunks
+from dedup import DedupReport, NearDupIndex
+from html_fetcher import HtmlFetcher
+from index_versions import current_version, version_dir
+from ingest_profile import IngestProfiler
+from ingest_stages import BatchCheckpoint, StagePipeline
+from lexical_index import BM25Index
+from local_corpus import (CorpusParser, file_hash, is_local_source, log_parse_failure,
+                          scan_corpus, source_path)
+from rate_limit import TokenBucketLimiter, backoff_delay
+from rag_cache import (EmbeddingCache, QueryEmbeddingCache, SemanticAnswerCache,
+                       normalize_query, open_embedding_cache)
+from reranker import Reranker, make_reranker
+
 # Load environment variables
 load_dotenv()
 
 # Configuration
 EMB_DIM = 1536  # OpenAI text-embedding-3-small dimension
+EMB_MODEL = "text-embedding-3-small"
+# OpenAI embedding requests: inputs per request, requests in flight, account
+# limits for the model (0 = unlimited) and retries per batch
+EMB_BATCH_SIZE = 100
+EMB_CONCURRENCY = int(os.getenv("RAG_EMB_CONCURRENCY", "4"))
+EMB_RPM = int(os.getenv("RAG_EMB_RPM", "3000"))
+EMB_TPM = int(os.getenv("RAG_EMB_TPM", "1000000"))
+EMB_MAX_RETRIES = int(os.getenv("RAG_EMB_MAX_RETRIES", "6"))
+
+# Embedding backend: openai | local (sentence-transformers on CPU)
+EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", "openai")
+LOCAL_EMB_MODEL = os.getenv(
+    "RAG_LOCAL_EMB_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+LOCAL_EMB_BATCH = int(os.getenv("RAG_LOCAL_EMB_BATCH", "64"))
+LOCAL_EMB_THREADS = int(os.getenv("RAG_LOCAL_EMB_THREADS", "0"))  # 0 = torch default
+LOCAL_EMB_INT8 = os.getenv("RAG_LOCAL_EMB_INT8", "false").lower() == "true"
 URLS = [
     "https://eg.andersen.com/egypts-labour-law-14-2025/",
     "https://manshurat.org/content/qnwn-lml-ljdyd-2025",
 ]
 
-INDEX_DIR = pathlib.Path("rag_index")
-INDEX_DIR.mkdir(exist_ok=True)
+# Anchored to this file, not the working directory, so every entry point
+# (service, CLI, scripts) serves the same index
+INDEX_DIR = pathlib.Path(os.getenv(
+    "RAG_INDEX_DIR", str(pathlib.Path(__file__).resolve().parent / "rag_index")))
+INDEX_DIR.mkdir(parents=True, exist_ok=True)
 FAISS_PATH = INDEX_DIR / "faiss.index"
+# Legacy pickled metadata; new indexes store chunks in INDEX_DIR / "chunks"
 META_PATH = INDEX_DIR / "metadata.pkl"
-
-# Chunking / retrieval
+# Per-source / per-chunk content hashes used by incremental ingest (these
+# files sit next to faiss.index, in INDEX_DIR or in a version directory)
+SOURCES_PATH = INDEX_DIR / "sources.json"
+# Lives outside the index files so it survives force rebuilds
+EMB_CACHE_PATH = INDEX_DIR / "embedding_cache.sqlite"
+# Raw HTML + ETag / Last-Modified per source, revalidated on every ingest
+HTML_CACHE_DIR = INDEX_DIR / "html_cache"
+
+# Local corpus: HTML / Markdown / text / PDF files under RAG_CORPUS_DIR are
+# indexed too; RAG_WEB_SOURCES=false leaves out URLS (offline builds)
+CORPUS_DIR = os.getenv("RAG_CORPUS_DIR", "")
+CORPUS_WORKERS = int(os.getenv("RAG_CORPUS_WORKERS", "0"))  # parser processes, 0 = one per CPU
+WEB_SOURCES = os.getenv("RAG_WEB_SOURCES", "true").lower() == "true"
+
+# Source fetching
+FETCH_WORKERS = int(os.getenv("RAG_FETCH_WORKERS", "8"))
+FETCH_RETRIES = int(os.getenv("RAG_FETCH_RETRIES", "4"))
+FETCH_TIMEOUT = int(os.getenv("RAG_FETCH_TIMEOUT", "30"))
+HTML_MAX_AGE = float(os.getenv("RAG_HTML_MAX_AGE", "0"))  # seconds a cached page skips revalidation
+
+# Staged ingest: chunks per embed/add batch, items buffered between stages
+INGEST_BATCH = int(os.getenv("RAG_INGEST_BATCH", "256"))
+INGEST_QUEUE_SIZE = int(os.getenv("RAG_INGEST_QUEUE_SIZE", "4"))
+# Embedded batches of an unfinished full build, removed once it is saved
+INGEST_CHECKPOINT_DIR = INDEX_DIR / "ingest_checkpoint"
+# Wall / CPU time, memory and throughput per ingest stage of the last build
+INGEST_PROFILE_PATH = INDEX_DIR / "ingest_profile.json"
+
+# Chunking: sentence | clause (token budget, whole-sentence overlap) | chars
+CHUNK_POLICY = os.getenv("RAG_CHUNK_POLICY", "sentence")
+CHUNK_MAX_TOKENS = int(os.getenv("RAG_CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "40"))
+# Character windows for the "chars" policy
 MAX_CHARS = 350
 OVERLAP = 60
+
+# Near-duplicate chunk elimination at ingest: minhash | off
+DEDUP_MODE = os.getenv("RAG_DEDUP", "minhash")
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))  # estimated Jaccard
+DEDUP_REPORT_PATH = INDEX_DIR / "dedup_report.json"
+
+# Retrieval
 TOP_K = 6
-MAX_CONTEXT_CHARS = 8000
+# Prompt context: token budget, MMR relevance/diversity trade-off (1 = rank
+# by relevance only) and the similarity at which a hit counts as a repeat
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "1800"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("RAG_CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_REDUNDANCY = float(os.getenv("RAG_CONTEXT_REDUNDANCY", "0.95"))
+
+# Vector index type: flat (exact) | ivf_flat | hnsw | ivf_pq
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+# Build-time parameters (0 = pick automatically from the corpus size)
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))
+PQ_M = int(os.getenv("RAG_PQ_M", "64"))
+PQ_NBITS = 8
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = 200
+# Vector storage precision: float32 | float16 | int8 (scalar quantized).
+# Reduced precision keeps a float32 copy on disk (memory-mapped) so the top
+# candidates can be re-scored exactly; RESCORE_FACTOR controls the over-fetch.
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+RESCORE_FULL_PRECISION = os.getenv("RAG_RESCORE", "true").lower() == "true"
+RESCORE_FACTOR = 4
+# Search-time knobs; env vars override whatever was saved with the index
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+# Hybrid retrieval: off | rrf (reciprocal-rank fusion) | weighted
+HYBRID_MODE = os.getenv("RAG_HYBRID_MODE", "rrf")
+HYBRID_MODES = ("off", "rrf", "weighted")
+HYBRID_CANDIDATES = 30  # per retriever, before fusion
+RRF_K = 60
+HYBRID_DENSE_WEIGHT = float(os.getenv("RAG_HYBRID_DENSE_WEIGHT", "0.6"))
+
+# Reranking: off | lexical | cross-encoder. Retrieval over-fetches
+# RERANK_CANDIDATES hits, the reranker keeps the best RERANK_TOP_K (in place
+# of TOP_K) and stops scoring once RERANK_BUDGET_MS is spent.
+RERANK_MODE = os.getenv("RAG_RERANK", "off")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "30"))
+RERANK_TOP_K = int(os.getenv("RAG_RERANK_TOP_K", "4"))
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "150"))
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_BATCH = int(os.getenv("RAG_RERANK_BATCH", "16"))
+
+# Query embedding cache (repeat questions skip the embeddings API)
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "86400"))
+
+# Semantic answer cache (near-duplicate questions skip retrieval + generation)
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", str(6 * 3600)))
 
 # Generation
 OPENAI_MODEL = "gpt-4o-mini"
 MAX_GEN_TOKENS = 512
+GENERATION_ERROR_ANSWER = ("I apologize, but I'm having trouble generating an answer right now. "
+                           "Please try again later.")
+NO_CONTEXT_ANSWER = "I couldn't find relevant information to answer your question about Egypt's Labour Law."
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -55,23 +189,67 @@ if OPENAI_API_KEY:
 else:
     print("❌ No OpenAI API key found")
 
+_async_openai = None
+
+
+def get_async_openai() -> openai.AsyncOpenAI:
+    """Shared client for the async serving mode
+
+    Its connection pool belongs to the event loop that first uses it, so
+    only call this from the server's loop.
+    """
+    global _async_openai
+    if _async_openai is None:
+        _async_openai = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _async_openai
+
+
+_html_fetcher = None
+
+
+def get_html_fetcher() -> HtmlFetcher:
+    """Shared fetcher (one connection pool and HTML cache per process)"""
+    global _html_fetcher
+    if _html_fetcher is None:
+        _html_fetcher = HtmlFetcher(HTML_CACHE_DIR, workers=FETCH_WORKERS, retries=FETCH_RETRIES,
+                                    timeout=FETCH_TIMEOUT, max_age=HTML_MAX_AGE)
+    return _html_fetcher
+
+
+_HEADER_LEVELS = {f"h{i}": i for i in range(1, 7)}
+_DROPPED_TAGS = frozenset(("script", "style", "noscript"))
+
+
+def _element_text(el) -> str:
+    """Equivalent of BeautifulSoup's get_text(" ", strip=True) for an lxml element"""
+    parts = []
+    stack = [el]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):  # a tail, queued after its element's subtree
+            parts.append(node)
+            continue
+        if node is not el and node.tail:
+            stack.append(node.tail)
+        # Comments / processing instructions have non-string tags; keep only their tail
+        if not isinstance(node.tag, str) or node.tag in _DROPPED_TAGS:
+            continue
+        if node.text:
+            parts.append(node.text)
+        stack.extend(reversed(node))
+    return " ".join(p for p in (part.strip() for part in parts) if p)
+
 
 class TextProcessor:
     """Text processing utilities for web scraping and chunking"""
 
     @staticmethod
-    def fetch_html(url: str, retries: int = 3, timeout: int = 30) -> str:
-        """Fetch HTML content from URL with retries"""
-        for i in range(retries):
-            try:
-                r = requests.get(url, timeout=timeout, headers={
-                                 "User-Agent": "RAG/1.0"})
-                r.raise_for_status()
-                return r.text
-            except Exception as e:
-                logging.warning(f"Fetch failed ({i+1}/{retries}) {url}: {e}")
-                time.sleep(1.5)
-        raise RuntimeError(f"Could not fetch {url}")
+    def fetch_html(url: str, retries: Optional[int] = None, timeout: Optional[int] = None) -> str:
+        """Fetch HTML content from URL (conditional request, cached, with backoff)
+
+        retries / timeout default to RAG_FETCH_RETRIES / RAG_FETCH_TIMEOUT.
+        """
+        return get_html_fetcher().fetch(url, retries=retries, timeout=timeout)
 
     @staticmethod
     def readability_clean(html: str) -> str:
@@ -83,7 +261,49 @@ class TextProcessor:
 
     @staticmethod
     def html_to_text_keep_headers(html: str) -> str:
-        """Convert HTML to text while preserving headers"""
+        """Convert HTML to text while preserving headers
+
+        One pre-order pass over an lxml tree: a heading or paragraph is
+        emitted once with all of its text, and its subtree is not visited
+        again (so nested <p> / <p> inside headings are not duplicated).
+        """
+        try:
+            root = lxml.html.document_fromstring(html)
+        except (etree.ParserError, ValueError):
+            return ""
+        ctx = root.find("body")
+        stack = [ctx if ctx is not None else root]
+
+        lines = []
+        while stack:
+            el = stack.pop()
+            tag = el.tag
+            if not isinstance(tag, str) or tag in _DROPPED_TAGS:
+                continue
+            level = _HEADER_LEVELS.get(tag)
+            if level:
+                txt = _element_text(el)
+                if txt:
+                    lines.append(f"\n{'#'*level} {txt}\n")
+            elif tag == "p":
+                txt = _element_text(el)
+                if txt:
+                    lines.append(txt)
+            else:
+                stack.extend(reversed(el))
+
+        text = "\n".join(lines)
+        text = re.sub(r"[ \t]+", " ", text)
+        text = re.sub(r"\n{3,}", "\n\n", text).strip()
+        return text
+
+    @staticmethod
+    def html_to_text_keep_headers_bs4(html: str) -> str:
+        """Reference html5lib/BeautifulSoup version of html_to_text_keep_headers
+
+        Kept for the golden-output test and benchmark only; it walks every
+        descendant and emits nested <p> / <h*> elements more than once.
+        """
         soup = BeautifulSoup(html, "html5lib")
         for tag in soup(["script", "style", "noscript"]):
             tag.decompose()
@@ -127,26 +347,53 @@ class TextProcessor:
         return sections
 
     @staticmethod
-    def chunk_text(text: str, max_len: int = MAX_CHARS, overlap: int = OVERLAP) -> List[str]:
-        """Split text into overlapping chunks"""
-        text = text.strip()
-        if len(text) <= max_len:
-            return [text]
-        out, start = [], 0
-        while start < len(text):
-            end = min(start + max_len, len(text))
-            out.append(text[start:end].strip())
-            if end == len(text):
-                break
-            start = max(0, end - overlap)
+    def chunk_text(text: str, max_len: int = MAX_CHARS, overlap: int = OVERLAP,
+                   policy: str = None) -> List[str]:
+        """Split text into overlapping chunks (see chunker.py for the policies)
+
+        max_len / overlap are the window and overlap in characters of the
+        "chars" policy; the token policies use RAG_CHUNK_MAX_TOKENS /
+        RAG_CHUNK_OVERLAP_TOKENS.
+        """
+        return split_into_chunks(text, policy or CHUNK_POLICY, max_tokens=CHUNK_MAX_TOKENS,
+                                 overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                                 max_chars=max_len, overlap_chars=overlap)
+
+    @staticmethod
+    def html_page_to_text(html: str) -> str:
+        """Cleaned, header-preserving text of a whole HTML page"""
+        return TextProcessor.html_to_text_keep_headers(TextProcessor.readability_clean(html))
+
+    @staticmethod
+    def extract_text(url: str) -> str:
+        """Fetch a URL and return its cleaned, header-preserving text"""
+        return TextProcessor.html_page_to_text(TextProcessor.fetch_html(url))
+
+    @staticmethod
+    def extract_texts(urls: List[str]) -> Dict[str, Union[str, Exception]]:
+        """Fetch all URLs concurrently, then clean each page
+
+        Per-URL failures are returned in place of the text so callers can
+        decide whether a missing source is fatal.
+        """
+        out: Dict[str, Union[str, Exception]] = {}
+        if not urls:
+            return out
+        for url, html in get_html_fetcher().fetch_all(urls).items():
+            if isinstance(html, Exception):
+                out[url] = html
+                continue
+            out[url] = TextProcessor.html_page_to_text(html)
         return out
 
     @staticmethod
     def make_docs_from_url(url: str) -> List[Dict]:
         """Create document chunks from a URL"""
-        html = TextProcessor.fetch_html(url)
-        main = TextProcessor.readability_clean(html)
-        text = TextProcessor.html_to_text_keep_headers(main)
+        return TextProcessor.make_docs_from_text(url, TextProcessor.extract_text(url))
+
+    @staticmethod
+    def make_docs_from_text(url: str, text: str) -> List[Dict]:
+        """Create document chunks from already extracted text"""
         sections = TextProcessor.split_by_headers(text)
 
         docs, sec_id = [], 0
@@ -160,100 +407,787 @@ class TextProcessor:
                     "url": url,
                     "section": title,
                     "chunk_id": i,
-                    "text": chunk
+                    "text": chunk,
+                    # Every source the chunk appeared in (near-duplicates are merged)
+                    "urls": [url]
                 })
             sec_id += 1
         return docs
 
 
-class Embedder:
+class BaseEmbedder:
+    """Shared caching front-end for the embedding backends"""
+
+    # Identifies the model (and anything that changes its vectors); used as
+    # the embedding cache key and recorded with every index built
+    backend_id: str = ""
+    dim: int = 0
+
+    def __init__(self, cache: EmbeddingCache = None):
+        self.cache = cache
+
+    def encode(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """Encode texts to embeddings, only calling the backend for cache misses"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if not use_cache or self.cache is None:
+            return self._encode_uncached(texts)
+
+        cached = self.cache.get_many(self.backend_id, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if not missing:
+            return np.vstack([cached[i] for i in range(len(texts))])
+
+        # Identical texts within one call only need to be embedded once
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        fresh = self._encode_uncached(unique_texts)
+        self.cache.put_many(self.backend_id, unique_texts, fresh)
+        fresh_by_text = dict(zip(unique_texts, fresh))
+
+        out = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i] = cached[i] if i in cached else fresh_by_text[t]
+        return out
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """encode(texts, use_cache=False) for coroutines; runs in a worker thread"""
+        return await asyncio.to_thread(self._encode_uncached, texts)
+
+
+class Embedder(BaseEmbedder):
     """OpenAI embeddings API"""
 
-    def __init__(self):
+    RETRYABLE = (openai.RateLimitError, openai.APIConnectionError,
+                 openai.APITimeoutError, openai.InternalServerError)
+
+    def __init__(self, cache: EmbeddingCache = None):
+        super().__init__(cache)
         logging.info("Using OpenAI embeddings API")
         if not OPENAI_API_KEY:
             raise RuntimeError("OpenAI API key not found")
+        self.model = EMB_MODEL
+        self.backend_id = EMB_MODEL
+        self.dim = EMB_DIM
+        # Shared by every encode() call so concurrent callers split the budget
+        self.limiter = TokenBucketLimiter(EMB_RPM, EMB_TPM)
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """Encode texts to embeddings using OpenAI API
+
+        Batches go out concurrently (EMB_CONCURRENCY) under the shared
+        requests/tokens-per-minute limiter, and each worker writes its
+        normalized rows straight into one preallocated array.
+        """
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        bounds = [(i, min(i + EMB_BATCH_SIZE, len(texts)))
+                  for i in range(0, len(texts), EMB_BATCH_SIZE)]
+        if len(bounds) <= 1 or EMB_CONCURRENCY <= 1:
+            for start, end in bounds:
+                self._encode_batch(texts, start, end, out)
+            return out
+
+        with ThreadPoolExecutor(max_workers=EMB_CONCURRENCY) as pool:
+            futures = [pool.submit(self._encode_batch, texts, start, end, out)
+                       for start, end in bounds]
+            try:
+                for f in futures:
+                    f.result()
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+        return out
 
-    def encode(self, texts: List[str]) -> np.ndarray:
-        """Encode texts to embeddings using OpenAI API"""
-        try:
-            # Process texts in batches to avoid API limits
-            batch_size = 100
-            all_embeddings = []
-
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
+    def _encode_batch(self, texts: List[str], start: int, end: int, out: np.ndarray):
+        """Embed texts[start:end] into out[start:end], retrying transient errors"""
+        batch = texts[start:end]
+        tokens = sum(count_tokens(t) for t in batch)
+        for attempt in range(EMB_MAX_RETRIES + 1):
+            self.limiter.acquire(tokens)
+            try:
+                response = openai.embeddings.create(model=self.model, input=batch)
+                break
+            except self.RETRYABLE as e:
+                if attempt == EMB_MAX_RETRIES:
+                    logging.error(f"Error getting embeddings from OpenAI: {e}")
+                    raise
+                time.sleep(self._retry_delay(e, attempt, start, end))
+            except Exception as e:
+                logging.error(f"Error getting embeddings from OpenAI: {e}")
+                raise
+        self._fill_rows(response, out[start:end])
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """Embed a few texts (queries) with the async client, same limits and retries"""
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        client = get_async_openai()
+        for start in range(0, len(texts), EMB_BATCH_SIZE):
+            end = min(start + EMB_BATCH_SIZE, len(texts))
+            batch = texts[start:end]
+            tokens = sum(count_tokens(t) for t in batch)
+            for attempt in range(EMB_MAX_RETRIES + 1):
+                await self.limiter.acquire_async(tokens)
+                try:
+                    response = await client.embeddings.create(model=self.model, input=batch)
+                    break
+                except self.RETRYABLE as e:
+                    if attempt == EMB_MAX_RETRIES:
+                        logging.error(f"Error getting embeddings from OpenAI: {e}")
+                        raise
+                    await asyncio.sleep(self._retry_delay(e, attempt, start, end))
+                except Exception as e:
+                    logging.error(f"Error getting embeddings from OpenAI: {e}")
+                    raise
+            self._fill_rows(response, out[start:end])
+        return out
 
-                response = openai.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=batch
-                )
+    def _retry_delay(self, error: Exception, attempt: int, start: int, end: int) -> float:
+        """Backoff before retrying a batch (the server's Retry-After wins)"""
+        retry_after = None
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        if str(headers.get("retry-after", "")).replace(".", "", 1).isdigit():
+            retry_after = float(headers["retry-after"])
+        delay = backoff_delay(attempt, retry_after=retry_after)
+        if isinstance(error, openai.RateLimitError):
+            # Everyone is over the limit, not just this batch
+            self.limiter.pause(delay)
+        logging.warning(
+            f"Embedding batch {start}-{end} failed ({attempt + 1}/{EMB_MAX_RETRIES + 1}): "
+            f"{type(error).__name__}—retrying in {delay:.1f}s")
+        return delay
 
-                batch_embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(batch_embeddings)
+    @staticmethod
+    def _fill_rows(response, rows: np.ndarray):
+        for item in response.data:
+            rows[item.index] = item.embedding
+        # Normalize in place for cosine similarity
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def chunking_config() -> Dict:
+    """Chunker settings; chunks made under different settings can't be mixed"""
+    if CHUNK_POLICY == "chars":
+        return {"policy": "chars", "max_chars": MAX_CHARS, "overlap": OVERLAP}
+    return {"policy": CHUNK_POLICY, "max_tokens": CHUNK_MAX_TOKENS,
+            "overlap_tokens": CHUNK_OVERLAP_TOKENS}
+
+
+def dedup_config() -> Dict:
+    """Near-duplicate settings; changing them means merges must be redone"""
+    if DEDUP_MODE == "off":
+        return {"mode": "off"}
+    if DEDUP_MODE != "minhash":
+        raise ValueError(f"Unknown dedup mode {DEDUP_MODE!r}, expected 'minhash' or 'off'")
+    return {"mode": DEDUP_MODE, "threshold": DEDUP_THRESHOLD}
+
+
+def hybrid_mode() -> str:
+    """Configured hybrid retrieval mode, checked when a pipeline is created"""
+    if HYBRID_MODE not in HYBRID_MODES:
+        raise ValueError(f"Unknown hybrid mode {HYBRID_MODE!r}, expected one of {HYBRID_MODES}")
+    return HYBRID_MODE
+
+
+def source_urls(doc: Dict) -> List[str]:
+    """All URLs a chunk was found under (older indexes only have "url")"""
+    return doc.get("urls") or [doc["url"]]
+
+
+# What indexes from before the chunking policies / dedup were built with
+LEGACY_CHUNKING = {"policy": "chars", "max_chars": 350, "overlap": 60}
+LEGACY_DEDUP = {"mode": "off"}
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash used for change detection"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_hash(doc: Dict) -> str:
+    """Hash of everything about a chunk that ends up in the index"""
+    return text_hash(f"{doc.get('section', '')}\0{doc['text']}")
+
+
+def chunk_int_id(doc_id: str) -> int:
+    """Map a stable string chunk id (url::secN::chunkM) to a FAISS int64 id"""
+    digest = hashlib.sha1(doc_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & 0x7FFFFFFFFFFFFFFF
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+VECTOR_DTYPES = {
+    "float32": None,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def default_index_params(index_type: str, n_vectors: int, dim: int) -> Dict:
+    """Build and search parameters for an index type and corpus size"""
+    params = {"type": index_type, "vector_dtype": VECTOR_DTYPE}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = IVF_NLIST or int(4 * np.sqrt(max(n_vectors, 1)))
+        params["nlist"] = max(1, min(nlist, n_vectors // 39))
+        params["nprobe"] = IVF_NPROBE
+    if index_type == "ivf_pq":
+        m = PQ_M
+        while dim % m:
+            m -= 1
+        params["pq_m"] = m
+        params["pq_nbits"] = PQ_NBITS
+    if index_type == "hnsw":
+        params["hnsw_m"] = HNSW_M
+        params["ef_construction"] = HNSW_EF_CONSTRUCTION
+        params["ef_search"] = HNSW_EF_SEARCH
+    return params
+
+
+def make_index(index_type: str, dim: int, train_vectors: np.ndarray, params: Dict = None) -> Tuple[faiss.Index, Dict]:
+    """Create (and train, if needed) an inner-product index of the given type
+
+    Flat and HNSW indexes are wrapped in IndexIDMap2 for stable ids; IVF
+    indexes store ids natively and keep a hashtable direct map so vectors
+    can be removed and reconstructed by id. params["vector_dtype"] swaps the
+    float32 storage for a float16 / int8 scalar quantizer.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    n = len(train_vectors)
+    params = {**default_index_params(index_type, n, dim), **(params or {}), "type": index_type}
+    if index_type == "ivf_pq":
+        # PQ codes are already compressed; scalar quantization doesn't apply
+        params["vector_dtype"] = "float32"
+    if params["vector_dtype"] not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype {params['vector_dtype']!r}, "
+                         f"expected one of {tuple(VECTOR_DTYPES)}")
+    qtype = VECTOR_DTYPES[params["vector_dtype"]]
+    train_vectors = np.ascontiguousarray(train_vectors, dtype=np.float32)
+
+    min_train = {"ivf_flat": 39, "ivf_pq": 2 ** PQ_NBITS}.get(index_type, 0)
+    if n < min_train:
+        logging.warning(
+            f"{index_type} needs >= {min_train} vectors to train, have {n}—using flat")
+        return make_index("flat", dim, train_vectors, {"vector_dtype": params["vector_dtype"]})
+
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat":
+        if qtype is None:
+            base = faiss.IndexFlatIP(dim)
+        else:
+            base = faiss.IndexScalarQuantizer(dim, qtype, metric)
+            base.train(train_vectors)
+        index = faiss.IndexIDMap2(base)
+    elif index_type == "hnsw":
+        if qtype is None:
+            base = faiss.IndexHNSWFlat(dim, params["hnsw_m"], metric)
+        else:
+            base = faiss.IndexHNSWSQ(dim, qtype, params["hnsw_m"], metric)
+            base.train(train_vectors)
+        base.hnsw.efConstruction = params["ef_construction"]
+        index = faiss.IndexIDMap2(base)
+    else:
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"],
+                                     params["pq_m"], params["pq_nbits"], metric)
+        elif qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dim, params["nlist"], qtype, metric)
+        t0 = time.perf_counter()
+        index.train(train_vectors)
+        logging.info(
+            f"Trained {index_type} (nlist={params['nlist']}) on {n} vectors "
+            f"in {time.perf_counter() - t0:.2f}s")
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    apply_search_params(index, params)
+    return index, params
+
+
+def apply_search_params(index: faiss.Index, params: Dict):
+    """Set runtime knobs (nprobe / efSearch) on an index"""
+    kind = params.get("type", "flat")
+    if kind in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = int(params.get("nprobe", IVF_NPROBE))
+    elif kind == "hnsw":
+        base = faiss.downcast_index(index.index)
+        base.hnsw.efSearch = int(params.get("ef_search", HNSW_EF_SEARCH))
+
+
+def fuse_rankings(dense: List[Tuple[float, int]], lexical: List[Tuple[float, int]],
+                  mode: str, top_k: int) -> List[int]:
+    """Fuse (score, id) rankings from the dense and BM25 retrievers"""
+    fused: Dict[int, float] = {}
+    if mode == "weighted":
+        # Min-max normalize each list so cosine and BM25 scales are comparable
+        for weight, ranking in ((HYBRID_DENSE_WEIGHT, dense), (1 - HYBRID_DENSE_WEIGHT, lexical)):
+            if not ranking:
+                continue
+            hi, lo = ranking[0][0], ranking[-1][0]
+            span = (hi - lo) or 1.0
+            for score, i in ranking:
+                fused[i] = fused.get(i, 0.0) + weight * (score - lo) / span
+    elif mode == "rrf":
+        for ranking in (dense, lexical):
+            for rank, (_, i) in enumerate(ranking):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+    else:
+        raise ValueError(f"Unknown hybrid mode {mode!r}, expected one of {HYBRID_MODES}")
+    return sorted(fused, key=fused.get, reverse=True)[:top_k]
+
+
+def mmr_order(scores: List[float], vectors: np.ndarray, lam: float,
+              redundancy: float = 1.0) -> List[int]:
+    """Maximal-marginal-relevance order of candidates
+
+    scores are the candidates' similarities to the query, vectors their
+    (normalized) embeddings. Each step takes the candidate maximizing
+    lam * score - (1 - lam) * (max similarity to those already taken);
+    candidates at least `redundancy` similar to a taken one are dropped.
+    """
+    n = len(scores)
+    if vectors is None or n < 2:
+        return sorted(range(n), key=lambda i: -scores[i])
+    rel = np.asarray(scores, dtype=np.float32)
+    sims = vectors @ vectors.T
+    closest = np.full(n, -np.inf, dtype=np.float32)  # max similarity to the taken set
+    left = np.ones(n, dtype=bool)
+    order = []
+    while left.any():
+        gain = lam * rel - (1 - lam) * np.where(np.isinf(closest), 0.0, closest)
+        gain[~left] = -np.inf
+        i = int(np.argmax(gain))
+        order.append(i)
+        left[i] = False
+        closest = np.maximum(closest, sims[i])
+        left &= closest < redundancy
+    return order
+
+
+_CHUNK_POSITION = re.compile(r"::sec(\d+)::chunk(\d+)$")
+
+
+def merge_adjacent_chunks(hits: List[Tuple[float, Dict]]) -> List[Tuple[float, Dict]]:
+    """Merge runs of consecutive chunks of one section into a single block
+
+    Consecutive chunks overlap, so the shared text is kept once. A merged
+    block takes the place of its first hit, the best score of the run and
+    the union of the runs' source URLs.
+    """
+    runs: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+    for pos, (_, m) in enumerate(hits):
+        match = _CHUNK_POSITION.search(m.get("id", ""))
+        if match:
+            key = (m["url"], int(match.group(1)))
+            runs.setdefault(key, []).append((int(match.group(2)), pos))
+
+    merged_into: Dict[int, List[int]] = {}  # first position of a run -> its positions
+    for members in runs.values():
+        members.sort()
+        run = [members[0]]
+        for chunk, pos in members[1:] + [(None, None)]:
+            if chunk is not None and chunk == run[-1][0] + 1:
+                run.append((chunk, pos))
+                continue
+            if len(run) > 1:
+                merged_into[min(p for _, p in run)] = [p for _, p in run]
+            run = [(chunk, pos)]
+
+    absorbed = {p for positions in merged_into.values() for p in positions}
+    out = []
+    for pos, (score, m) in enumerate(hits):
+        if pos in merged_into:
+            parts = [hits[p] for p in merged_into[pos]]
+            text = parts[0][1]["text"]
+            for _, part in parts[1:]:
+                text = merge_overlapping(text, part["text"])
+            urls = list(dict.fromkeys(u for _, part in parts for u in source_urls(part)))
+            out.append((max(sc for sc, _ in parts),
+                        {**m, "text": text, "urls": urls,
+                         "chunk_ids": [part.get("chunk_id") for _, part in parts]}))
+        elif pos not in absorbed:
+            out.append((score, m))
+    return out
+
+
+class LocalEmbedder(BaseEmbedder):
+    """Multilingual sentence-transformers model running locally on CPU"""
+
+    def __init__(self, cache: EmbeddingCache = None, model_name: str = LOCAL_EMB_MODEL,
+                 batch_size: int = LOCAL_EMB_BATCH, threads: int = LOCAL_EMB_THREADS,
+                 int8: bool = LOCAL_EMB_INT8):
+        super().__init__(cache)
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError(
+                "The local embedding backend needs sentence-transformers (pip install -r requirements.txt)") from e
+
+        if threads:
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        model.eval()
+        if int8:
+            # Dynamic int8 quantization of the Linear layers: ~2-3x faster on
+            # CPU at a small accuracy cost, so it gets its own backend id
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._model = model
+        self._torch = torch
+        self.batch_size = batch_size
+        self.dim = model.get_sentence_embedding_dimension()
+        self.backend_id = f"local:{model_name}" + (":int8" if int8 else "")
+        logging.info(
+            f"Using local embeddings: {model_name} ({self.dim}d, "
+            f"{'int8' if int8 else 'fp32'}, {torch.get_num_threads()} threads)")
 
-                # Small delay to respect rate limits
-                time.sleep(0.1)
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """Batched CPU inference, returns normalized float32 vectors"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with self._torch.inference_mode():
+            vecs = self._model.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True,
+                normalize_embeddings=True, show_progress_bar=False)
+        return np.ascontiguousarray(vecs, dtype=np.float32)
 
-            embeddings_array = np.array(all_embeddings, dtype=np.float32)
 
-            # Normalize embeddings for cosine similarity
-            norms = np.linalg.norm(embeddings_array, axis=1, keepdims=True)
-            normalized_embeddings = embeddings_array / norms
+def make_embedder(backend: str = EMBED_BACKEND, cache: EmbeddingCache = None) -> BaseEmbedder:
+    """Create the configured embedding backend"""
+    if backend == "openai":
+        return Embedder(cache=cache)
+    if backend == "local":
+        return LocalEmbedder(cache=cache)
+    raise ValueError(f"Unknown embedding backend {backend!r} (expected openai or local)")
 
-            return normalized_embeddings
 
-        except Exception as e:
-            logging.error(f"Error getting embeddings from OpenAI: {e}")
-            raise
+class IndexMismatchError(RuntimeError):
+    """Saved index was built with a different embedding backend or dimension"""
 
 
 class FaissIndex:
     """FAISS vector index for similarity search"""
 
-    def __init__(self, dim: int, index_path: pathlib.Path, meta_path: pathlib.Path):
+    def __init__(self, dim: int, index_path: pathlib.Path, meta_path: pathlib.Path,
+                 index_type: str = INDEX_TYPE, params: Dict = None, backend_id: str = None):
         self.dim = dim
+        # Embedding backend the vectors must come from (None = don't check)
+        self.backend_id = backend_id
         self.index_path = index_path
         self.meta_path = meta_path
+        self.params_path = index_path.with_name("index_params.json")
+        self.store_dir = index_path.with_name("chunks")
+        self.lexical_dir = index_path.with_name("bm25")
+        # What the next build() creates; params describes the live index
+        self.index_type = index_type
+        self.build_params: Dict = dict(params or {})
+        self.params: Dict = {}
         self.index = None
-        self.metadata: List[Dict] = []
+        # FAISS id -> chunk metadata: a dict while building, a mmapped
+        # ChunkStore after load() so only returned rows get decoded
+        self.metadata: Mapping = {}
+        # BM25 over the same chunks, rebuilt whenever the chunks change
+        self.lexical: BM25Index = None
+        # Full-precision vectors for reduced-precision indexes: the loaded
+        # store's mmapped copy plus whatever was added since
+        self._base_store: ChunkStore = None
+        self._pending_vectors: Dict[int, np.ndarray] = {}
+
+    def exists(self) -> bool:
+        """Whether a saved index (new or legacy metadata format) is on disk"""
+        return self.index_path.exists() and (
+            ChunkStore.exists(self.store_dir) or self.meta_path.exists())
+
+    def _ensure_mutable(self):
+        if isinstance(self.metadata, ChunkStore):
+            self.metadata = self.metadata.to_dict()
+
+    @property
+    def keep_full_precision(self) -> bool:
+        """Whether the index stores reduced-precision vectors"""
+        return self.params.get("vector_dtype", "float32") != "float32"
+
+    def _full_vector(self, fid: int) -> np.ndarray:
+        vec = self._pending_vectors.get(fid)
+        if vec is None and self._base_store is not None:
+            vec = self._base_store.vector(fid)
+        return vec
+
+    def _full_vectors(self, fids: List[int]) -> np.ndarray:
+        """Float32 vectors for FAISS ids, or None if any is unavailable"""
+        vecs = [self._full_vector(int(f)) for f in fids]
+        if not vecs or any(v is None for v in vecs):
+            return None
+        return np.vstack(vecs)
+
+    @property
+    def supports_updates(self) -> bool:
+        """Whether vectors can be added/removed by chunk id in place"""
+        if isinstance(self.index, faiss.IndexIDMap2):
+            # HNSW graphs cannot delete nodes
+            return isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlatCodes)
+        try:
+            faiss.extract_index_ivf(self.index)
+            return True
+        except RuntimeError:
+            return False
+
+    @property
+    def version(self) -> str:
+        """Changes every time the saved index content changes"""
+        version = self.params.get("version")
+        if not version and self.index_path.exists():
+            # Indexes saved before versioning: the file changes on every save
+            version = str(self.index_path.stat().st_mtime_ns)
+        return version or ""
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    @property
+    def needs_training(self) -> bool:
+        """Whether the next build() needs its vectors up front to train on"""
+        params = {**default_index_params(self.index_type, 0, self.dim), **self.build_params}
+        return self.index_type in ("ivf_flat", "ivf_pq") or params["vector_dtype"] != "float32"
+
+    def create(self, train_vectors: np.ndarray):
+        """Start a new, empty index (trained on train_vectors if the type needs it)"""
+        # Inner product == cosine similarity for normalized embeddings
+        self.index, self.params = make_index(
+            self.index_type, self.dim, train_vectors, self.build_params)
+        self.params["dim"] = self.dim
+        if self.backend_id:
+            self.params["embedding_backend"] = self.backend_id
+        self.metadata = {}
+        self.lexical = None
+        self._base_store = None
+        self._pending_vectors = {}
 
     def build(self, embeddings: np.ndarray, metadata: List[Dict]):
-        """Build FAISS index from embeddings"""
-        index = faiss.IndexFlatIP(
-            self.dim)  # cosine similarity for normalized embeddings
-        index.add(embeddings)
-        self.index = index
-        self.metadata = metadata
-
-    def save(self):
-        """Save index and metadata to disk"""
+        """Build FAISS index from embeddings (training it first if needed)"""
+        self.create(embeddings)
+        self.add(embeddings, metadata)
+
+    def set_search_params(self, **knobs):
+        """Change runtime knobs, e.g. set_search_params(nprobe=32, ef_search=128)"""
+        self.params.update({k: v for k, v in knobs.items() if v is not None})
+        apply_search_params(self.index, self.params)
+
+    def add(self, embeddings: np.ndarray, metadata: List[Dict]):
+        """Add vectors under the stable ids of their chunks"""
+        if len(metadata) == 0:
+            return
+        self._ensure_mutable()
+        ids = np.array([chunk_int_id(m["id"]) for m in metadata], dtype=np.int64)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.index.add_with_ids(embeddings, ids)
+        for fid, m in zip(ids.tolist(), metadata):
+            self.metadata[fid] = m
+        if self.keep_full_precision:
+            for fid, vec in zip(ids.tolist(), embeddings):
+                self._pending_vectors[fid] = vec
+
+    def add_source_url(self, doc_id: str, url: str):
+        """Record that an indexed chunk was also found under url"""
+        self._ensure_mutable()
+        m = self.metadata[chunk_int_id(doc_id)]
+        urls = list(source_urls(m))
+        if url not in urls:
+            m["urls"] = urls + [url]
+
+    def remove(self, doc_ids: List[str]) -> int:
+        """Remove vectors by string chunk id, returns how many were removed"""
+        if not doc_ids:
+            return 0
+        if not self.supports_updates:
+            raise RuntimeError("Index does not support in-place removal")
+        self._ensure_mutable()
+        ids = np.array([chunk_int_id(d) for d in doc_ids], dtype=np.int64)
+        removed = self.index.remove_ids(ids)
+        for fid in ids.tolist():
+            self.metadata.pop(fid, None)
+            self._pending_vectors.pop(fid, None)
+        return int(removed)
+
+    def save(self, profiler: IngestProfiler = None):
+        """Save index and metadata to disk (timing each file set into profiler)"""
         if self.index is None:
             raise RuntimeError("No index to save")
-        faiss.write_index(self.index, str(self.index_path))
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        profiler = profiler or IngestProfiler()
+        self.params["version"] = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with profiler.phase("write_index", items=self.ntotal):
+            faiss.write_index(self.index, str(self.index_path))
+        with profiler.phase("chunk_store", items=len(self.metadata)):
+            write_chunk_store(self.store_dir, self.metadata,
+                              vector_of=self._full_vector if self.keep_full_precision else None,
+                              dim=self.dim)
+        with profiler.phase("bm25", items=len(self.metadata)):
+            if self.lexical is None or not isinstance(self.metadata, ChunkStore):
+                ids = list(self.metadata.keys())
+                self.lexical = BM25Index.build(
+                    ids, [f"{self.metadata[i].get('section', '')}\n{self.metadata[i]['text']}" for i in ids])
+            self.lexical.save(self.lexical_dir)
+        with open(self.params_path, "w", encoding="utf-8") as f:
+            json.dump(self.params, f, indent=1)
         logging.info(
-            f"Saved index to {self.index_path} and metadata to {self.meta_path}")
+            f"Saved index to {self.index_path} and metadata to {self.store_dir}")
 
     def load(self):
         """Load index and metadata from disk"""
         self.index = faiss.read_index(str(self.index_path))
-        with open(self.meta_path, "rb") as f:
-            self.metadata = pickle.load(f)
-        logging.info("Loaded FAISS index & metadata")
+        self._pending_vectors = {}
+        self._base_store = None
+        if ChunkStore.exists(self.store_dir):
+            self.metadata = self._base_store = ChunkStore(self.store_dir)
+        else:
+            with open(self.meta_path, "rb") as f:
+                metadata = pickle.load(f)
+            # Indexes built before stable ids stored a positional list
+            if isinstance(metadata, list):
+                metadata = dict(enumerate(metadata))
+            self.metadata = metadata
+        self.lexical = BM25Index.load(self.lexical_dir) \
+            if BM25Index.exists(self.lexical_dir) else None
+
+        if self.params_path.exists():
+            with open(self.params_path, "r", encoding="utf-8") as f:
+                self.params = json.load(f)
+        else:
+            # Indexes from before index_params.json were OpenAI-only
+            self.params = {"type": "flat", "embedding_backend": EMB_MODEL}
+        self._check_backend()
+        # Runtime knobs set in the environment win over the saved ones
+        if "RAG_IVF_NPROBE" in os.environ:
+            self.params["nprobe"] = IVF_NPROBE
+        if "RAG_HNSW_EF_SEARCH" in os.environ:
+            self.params["ef_search"] = HNSW_EF_SEARCH
+        apply_search_params(self.index, self.params)
+        logging.info(
+            f"Loaded FAISS index & metadata ({self.params['type']}, {self.ntotal} vectors)")
+
+    def _check_backend(self):
+        """Refuse to serve vectors from a different embedding space"""
+        built_with = self.params.get("embedding_backend")
+        if self.index.d != self.dim:
+            raise IndexMismatchError(
+                f"Index has {self.index.d}-d vectors but the embedder produces {self.dim}-d; "
+                f"rebuild with: python rag_pipeline.py --ingest --rebuild")
+        if self.backend_id and built_with and built_with != self.backend_id:
+            raise IndexMismatchError(
+                f"Index was built with embeddings from {built_with!r} but the pipeline uses "
+                f"{self.backend_id!r}; rebuild with: python rag_pipeline.py --ingest --rebuild")
 
     def search(self, query_emb: np.ndarray, top_k: int = TOP_K) -> List[Tuple[float, Dict]]:
         """Search for similar documents"""
+        return self.search_batch(query_emb[:1], top_k=top_k)[0]
+
+    def search_batch(self, query_embs: np.ndarray, top_k: int = TOP_K) -> List[List[Tuple[float, Dict]]]:
+        """Search many queries in one FAISS call, one hit list per query row"""
+        D, I = self.search_ids(query_embs, top_k)
+        results = []
+        for scores, ids in zip(D, I):
+            hits = []
+            for score, idx in zip(scores, ids):
+                if idx == -1:
+                    continue
+                hits.append((float(score), self.metadata[int(idx)]))
+            results.append(hits)
+        return results
+
+    def search_ids(self, query_embs: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw FAISS search: (scores, ids) arrays of shape (n_queries, top_k)
+
+        Reduced-precision indexes over-fetch and re-score the candidates
+        against the float32 copy, so returned scores are exact cosines.
+        """
         if self.index is None:
             raise RuntimeError("Index not loaded")
-        D, I = self.index.search(query_emb.astype(np.float32), top_k)
-        hits = []
-        for score, idx in zip(D[0], I[0]):
-            if idx == -1:
-                continue
-            hits.append((float(score), self.metadata[idx]))
-        return hits
+        query_embs = np.ascontiguousarray(query_embs, dtype=np.float32)
+        if not (self.keep_full_precision and RESCORE_FULL_PRECISION):
+            return self.index.search(query_embs, top_k)
+
+        D, I = self.index.search(query_embs, top_k * RESCORE_FACTOR)
+        out_D = np.full((len(query_embs), top_k), -np.inf, dtype=np.float32)
+        out_I = np.full((len(query_embs), top_k), -1, dtype=np.int64)
+        for row, (q, scores, ids) in enumerate(zip(query_embs, D, I)):
+            valid = ids != -1
+            ids, scores = ids[valid], scores[valid]
+            vecs = self._full_vectors(ids)
+            exact = scores if vecs is None else vecs @ q
+            order = np.argsort(-exact)[:top_k]
+            out_D[row, :len(order)] = exact[order]
+            out_I[row, :len(order)] = ids[order]
+        return out_D, out_I
+
+    def precision_report(self, embeddings: Union[np.ndarray, List[np.ndarray]],
+                         top_k: int = TOP_K, sample: int = 200) -> Dict:
+        """Index memory vs float32, and recall@k of the live index vs exact search
+
+        embeddings may be a list of row blocks (e.g. memory-mapped checkpoint
+        batches); only `sample` query rows are copied, and the exact top-k is
+        computed one block at a time.
+        """
+        blocks = [embeddings] if isinstance(embeddings, np.ndarray) else list(embeddings)
+        offsets = np.cumsum([0] + [len(b) for b in blocks])
+        n = int(offsets[-1])
+        index_bytes = int(faiss.serialize_index(self.index).nbytes)
+        float32_bytes = n * self.dim * 4
+        rng = np.random.default_rng(0)
+        rows = rng.choice(n, size=min(sample, n), replace=False)
+        block_of = np.searchsorted(offsets, rows, side="right") - 1
+        queries = np.vstack([blocks[b][r - offsets[b]] for b, r in zip(block_of, rows)])
+        queries = queries + 0.03 * rng.standard_normal(queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        k = min(top_k, n)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start, block in zip(offsets, blocks):
+            scores = np.hstack([best_scores, queries @ np.asarray(block, dtype=np.float32).T])
+            block_rows = np.broadcast_to(start + np.arange(len(block)), (len(queries), len(block)))
+            candidates = np.hstack([best_rows, block_rows])
+            top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(candidates, top, axis=1)
+        # Right after build() metadata keys are FAISS ids in embeddings row order
+        exact_ids = np.fromiter(self.metadata.keys(), dtype=np.int64)[best_rows]
+
+        def recall(I: np.ndarray) -> float:
+            return float(np.mean([len(set(a[:k]) & set(e)) / k for a, e in zip(I, exact_ids)]))
+
+        _, raw = self.index.search(queries, k)
+        report = {
+            "vector_dtype": self.params.get("vector_dtype", "float32"),
+            "index_type": self.params.get("type"),
+            "vectors": n,
+            "index_mb": index_bytes / 2**20,
+            "float32_mb": float32_bytes / 2**20,
+            "compression": float32_bytes / max(index_bytes, 1),
+            f"recall@{k}": recall(raw),
+        }
+        if self.keep_full_precision and RESCORE_FULL_PRECISION:
+            _, rescored = self.search_ids(queries, k)
+            report[f"recall@{k}_rescored"] = recall(rescored)
+        return report
+
+    def reconstruct(self, ids: List[int]) -> np.ndarray:
+        """Stored vectors for FAISS ids, or None if the index can't return them"""
+        full = self._full_vectors(ids)
+        if full is not None:
+            return full
+        try:
+            return np.vstack([self.index.reconstruct(int(i)) for i in ids])
+        except RuntimeError as e:
+            logging.debug(f"Vector reconstruction unavailable: {e}")
+            return None
 
 
 class AnswerGenerator:
@@ -266,60 +1200,720 @@ class AnswerGenerator:
 
     def generate(self, prompt: str) -> str:
         """Generate answer using OpenAI API"""
+        return self.generate_with_usage(prompt)[0]
+
+    @staticmethod
+    def _request(prompt: str) -> Dict:
+        return {
+            "model": OPENAI_MODEL,
+            "temperature": 0.2,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": MAX_GEN_TOKENS,
+        }
+
+    @staticmethod
+    def _answer_and_usage(response) -> Tuple[str, Optional[int]]:
+        usage = getattr(response, "usage", None)
+        tokens = usage.total_tokens if usage is not None else None
+        return response.choices[0].message.content.strip(), tokens
+
+    def generate_with_usage(self, prompt: str) -> Tuple[str, Optional[int]]:
+        """Generate answer, also returning total tokens used
+
+        0 if the call failed, None if it succeeded without reporting usage.
+        """
+        try:
+            return self._answer_and_usage(openai.chat.completions.create(**self._request(prompt)))
+        except Exception as e:
+            logging.error(f"OpenAI API error: {e}")
+            return GENERATION_ERROR_ANSWER, 0
+
+    async def agenerate_with_usage(self, prompt: str) -> Tuple[str, Optional[int]]:
+        """generate_with_usage() with the async client"""
         try:
-            response = openai.chat.completions.create(
-                model=OPENAI_MODEL,
-                temperature=0.2,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=MAX_GEN_TOKENS,
-            )
-            return response.choices[0].message.content.strip()
+            response = await get_async_openai().chat.completions.create(**self._request(prompt))
+            return self._answer_and_usage(response)
         except Exception as e:
             logging.error(f"OpenAI API error: {e}")
-            return "I apologize, but I'm having trouble generating an answer right now. Please try again later."
+            return GENERATION_ERROR_ANSWER, 0
+
+    def stream(self, prompt: str) -> Generator[str, None, int]:
+        """Yield the answer as it is generated; returns the tokens used (0 if the call failed)
+
+        Streamed responses carry no usage, so the count is estimated from
+        the prompt and the answer. Closing the generator early closes the
+        HTTP stream and stops the completion.
+        """
+        parts = []
+        response = None
+        try:
+            response = openai.chat.completions.create(**self._request(prompt), stream=True)
+            for chunk in response:
+                delta = self._delta(chunk, first=not parts)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            logging.error(f"OpenAI API error: {e}")
+            if not parts:
+                yield GENERATION_ERROR_ANSWER
+            return 0
+        finally:
+            if response is not None:
+                response.close()
+        return count_tokens(prompt) + count_tokens("".join(parts))
+
+    async def astream(self, prompt: str, usage: Dict = None) -> AsyncIterator[str]:
+        """stream() with the async client; usage["total_tokens"] is set at the end
+
+        (async generators cannot return a value)
+        """
+        usage = {} if usage is None else usage
+        parts = []
+        response = None
+        try:
+            response = await get_async_openai().chat.completions.create(
+                **self._request(prompt), stream=True)
+            async for chunk in response:
+                delta = self._delta(chunk, first=not parts)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            logging.error(f"OpenAI API error: {e}")
+            usage["total_tokens"] = 0
+            if not parts:
+                yield GENERATION_ERROR_ANSWER
+            return
+        finally:
+            if response is not None:
+                await response.close()
+        usage["total_tokens"] = count_tokens(prompt) + count_tokens("".join(parts))
+
+    @staticmethod
+    def _delta(chunk, first: bool) -> str:
+        delta = (chunk.choices[0].delta.content if chunk.choices else None) or ""
+        # Leading whitespace is dropped, as generate() strips it
+        return delta.lstrip() if first else delta
+
+
+class StageTimer:
+    """Wall time of each stage of one answer, in milliseconds"""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.ms: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] = self.ms.get(name, 0.0) + round((time.perf_counter() - t0) * 1000, 2)
+
+    def mark(self, name: str):
+        """Record the time since the answer started (e.g. the first token)"""
+        self.ms[name] = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def report(self) -> Dict[str, float]:
+        return {**self.ms, "total": round((time.perf_counter() - self._t0) * 1000, 2)}
+
+
+class LatencyStats:
+    """Running count / mean / max of every stage's time (for stats())"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[float]] = {}  # stage -> [count, sum, max]
+
+    def record(self, timings: Dict[str, float]):
+        with self._lock:
+            for stage, ms in timings.items():
+                agg = self._stages.setdefault(stage, [0, 0.0, 0.0])
+                agg[0] += 1
+                agg[1] += ms
+                agg[2] = max(agg[2], ms)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {stage: {"count": n, "mean_ms": round(total / n, 2), "max_ms": round(peak, 2)}
+                    for stage, (n, total, peak) in self._stages.items()}
 
 
 class RAGPipeline:
     """Main RAG pipeline for question answering"""
 
-    def __init__(self, urls: List[str], embedder: Embedder, index: FaissIndex, generator: AnswerGenerator):
+    def __init__(self, urls: List[str], embedder: BaseEmbedder, index: FaissIndex, generator: AnswerGenerator,
+                 query_cache: QueryEmbeddingCache = None, answer_cache: SemanticAnswerCache = None,
+                 reranker: Reranker = None):
+        hybrid_mode()  # fail at startup, not on the first query
         self.urls = urls
         self.embedder = embedder
         self.index = index
         self.generator = generator
-
-    def ingest(self, force_rebuild: bool = False):
-        """Build or load the knowledge base"""
-        if FAISS_PATH.exists() and META_PATH.exists() and not force_rebuild:
+        self.query_cache = query_cache
+        self.answer_cache = answer_cache
+        self.reranker = reranker
+        self.latency = LatencyStats()
+        # Updated as a full build adds batches (read by rebuild_status())
+        self.ingest_progress: Dict = {}
+        self.checkpoint_dir = INGEST_CHECKPOINT_DIR
+
+    @property
+    def index_dir(self) -> pathlib.Path:
+        return self.index.index_path.parent
+
+    @property
+    def sources_path(self) -> pathlib.Path:
+        return self.index_dir / SOURCES_PATH.name
+
+    @property
+    def profile_path(self) -> pathlib.Path:
+        return self.index_dir / INGEST_PROFILE_PATH.name
+
+    def ingest(self, force_rebuild: bool = False, incremental: bool = False, resume: bool = True,
+               profiler: IngestProfiler = None):
+        """Build or load the knowledge base
+
+        With incremental=True an existing index is updated in place: only
+        sources whose extracted text changed are re-chunked, and only chunks
+        whose content hash changed are re-embedded / replaced. A full build
+        picks up the batches checkpointed by a failed earlier build unless
+        resume=False.
+
+        Every build or update writes a per-stage profile (ingest_profile.json)
+        next to the index and logs it as a table; pass a profiler to collect
+        into it instead (IngestProfiler(trace_memory=True) also runs the
+        stages one after another to attribute memory to each).
+        """
+        profiler = profiler or IngestProfiler()
+        index_exists = self.index.exists()
+        if index_exists and incremental and not force_rebuild:
+            try:
+                self.index.load()
+            except IndexMismatchError as e:
+                logging.warning(f"{e}—doing a full rebuild.")
+            else:
+                if self.index.params.get("chunking", LEGACY_CHUNKING) != chunking_config():
+                    logging.info("Chunking settings changed—doing a full rebuild.")
+                elif self.index.params.get("dedup", LEGACY_DEDUP) != dedup_config():
+                    logging.info("Deduplication settings changed—doing a full rebuild.")
+                elif self.index.supports_updates and self.sources_path.exists():
+                    if self._ingest_incremental(profiler):
+                        self._save_profile(profiler, "incremental")
+                        return
+                    logging.info(
+                        "Changed sources share merged near-duplicate chunks—doing a full rebuild.")
+                else:
+                    logging.info(
+                        "Index has no stable ids or source hashes—doing a full rebuild.")
+        elif index_exists and not force_rebuild:
             logging.info("Index exists—loading from disk.")
             self.index.load()
             return
 
         logging.info("Building new index...")
-        all_docs: List[Dict] = []
+        self._ingest_full(resume, profiler)
+        self._save_profile(profiler, "full")
+
+    def _save_profile(self, profiler: IngestProfiler, mode: str):
+        profiler.extra.update(mode=mode, sources=len(self.urls), vectors=self.index.ntotal)
+        cache = self.embedder.cache
+        if cache is not None:
+            st = cache.stats()
+            profiler.extra["embedding_cache"] = {k: st[k] for k in ("hits", "misses", "hit_ratio")}
+        profiler.save(self.profile_path)
+        logging.info(profiler.format())
+
+    def _ingest_full(self, resume: bool = True, profiler: IngestProfiler = None):
+        """Full build as overlapping fetch → clean → text → chunk → embed → add stages
+
+        Stages run in their own threads with bounded queues in between, so
+        embedding starts with the first page and only a few batches are in
+        memory at once. Every embedded batch is checkpointed; IVF and
+        scalar-quantized indexes must see all vectors before training, so
+        for those the add step waits for the last batch.
+        """
+        profiler = profiler or IngestProfiler()
+        checkpoint = BatchCheckpoint(self.checkpoint_dir, self._checkpoint_fingerprint())
+        with checkpoint.locked():
+            if not resume:
+                checkpoint.clear()
+            self._build_from_checkpoint(checkpoint, profiler)
+
+    def _build_from_checkpoint(self, checkpoint: BatchCheckpoint, profiler: IngestProfiler):
+        """The body of _ingest_full, run while holding the checkpoint lock"""
+        self.ingest_progress = {"sources_done": 0, "sources_total": len(self.urls), "chunks": 0}
+        train_first = self.index.needs_training
+        if not train_first:
+            self.index.create(np.zeros((0, self.index.dim), dtype=np.float32))
+        held: List[Tuple[np.ndarray, List[Dict]]] = []
+        held_by_id: Dict[str, Dict] = {}
+        sources: Dict[str, Dict] = {}
+        chunk_stats = ChunkStats()
+        deduper = NearDupIndex(DEDUP_THRESHOLD) if DEDUP_MODE != "off" else None
+        report = DedupReport(DEDUP_THRESHOLD)
+        kept_urls: Dict[str, str] = {}
+
+        def take(vectors: np.ndarray, docs: List[Dict], batch_sources: Dict[str, Dict],
+                 merges: List[Dict]):
+            sources.update(batch_sources)
+            self.ingest_progress = {"sources_done": len(sources), "sources_total": len(self.urls),
+                                    "chunks": self.ingest_progress.get("chunks", 0) + len(docs)}
+            for url in batch_sources:
+                chunk_stats.add(url, [d["text"] for d in docs if d["url"] == url])
+            if train_first:
+                held.append((vectors, docs))
+                held_by_id.update((d["id"], d) for d in docs)
+            else:
+                self.index.add(vectors, docs)
+            # Merged duplicates only add their URL to the chunk that was kept
+            for m in merges:
+                if train_first:
+                    kept = held_by_id[m["kept_id"]]
+                    if m["dropped_url"] not in source_urls(kept):
+                        kept["urls"] = source_urls(kept) + [m["dropped_url"]]
+                else:
+                    self.index.add_source_url(m["kept_id"], m["dropped_url"])
+
+        with profiler.phase("resume"):
+            done = checkpoint.load()
+        for vectors, docs, batch_sources, extra in done:
+            merges = extra.get("merges", [])
+            take(vectors, docs, batch_sources, merges)
+            report.checked += len(docs) + len(merges)
+            report.merges.extend(merges)
+            for d in docs:
+                kept_urls[d["id"]] = d["url"]
+                if deduper is not None:
+                    deduper.insert(d["id"], deduper.signature(d["text"]))
+        if done:
+            logging.info(
+                f"Resuming ingest after {len(done)} checkpointed batches ({len(sources)} sources)")
+
+        file_hashes: Dict[str, str] = {}
+
+        def fetch(urls):
+            # Web pages download in a thread pool while corpus files parse in a
+            # process pool; bounded in-flight work, results in completion order
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as threads, \
+                    CorpusParser(TextProcessor.html_page_to_text, CORPUS_WORKERS) as parser:
+                urls = list(urls)
+                todo = {"html": iter([u for u in urls if not is_local_source(u)]),
+                        "text": iter([u for u in urls if is_local_source(u)])}
+                limit = {"html": FETCH_WORKERS, "text": 2 * parser.workers}
+                submit = {"html": lambda u: threads.submit(TextProcessor.fetch_html, u),
+                          "text": parser.submit}
+                in_flight = {"html": 0, "text": 0}
+                pending = {}
+                while True:
+                    for kind in todo:
+                        while in_flight[kind] < limit[kind]:
+                            url = next(todo[kind], None)
+                            if url is None:
+                                break
+                            pending[submit[kind](url)] = (url, kind)
+                            in_flight[kind] += 1
+                    if not pending:
+                        return
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        url, kind = pending.pop(f)
+                        in_flight[kind] -= 1
+                        if kind == "html":
+                            yield url, kind, f.result()
+                            continue
+                        try:
+                            text, file_hashes[url] = f.result()
+                        except Exception as e:
+                            log_parse_failure(url, e)
+                            continue
+                        yield url, kind, text
+
+        def clean(pages):
+            for url, kind, page in pages:
+                yield url, kind, TextProcessor.readability_clean(page) if kind == "html" else page
+
+        def to_text(pages):
+            for url, kind, page in pages:
+                yield url, TextProcessor.html_to_text_keep_headers(page) if kind == "html" else page
+
+        def chunk(pages):
+            # Batches hold whole sources so a checkpoint never splits one
+            docs: List[Dict] = []
+            batch_sources: Dict[str, Dict] = {}
+            merges: List[Dict] = []
+            for url, text in pages:
+                url_docs = TextProcessor.make_docs_from_text(url, text)
+                n_chunks = len(url_docs)
+                url_merges = []
+                if deduper is not None:
+                    url_docs, url_merges = self._drop_near_duplicates(
+                        url_docs, deduper, report, kept_urls)
+                logging.info(f"{url} → {n_chunks} chunks"
+                             + (f" ({len(url_merges)} near-duplicates merged)" if url_merges else ""))
+                docs.extend(url_docs)
+                merges.extend(url_merges)
+                batch_sources[url] = self._source_state(text, url_docs, url_merges,
+                                                        file_hashes.get(url))
+                if len(docs) >= INGEST_BATCH:
+                    yield docs, batch_sources, merges
+                    docs, batch_sources, merges = [], {}, []
+            if batch_sources:
+                yield docs, batch_sources, merges
+
+        def embed(batches):
+            for docs, batch_sources, merges in batches:
+                vectors = self.embedder.encode([d["text"] for d in docs])
+                yield vectors, docs, batch_sources, merges
+
+        cache = self.embedder.cache
+        if cache is not None:
+            cache.reset_stats()
+        todo = [u for u in self.urls if u not in sources]
+        stages = StagePipeline([("fetch", fetch), ("clean", clean), ("text", to_text),
+                                ("chunk", chunk), ("embed", embed)], maxsize=INGEST_QUEUE_SIZE,
+                               profiler=profiler, sequential=profiler.trace_memory)
+        for vectors, docs, batch_sources, merges in stages.run(todo):
+            with profiler.phase("checkpoint", items=len(docs)):
+                checkpoint.append(vectors, docs, batch_sources, {"merges": merges})
+            with profiler.phase("add" if not train_first else "collect", items=len(docs)):
+                take(vectors, docs, batch_sources, merges)
+        self._log_embedding_cache()
+        logging.info(chunk_stats.format())
+        if deduper is not None:
+            with profiler.phase("dedup_report"):
+                self._save_dedup_report(report)
+
+        if train_first:
+            embeddings = np.concatenate([v for v, _ in held]) if held else None
+            all_docs = [d for _, docs in held for d in docs]
+            if not all_docs:
+                raise RuntimeError("No documents found to index")
+            with profiler.phase("train_add", items=len(all_docs)):
+                self.index.build(embeddings, all_docs)
+            with profiler.phase("recall_check"):
+                self._log_precision_report(embeddings)
+        else:
+            if not self.index.ntotal:
+                raise RuntimeError("No documents found to index")
+            if self.index.params.get("type") != "flat":
+                # Approximate search: report recall against the checkpointed
+                # vectors, streamed batch by batch from their memory maps
+                with profiler.phase("recall_check"):
+                    self._log_precision_report([v for v, _, _, _ in checkpoint.load()])
+        self.index.params["chunking"] = chunking_config()
+        self.index.params["dedup"] = dedup_config()
+        self.index.save(profiler)
+        with profiler.phase("sources", items=len(sources)):
+            self._save_sources(sources)
+        checkpoint.clear()
+
+    def _checkpoint_fingerprint(self) -> Dict:
+        """Settings a checkpointed batch depends on"""
+        return {
+            "embedding_backend": self.embedder.backend_id,
+            "sources": text_hash("\n".join(sorted(self.urls))),
+            "index": {"type": self.index.index_type, **self.index.build_params},
+            "chunking": chunking_config(),
+            "dedup": dedup_config(),
+        }
+
+    @staticmethod
+    def _drop_near_duplicates(docs: List[Dict], deduper: NearDupIndex, report: DedupReport,
+                              kept_urls: Dict[str, str]) -> Tuple[List[Dict], List[Dict]]:
+        """Split a source's chunks into new ones and merges into already kept chunks"""
+        kept, merges = [], []
+        for d in docs:
+            report.checked += 1
+            dup_of, similarity = deduper.add(d["id"], d["text"])
+            if dup_of is None:
+                kept.append(d)
+                kept_urls[d["id"]] = d["url"]
+            else:
+                merges.append(report.record(dup_of, kept_urls[dup_of], d, similarity))
+        return kept, merges
+
+    def _save_dedup_report(self, report: DedupReport):
+        logging.info(report.format())
+        path = self.index_dir / DEDUP_REPORT_PATH.name
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def _shares_merged_chunks(self, state: Dict) -> bool:
+        """Whether a source's chunks were merged into, or absorbed, other chunks"""
+        if state.get("merged"):
+            return True
+        for cid in state["chunks"]:
+            m = self.index.metadata.get(chunk_int_id(cid))
+            if m is not None and len(source_urls(m)) > 1:
+                return True
+        return False
+
+    def _ingest_incremental(self, profiler: IngestProfiler = None) -> bool:
+        """Re-process changed sources and patch only the affected vectors
+
+        Returns False without touching the index when a changed or dropped
+        source shares merged near-duplicate chunks with other sources; the
+        merges can only be redone by a full build.
+        """
+        profiler = profiler or IngestProfiler()
+        old_sources = self._load_sources()
+        sources: Dict[str, Dict] = {}
+        to_add: List[Dict] = []
+        to_remove: List[str] = []
+        unchanged = 0
+        chunk_stats = ChunkStats()
+
+        with profiler.phase("extract", items=len(self.urls)):
+            texts, file_hashes = self._extract_changed(old_sources)
         for url in self.urls:
-            docs = TextProcessor.make_docs_from_url(url)
-            logging.info(f"{url} → {len(docs)} chunks")
-            all_docs.extend(docs)
+            old = old_sources.get(url)
+            text = texts[url]
+            if text is None:  # corpus file with unchanged bytes
+                sources[url] = old
+                unchanged += 1
+                continue
+            if isinstance(text, Exception):
+                if is_local_source(url):
+                    log_parse_failure(url, text)
+                elif old is None:
+                    raise text
+                else:
+                    logging.warning(f"{url}: fetch failed, keeping indexed copy ({text})")
+                if old is not None:
+                    sources[url] = old
+                continue
 
-        if not all_docs:
-            raise RuntimeError("No documents found to index")
+            if old is not None and old["hash"] == text_hash(text):
+                sources[url] = dict(old, file_hash=file_hashes[url]) if url in file_hashes else old
+                unchanged += 1
+                continue
 
-        embeddings = self.embedder.encode([d["text"] for d in all_docs])
-        self.index.build(embeddings, all_docs)
-        self.index.save()
+            if old is not None and DEDUP_MODE != "off" and self._shares_merged_chunks(old):
+                return False
+            with profiler.phase("chunk") as st:
+                docs = TextProcessor.make_docs_from_text(url, text)
+                st.items_in += 1
+                st.items_out += len(docs)
+            chunk_stats.add(url, [d["text"] for d in docs])
+            state = self._source_state(text, docs, file_digest=file_hashes.get(url))
+            old_chunks = old["chunks"] if old else {}
+            new_chunks = state["chunks"]
+            to_remove.extend(
+                cid for cid, h in old_chunks.items() if new_chunks.get(cid) != h)
+            added = [d for d in docs if old_chunks.get(d["id"]) != new_chunks[d["id"]]]
+            to_add.extend(added)
+            sources[url] = state
+            logging.info(
+                f"{url} changed → {len(added)} new/updated chunks of {len(docs)}")
+
+        for url, old in old_sources.items():
+            if url not in sources:
+                if DEDUP_MODE != "off" and self._shares_merged_chunks(old):
+                    return False
+                logging.info(f"{url} no longer configured → dropping {len(old['chunks'])} chunks")
+                to_remove.extend(old["chunks"].keys())
+
+        absorbed = 0
+        if to_add and DEDUP_MODE != "off":
+            with profiler.phase("dedup", items=len(to_add)):
+                to_add, absorbed = self._dedup_against_index(to_add, set(to_remove), sources)
+
+        if not to_add and not to_remove and not absorbed:
+            logging.info(f"Index up to date ({unchanged} sources unchanged).")
+            self._save_sources(sources)
+            return True
+
+        if chunk_stats.per_source:
+            logging.info(f"Re-chunked sources—{chunk_stats.format()}")
+        with profiler.phase("remove", items=len(to_remove)):
+            removed = self.index.remove(to_remove)
+        if to_add:
+            with profiler.phase("embed", items=len(to_add)):
+                embeddings = self._embed_docs(to_add)
+            with profiler.phase("add", items=len(to_add)):
+                self.index.add(embeddings, to_add)
+        self.index.save(profiler)
+        with profiler.phase("sources", items=len(sources)):
+            self._save_sources(sources)
+        logging.info(
+            f"Incremental ingest: {unchanged} sources unchanged, "
+            f"{removed} vectors removed, {len(to_add)} added, {self.index.ntotal} total")
+        return True
+
+    def _extract_changed(self, old_sources: Dict[str, Dict]
+                         ) -> Tuple[Dict[str, Union[str, Exception, None]], Dict[str, str]]:
+        """Text of every source, None for corpus files whose bytes are unchanged
+
+        Web sources are fetched (conditional requests keep unchanged pages
+        cheap); corpus files are hashed first and only changed ones are
+        parsed, in the process pool. Also returns the new file hashes.
+        """
+        texts: Dict[str, Union[str, Exception, None]] = {}
+        file_hashes: Dict[str, str] = {}
+        to_parse = []
+        for url in self.urls:
+            if not is_local_source(url):
+                continue
+            old = old_sources.get(url)
+            try:
+                if old is not None and old.get("file_hash") == file_hash(source_path(url)):
+                    texts[url] = None
+                    continue
+            except OSError as e:
+                texts[url] = e
+                continue
+            to_parse.append(url)
+
+        with CorpusParser(TextProcessor.html_page_to_text, CORPUS_WORKERS) as parser:
+            for url, parsed in parser.parse_all(to_parse).items():
+                if isinstance(parsed, Exception):
+                    texts[url] = parsed
+                else:
+                    texts[url], file_hashes[url] = parsed
+        if to_parse:
+            logging.info(f"Parsed {len(to_parse)} changed corpus files "
+                         f"({len(texts) - len(to_parse)} unchanged)")
+        texts.update(TextProcessor.extract_texts([u for u in self.urls if not is_local_source(u)]))
+        return texts, file_hashes
+
+    def _dedup_against_index(self, to_add: List[Dict], removing: set,
+                             sources: Dict[str, Dict]) -> Tuple[List[Dict], int]:
+        """Drop new chunks that near-duplicate indexed (or other new) chunks
+
+        Returns the chunks to embed and how many were merged into indexed ones.
+        """
+        deduper = NearDupIndex(DEDUP_THRESHOLD)
+        kept_urls: Dict[str, str] = {}
+        for m in self.index.metadata.values():
+            if m["id"] not in removing:
+                deduper.insert(m["id"], deduper.signature(m["text"]))
+                kept_urls[m["id"]] = m["url"]
+        report = DedupReport(DEDUP_THRESHOLD)
+        kept, merges = self._drop_near_duplicates(to_add, deduper, report, kept_urls)
+        new_by_id = {d["id"]: d for d in kept}
+        absorbed = 0
+        for m in merges:
+            state = sources[m["dropped_url"]]
+            state["chunks"].pop(m["dropped_id"], None)
+            state.setdefault("merged", {})[m["dropped_id"]] = m["kept_id"]
+            target = new_by_id.get(m["kept_id"])
+            if target is None:
+                self.index.add_source_url(m["kept_id"], m["dropped_url"])
+                absorbed += 1
+            elif m["dropped_url"] not in source_urls(target):
+                target["urls"] = source_urls(target) + [m["dropped_url"]]
+        if merges:
+            logging.info(report.format())
+        return kept, absorbed
+
+    def _log_precision_report(self, embeddings: Union[np.ndarray, List[np.ndarray]]):
+        """Print the memory / recall trade-off of the index just built"""
+        r = self.index.precision_report(embeddings)
+        recall_keys = [k for k in r if k.startswith("recall@")]
+        recalls = ", ".join(f"{k} {r[k]:.3f}" for k in recall_keys)
+        logging.info(
+            f"Vector storage {r['vector_dtype']} ({r['index_type']}): "
+            f"{r['index_mb']:.1f} MB index vs {r['float32_mb']:.1f} MB float32 "
+            f"({r['compression']:.1f}x) | {recalls} vs exact search")
+
+    def _embed_docs(self, docs: List[Dict]) -> np.ndarray:
+        """Embed chunk texts, reporting embedding cache reuse"""
+        if self.embedder.cache is not None:
+            self.embedder.cache.reset_stats()
+        embeddings = self.embedder.encode([d["text"] for d in docs])
+        self._log_embedding_cache()
+        return embeddings
+
+    def _log_embedding_cache(self):
+        cache = self.embedder.cache
+        if cache is not None:
+            st = cache.stats()
+            logging.info(
+                f"Embedding cache: {st['hits']} hits, {st['misses']} misses "
+                f"({st['hit_ratio']:.0%} reused, {st['entries']} entries)")
+
+    @staticmethod
+    def _source_state(text: str, docs: List[Dict], merges: List[Dict] = None,
+                      file_digest: str = None) -> Dict:
+        state = {
+            "hash": text_hash(text),
+            "chunks": {d["id"]: chunk_hash(d) for d in docs},
+        }
+        if file_digest:
+            # Corpus files: hash of the raw bytes, checked before parsing
+            state["file_hash"] = file_digest
+        if merges:
+            # Dropped near-duplicate chunk id -> the chunk it was merged into
+            state["merged"] = {m["dropped_id"]: m["kept_id"] for m in merges}
+        return state
+
+    def _load_sources(self) -> Dict[str, Dict]:
+        with open(self.sources_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_sources(self, sources: Dict[str, Dict]):
+        tmp = self.sources_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(sources, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.sources_path)
+
+    def select_context(self, retrieved: List[Tuple[float, Dict]],
+                       max_tokens: int = None) -> List[Tuple[float, Dict]]:
+        """The context blocks for a prompt, within a token budget
+
+        Hits are taken in maximal-marginal-relevance order over their stored
+        vectors (near-repeats of a taken hit are skipped), consecutive chunks
+        of a section are merged so their overlap is sent once, and a hit is
+        only added if the merged blocks still fit max_tokens.
+        """
+        max_tokens = CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+        if not retrieved:
+            return []
+        vectors = None
+        if len(retrieved) > 1:
+            vectors = self.index.reconstruct([chunk_int_id(m["id"]) for _, m in retrieved])
+        if vectors is not None:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        order = mmr_order([score for score, _ in retrieved], vectors,
+                          CONTEXT_MMR_LAMBDA, CONTEXT_REDUNDANCY)
+
+        token_counts: Dict[str, int] = {}
+
+        def cost(blocks: List[Tuple[float, Dict]]) -> int:
+            total = 0
+            for block in blocks:
+                text = self._format_block(block)
+                if text not in token_counts:
+                    token_counts[text] = count_tokens(text)
+                total += token_counts[text]
+            return total
+
+        taken: List[int] = []
+        blocks: List[Tuple[float, Dict]] = []
+        for i in order:
+            trial = merge_adjacent_chunks([retrieved[j] for j in taken + [i]])
+            # The best hit always goes in, even on its own over budget
+            if taken and cost(trial) > max_tokens:
+                continue
+            taken.append(i)
+            blocks = trial
+        logging.debug(f"Context: {len(blocks)} blocks from {len(taken)} of {len(retrieved)} hits, "
+                      f"{cost(blocks)} tokens")
+        return blocks
+
+    @staticmethod
+    def _format_block(block: Tuple[float, Dict]) -> str:
+        _, m = block
+        return f"[Source: {', '.join(source_urls(m))} | Section: {m.get('section', '')}]\n{m['text']}"
 
     def _build_prompt(self, query: str, retrieved: List[Tuple[float, Dict]]) -> str:
         """Build prompt for OpenAI with retrieved context"""
-        parts, total = [], 0
-        for score, m in retrieved:
-            block = f"\n[Source: {m['url']} | Section: {m.get('section', '')}] Score={score:.3f}\n{m['text']}\n"
-            if total + len(block) > MAX_CONTEXT_CHARS:
-                break
-            parts.append(block)
-            total += len(block)
-
-        context = "\n".join(parts).strip()
+        context = "\n\n".join(self._format_block(b) for b in self.select_context(retrieved))
         instructions = (
             "You are a legal assistant answering questions about Egypt's Labour Law 14/2025.\n"
             "Ground your answers ONLY in the context provided below (Arabic or English). If you're unsure, say so.\n"
@@ -340,93 +1934,375 @@ Answer (concise and specific):
 
     def retrieve(self, query: str) -> List[Tuple[float, Dict]]:
         """Retrieve relevant documents for a query"""
-        q_emb = self.embedder.encode([query])
-        return self.index.search(q_emb, top_k=TOP_K)
+        q_emb = self._embed_query(query)
+        return self._retrieve_hits(query, q_emb, StageTimer())
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Tuple[float, Dict]]]:
+        """Retrieve for many queries with one embeddings call and one search"""
+        if not queries:
+            return []
+        q_embs = self._embed_queries(queries)
+        return [self._rerank(query, hits, StageTimer())
+                for query, hits in zip(queries, self._search(queries, q_embs, top_k=self._fetch_k))]
+
+    @property
+    def _fetch_k(self) -> int:
+        """Hits to retrieve: the reranker's candidates, else TOP_K"""
+        return max(RERANK_CANDIDATES, RERANK_TOP_K) if self.reranker is not None else TOP_K
+
+    def _retrieve_hits(self, query: str, q_emb: np.ndarray, timer: StageTimer) -> List[Tuple[float, Dict]]:
+        """Search (over-fetching for the reranker) and rerank"""
+        with timer.stage("search"):
+            hits = self._search([query], q_emb, top_k=self._fetch_k)[0]
+        return self._rerank(query, hits, timer)
+
+    def _rerank(self, query: str, hits: List[Tuple[float, Dict]],
+                timer: StageTimer) -> List[Tuple[float, Dict]]:
+        """The best RERANK_TOP_K hits by the reranker (hits as-is without one)"""
+        if self.reranker is None or not hits:
+            return hits
+        with timer.stage("rerank"):
+            hits, info = self.reranker.rerank(query, hits, RERANK_TOP_K, RERANK_BUDGET_MS / 1000)
+        if info["over_budget"]:
+            logging.debug(f"Rerank budget spent after {info['scored']} of {info['candidates']} candidates")
+        return hits
+
+    def _search(self, queries: List[str], q_embs: np.ndarray, top_k: int) -> List[List[Tuple[float, Dict]]]:
+        """Dense search, fused with BM25 when hybrid retrieval is enabled
+
+        Hits are ordered by the fused rank but keep their cosine similarity
+        as the score, so confidence thresholds mean the same in both modes.
+        """
+        lexical = self.index.lexical
+        if HYBRID_MODE == "off" or lexical is None or not len(lexical):
+            return self.index.search_batch(q_embs, top_k=top_k)
+
+        D, I = self.index.search_ids(q_embs, max(top_k, HYBRID_CANDIDATES))
+        results = []
+        for query, q_emb, scores, ids in zip(queries, q_embs, D, I):
+            dense = [(float(sc), int(i)) for sc, i in zip(scores, ids) if i != -1]
+            fused = fuse_rankings(
+                dense, lexical.search(query, HYBRID_CANDIDATES), HYBRID_MODE, top_k)
+
+            cosine = {i: sc for sc, i in dense}
+            lexical_only = [i for i in fused if i not in cosine]
+            if lexical_only:
+                vecs = self.index.reconstruct(lexical_only)
+                floor = dense[-1][0] if dense else 0.0
+                for j, i in enumerate(lexical_only):
+                    cosine[i] = float(vecs[j] @ q_emb) if vecs is not None else floor
+            results.append([(cosine[i], self.index.metadata[i]) for i in fused])
+        return results
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query, served from the query cache when possible"""
+        return self._embed_queries([query])
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries, sending only query-cache misses to the embedder"""
+        out, missing = self._cached_queries(queries)
+        if missing:
+            # One request for every distinct uncached query
+            texts = [queries[rows[0]] for rows in missing.values()]
+            self._fill_queries(out, texts, self.embedder.encode(texts, use_cache=False), missing)
+        return out
+
+    async def _aembed_queries(self, queries: List[str]) -> np.ndarray:
+        """_embed_queries() with the embedder's async path"""
+        out, missing = self._cached_queries(queries)
+        if missing:
+            texts = [queries[rows[0]] for rows in missing.values()]
+            self._fill_queries(out, texts, await self.embedder.aencode(texts), missing)
+        return out
+
+    def _cached_queries(self, queries: List[str]) -> Tuple[np.ndarray, Dict[str, List[int]]]:
+        """(embeddings with query-cache hits filled in, normalized miss -> rows)"""
+        out = np.empty((len(queries), self.index.dim), dtype=np.float32)
+        missing: Dict[str, List[int]] = {}
+        for i, q in enumerate(queries):
+            cached = self.query_cache.get(q) if self.query_cache is not None else None
+            if cached is not None:
+                out[i] = cached[0]
+            else:
+                missing.setdefault(normalize_query(q), []).append(i)
+        return out, missing
+
+    def _fill_queries(self, out: np.ndarray, texts: List[str], fresh: np.ndarray,
+                      missing: Dict[str, List[int]]):
+        for text, vec, rows in zip(texts, fresh, missing.values()):
+            out[rows] = vec
+            if self.query_cache is not None:
+                self.query_cache.put(text, vec)
+
+    def stats(self) -> Dict:
+        """Runtime cache statistics"""
+        out = {}
+        if self.query_cache is not None:
+            out["query_cache"] = self.query_cache.stats()
+        if self.answer_cache is not None:
+            out["answer_cache"] = self.answer_cache.stats()
+        if self.embedder.cache is not None:
+            out["embedding_cache"] = self.embedder.cache.stats()
+        out["latency_ms"] = self.latency.stats()
+        return out
 
     def answer(self, query: str) -> Dict:
-        """Generate answer for a query using RAG"""
-        hits = self.retrieve(query)
+        """Generate answer for a query using RAG
+
+        The result's "timings" holds the milliseconds spent in each stage
+        (embed, search, rerank, prompt, generate) and in total.
+        """
+        timer = StageTimer()
+        with timer.stage("embed"):
+            q_emb = self._embed_query(query)
+        cached = self._cached_answer(query, q_emb)
+        if cached is not None:
+            return self._timed(cached, timer)
+
+        hits = self._retrieve_hits(query, q_emb, timer)
+        if not hits:
+            return self._timed(self._no_context_result(query), timer)
+
+        with timer.stage("prompt"):
+            prompt = self._build_prompt(query, hits)
+        with timer.stage("generate"):
+            text, tokens = self.generator.generate_with_usage(prompt)
+        return self._timed(self._finish_answer(query, q_emb, hits, text, tokens), timer)
+
+    async def answer_async(self, query: str) -> Dict:
+        """answer() for the async serving mode
+
+        The embeddings and completion calls go through the async OpenAI
+        client (a local embedding model runs in a worker thread), and the
+        index search runs in a worker thread, so the event loop never blocks.
+        """
+        timer = StageTimer()
+        with timer.stage("embed"):
+            q_emb = await self._aembed_queries([query])
+        cached = self._cached_answer(query, q_emb)
+        if cached is not None:
+            return self._timed(cached, timer)
+
+        hits = await asyncio.to_thread(self._retrieve_hits, query, q_emb, timer)
         if not hits:
-            return {
-                "query": query,
-                "answer": "I couldn't find relevant information to answer your question about Egypt's Labour Law.",
-                "retrieved": [],
-                "confidence": 0.0
-            }
+            return self._timed(self._no_context_result(query), timer)
 
-        prompt = self._build_prompt(query, hits)
-        text = self.generator.generate(prompt)
+        with timer.stage("prompt"):
+            prompt = self._build_prompt(query, hits)
+        with timer.stage("generate"):
+            text, tokens = await self.generator.agenerate_with_usage(prompt)
+        return self._timed(self._finish_answer(query, q_emb, hits, text, tokens), timer)
 
-        # Calculate confidence based on top retrieval score
-        confidence = hits[0][0] if hits else 0.0
+    def _cached_answer(self, query: str, q_emb: np.ndarray) -> Optional[Dict]:
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.lookup(q_emb, self.index.version)
+        return {**cached, "query": query} if cached is not None else None
 
+    @staticmethod
+    def _no_context_result(query: str) -> Dict:
         return {
+            "query": query,
+            "answer": NO_CONTEXT_ANSWER,
+            "retrieved": [],
+            "confidence": 0.0
+        }
+
+    def _timed(self, result: Dict, timer: StageTimer) -> Dict:
+        """result with the answer's stage timings (recorded in stats())
+
+        A copy: the answer cache may hold result itself.
+        """
+        timings = timer.report()
+        self.latency.record(timings)
+        return {**result, "timings": timings}
+
+    def _finish_answer(self, query: str, q_emb: np.ndarray, hits: List[Tuple[float, Dict]],
+                       text: str, tokens: Optional[int]) -> Dict:
+        # Calculate confidence based on the best retrieval score (with hybrid
+        # fusion the first hit is not necessarily the most similar one)
+        confidence = max(score for score, _ in hits)
+
+        result = {
             "query": query,
             "answer": text,
             "retrieved": hits,
             "confidence": confidence
         }
+        # Failed generations (tokens == 0) must not be served again; None
+        # is a successful one whose usage was not reported
+        generated = tokens is None or tokens > 0
+        if self.answer_cache is not None and generated:
+            self.answer_cache.store(q_emb, result, tokens, self.index.version)
+        return result
+
+    def answer_stream(self, query: str) -> Iterator[Tuple[str, Any]]:
+        """answer() as events: ("sources", ...) right after retrieval, then
+        ("token", text) as the completion streams, then ("done", result)
+
+        The sources event carries "retrieved", "confidence" and "cache_hit";
+        the generation only starts when the event after it is requested, so
+        a caller that stops there (e.g. on low confidence) pays for no
+        completion. result is what answer() would have returned.
+        """
+        timer = StageTimer()
+        with timer.stage("embed"):
+            q_emb = self._embed_query(query)
+        cached = self._cached_answer(query, q_emb)
+        if cached is not None:
+            yield from self._replay_answer(self._timed(cached, timer), cache_hit=True)
+            return
 
+        hits = self._retrieve_hits(query, q_emb, timer)
+        if not hits:
+            yield from self._replay_answer(
+                self._timed(self._no_context_result(query), timer), cache_hit=False)
+            return
+        yield "sources", {"retrieved": hits, "confidence": max(score for score, _ in hits),
+                          "cache_hit": False}
 
-# Global RAG pipeline instance
-_rag_pipeline = None
-
+        parts = []
+        with timer.stage("prompt"):
+            prompt = self._build_prompt(query, hits)
+        stream = self.generator.stream(prompt)
+        try:
+            while True:
+                try:
+                    with timer.stage("generate"):
+                        delta = next(stream)
+                except StopIteration as stop:
+                    tokens = stop.value or 0
+                    break
+                if not parts:
+                    timer.mark("first_token")
+                parts.append(delta)
+                yield "token", delta
+        finally:
+            # Stops the completion when the caller goes away mid-answer
+            stream.close()
+        yield "done", self._timed(
+            self._finish_answer(query, q_emb, hits, "".join(parts).strip(), tokens), timer)
+
+    async def answer_stream_async(self, query: str) -> AsyncIterator[Tuple[str, Any]]:
+        """answer_stream() for the async serving mode (see answer_async())"""
+        timer = StageTimer()
+        with timer.stage("embed"):
+            q_emb = await self._aembed_queries([query])
+        cached = self._cached_answer(query, q_emb)
+        if cached is not None:
+            for event in self._replay_answer(self._timed(cached, timer), cache_hit=True):
+                yield event
+            return
 
-def get_rag_pipeline() -> RAGPipeline:
-    """Get or create the global RAG pipeline instance"""
-    global _rag_pipeline
-    if _rag_pipeline is None:
+        hits = await asyncio.to_thread(self._retrieve_hits, query, q_emb, timer)
+        if not hits:
+            for event in self._replay_answer(
+                    self._timed(self._no_context_result(query), timer), cache_hit=False):
+                yield event
+            return
+        yield "sources", {"retrieved": hits, "confidence": max(score for score, _ in hits),
+                          "cache_hit": False}
+
+        parts = []
+        usage: Dict = {}
+        with timer.stage("prompt"):
+            prompt = self._build_prompt(query, hits)
+        stream = self.generator.astream(prompt, usage)
         try:
-            embedder = Embedder()
-            index = FaissIndex(EMB_DIM, FAISS_PATH, META_PATH)
-            generator = AnswerGenerator()
-            _rag_pipeline = RAGPipeline(URLS, embedder, index, generator)
-            _rag_pipeline.ingest(force_rebuild=False)
-            logging.info("✅ RAG pipeline initialized successfully with OpenAI")
-        except Exception as e:
-            logging.error(f"❌ Failed to initialize RAG pipeline: {e}")
-            raise
-    return _rag_pipeline
-
-
-def answer_question(question: str) -> Dict:
-    """Answer a question using the RAG pipeline"""
-    try:
-        rag = get_rag_pipeline()
-        return rag.answer(question)
-    except Exception as e:
-        logging.error(f"Error answering question: {e}")
-        return {
-            "query": question,
-            "answer": "I apologize, but I'm having trouble processing your question right now. Please try again later.",
-            "retrieved": [],
-            "confidence": 0.0
-        }
+            while True:
+                try:
+                    with timer.stage("generate"):
+                        delta = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                if not parts:
+                    timer.mark("first_token")
+                parts.append(delta)
+                yield "token", delta
+        finally:
+            await stream.aclose()
+        yield "done", self._timed(
+            self._finish_answer(query, q_emb, hits, "".join(parts).strip(),
+                                usage.get("total_tokens", 0)), timer)
+
+    @staticmethod
+    def _replay_answer(result: Dict, cache_hit: bool) -> Iterator[Tuple[str, Any]]:
+        """A finished result as answer_stream() events"""
+        yield "sources", {"retrieved": result["retrieved"], "confidence": result["confidence"],
+                          "cache_hit": cache_hit}
+        yield "token", result["answer"]
+        yield "done", result
+
+
+def configured_sources(corpus_dir: str = None, web: bool = None) -> List[str]:
+    """Web URLS (unless disabled) followed by every corpus file"""
+    corpus_dir = CORPUS_DIR if corpus_dir is None else corpus_dir
+    web = WEB_SOURCES if web is None else web
+    sources = list(URLS) if web else []
+    if corpus_dir:
+        files = scan_corpus(corpus_dir)
+        logging.info(f"Corpus {corpus_dir}: {len(files)} files")
+        sources.extend(files)
+    return sources
+
+
+def active_index_dir() -> pathlib.Path:
+    """Directory of the served index: the CURRENT version, else INDEX_DIR itself"""
+    name = current_version(INDEX_DIR)
+    return version_dir(INDEX_DIR, name) if name else INDEX_DIR
+
+
+def build_pipeline(sources: List[str] = None, index_dir: pathlib.Path = None,
+                   reuse: RAGPipeline = None) -> RAGPipeline:
+    """Wire up a pipeline from the module configuration (without ingesting)
+
+    With reuse, the embedder, generator and caches of that pipeline are
+    shared instead of created (the answer cache is keyed on the index
+    version, so entries of another index never hit).
+    """
+    index_dir = active_index_dir() if index_dir is None else pathlib.Path(index_dir)
+    if reuse is not None:
+        embedder, generator = reuse.embedder, reuse.generator
+        query_cache, answer_cache = reuse.query_cache, reuse.answer_cache
+        reranker = reuse.reranker
+    else:
+        embedder = make_embedder(cache=open_embedding_cache(EMB_CACHE_PATH))
+        generator = AnswerGenerator()
+        query_cache = QueryEmbeddingCache(
+            embedder.dim, capacity=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+        answer_cache = SemanticAnswerCache(
+            embedder.dim, capacity=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD,
+            ttl_seconds=ANSWER_CACHE_TTL)
+        reranker = make_reranker(RERANK_MODE, RERANK_MODEL, batch_size=RERANK_BATCH,
+                                 threads=LOCAL_EMB_THREADS)
+    index = FaissIndex(embedder.dim, index_dir / FAISS_PATH.name, index_dir / META_PATH.name,
+                       backend_id=embedder.backend_id)
+    return RAGPipeline(configured_sources() if sources is None else sources,
+                       embedder, index, generator,
+                       query_cache=query_cache, answer_cache=answer_cache, reranker=reranker)
+
+
+# The served pipeline, index versions and command line moved to rag_service;
+# these names still resolve here for code that imports them from rag_pipeline
+# (looked up on first use, since rag_service imports this module)
+_MOVED_TO_RAG_SERVICE = frozenset({
+    "INDEX_KEEP_VERSIONS", "REBUILD_PROBE_QUERY",
+    "answer_question", "answer_question_stream", "answer_question_async",
+    "answer_question_stream_async", "get_rag_pipeline",
+    "build_snapshot", "load_snapshot", "open_pipeline", "validate_pipeline",
+    "snapshot_requirements", "list_snapshots", "profile_ingest",
+    "start_rebuild", "rebuild_status", "rollback", "main",
+})
+
+
+def __getattr__(name: str):
+    if name in _MOVED_TO_RAG_SERVICE:
+        import rag_service
+        return getattr(rag_service, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
-    # Test the RAG pipeline
-    print("🧪 Testing RAG Pipeline...")
-
-    test_questions = [
-        "What are the key changes in Egypt's Labour Law 14/2025?",
-        "What are the rules for maternity leave in Egypt?",
-        "What are the working hours regulations?"
-    ]
-
-    for question in test_questions:
-        print(f"\n{'='*80}")
-        print(f"Q: {question}")
-        print("-" * 80)
-
-        result = answer_question(question)
-        print(f"A: {result['answer']}")
-        print(f"Confidence: {result['confidence']:.3f}")
-
-        if result['retrieved']:
-            print("\nTop sources:")
-            for score, doc in result['retrieved'][:3]:
-                print(
-                    f"  - {doc['url']} | {doc.get('section', 'N/A')} | Score: {score:.3f}")
-
-        print("=" * 80)
+    # The command line drives the index versions, so it lives in rag_service
+    from rag_service import main
+    main(sys.argv[1:])
@@ -0,0 +1,493 @@
+"""
+Index lifecycle and the served RAG pipeline
+Builds, validates, publishes and rolls back index versions (snapshots
+under INDEX_DIR/versions), holds the pipeline the chatbot services answer
+with, rebuilds it in the background and hot-swaps it, and provides the
+answer_question* helpers the services call
+
+Run as a script for the command line (build, list, verify, roll back,
+profile): python rag_service.py --help
+"""
+
+import os
+import gc
+import sys
+import time
+import uuid
+import shutil
+import asyncio
+import argparse
+import logging
+import threading
+import weakref
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+
+from index_versions import (LEGACY_VERSION, SnapshotError, check_snapshot, copy_index_files,
+                            current_version, list_versions, new_version_name, prune_versions,
+                            set_current_version, verify_checksums, version_dir, write_manifest)
+from ingest_profile import IngestProfiler
+from rag_pipeline import (INDEX_DIR, INGEST_CHECKPOINT_DIR, INGEST_PROFILE_PATH, BaseEmbedder,
+                          IndexMismatchError, RAGPipeline, active_index_dir, build_pipeline,
+                          configured_sources, source_urls)
+
+# Background rebuilds write INDEX_DIR/versions/<name>; older versions kept
+# for rollback, and the query a new version must answer before it is served
+INDEX_KEEP_VERSIONS = int(os.getenv("RAG_INDEX_KEEP_VERSIONS", "3"))
+REBUILD_PROBE_QUERY = os.getenv("RAG_REBUILD_PROBE_QUERY", "What are the working hours regulations?")
+
+
+def validate_pipeline(rag: RAGPipeline):
+    """Raise unless the pipeline's index is complete and answers a probe query"""
+    index = rag.index
+    if not index.ntotal:
+        raise RuntimeError("New index is empty")
+    if index.ntotal != len(index.metadata):
+        raise RuntimeError(
+            f"New index has {index.ntotal} vectors but {len(index.metadata)} chunks")
+    if index.index.d != rag.embedder.dim:
+        raise RuntimeError(f"New index dimension {index.index.d} != embedder {rag.embedder.dim}")
+    if not rag.retrieve(REBUILD_PROBE_QUERY):
+        raise RuntimeError(f"New index returned nothing for {REBUILD_PROBE_QUERY!r}")
+
+
+def snapshot_requirements(embedder: BaseEmbedder) -> Dict:
+    """Manifest fields a snapshot must match to be served with this embedder"""
+    return {"embedding_backend": embedder.backend_id, "dim": embedder.dim}
+
+
+def build_snapshot(sources: List[str] = None, incremental: bool = False, resume: bool = True,
+                   reuse: RAGPipeline = None, name: str = None,
+                   on_pipeline: Callable[[RAGPipeline], None] = None) -> RAGPipeline:
+    """Build a new index version, seal it with a manifest and make it CURRENT
+
+    An incremental build starts from a copy of the served index; the served
+    version's files are never written. on_pipeline(rag) is called once the
+    pipeline being built exists (for progress reporting). A failed build
+    leaves no directory behind.
+    """
+    name = name or new_version_name()
+    new_dir = version_dir(INDEX_DIR, name)
+    try:
+        if incremental:
+            copy_index_files(reuse.index_dir if reuse is not None else active_index_dir(), new_dir)
+        new_dir.mkdir(parents=True, exist_ok=True)
+        rag = build_pipeline(sources, index_dir=new_dir, reuse=reuse)
+        if on_pipeline is not None:
+            on_pipeline(rag)
+        rag.ingest(force_rebuild=not incremental, incremental=incremental, resume=resume)
+        validate_pipeline(rag)
+        write_manifest(new_dir, {
+            **snapshot_requirements(rag.embedder),
+            "index_type": rag.index.params.get("type"),
+            "vector_dtype": rag.index.params.get("vector_dtype", "float32"),
+            "chunking": rag.index.params.get("chunking"),
+            "dedup": rag.index.params.get("dedup"),
+            "vectors": rag.index.ntotal,
+            "sources": len(rag._load_sources()) if rag.sources_path.exists() else 0,
+        })
+    except BaseException:
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise
+    set_current_version(INDEX_DIR, name)
+    logging.info(f"Index version {name} is CURRENT ({rag.index.ntotal} vectors)")
+    # Keep whatever is still being served or drained
+    protect = _draining_versions() + ([_version_name(reuse)] if reuse is not None else [])
+    removed = prune_versions(INDEX_DIR, INDEX_KEEP_VERSIONS, protect=protect)
+    if removed:
+        logging.info(f"Removed old index versions: {', '.join(removed)}")
+    return rag
+
+
+def profile_ingest(sources: List[str] = None) -> IngestProfiler:
+    """Full build into a scratch directory, only to measure it
+
+    Stages run one after another with allocation tracing, so each gets its
+    own memory peak (wall times are therefore a little higher than in a
+    normal overlapped build). Nothing is published: the scratch index and
+    its checkpoint are removed and only the report is kept, in
+    INGEST_PROFILE_PATH. The embedding and HTML caches are used as usual.
+    """
+    scratch = INDEX_DIR / f".profile-{uuid.uuid4().hex[:8]}"
+    profiler = IngestProfiler(trace_memory=True)
+    try:
+        scratch.mkdir(parents=True)
+        rag = build_pipeline(sources, index_dir=scratch)
+        rag.checkpoint_dir = scratch / INGEST_CHECKPOINT_DIR.name
+        rag.ingest(force_rebuild=True, resume=False, profiler=profiler)
+        shutil.copy2(rag.profile_path, INGEST_PROFILE_PATH)
+    finally:
+        profiler.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return profiler
+
+
+def load_snapshot(name: str, reuse: RAGPipeline = None) -> RAGPipeline:
+    """Open an index version after checking it against its manifest (no hashing)"""
+    rag = build_pipeline(index_dir=version_dir(INDEX_DIR, name), reuse=reuse)
+    manifest = check_snapshot(rag.index_dir, snapshot_requirements(rag.embedder))
+    rag.index.load()
+    if rag.index.ntotal != manifest["vectors"]:
+        raise SnapshotError(
+            f"{name}: {rag.index.ntotal} vectors loaded, manifest says {manifest['vectors']}")
+    return rag
+
+
+def open_pipeline() -> RAGPipeline:
+    """The CURRENT index version, validated; builds a first version if there is none
+
+    A CURRENT version that fails validation (altered files, another
+    embedding model) is refused and a new version is built in its place.
+    Index roots from before snapshots are served as they are.
+    """
+    name = current_version(INDEX_DIR)
+    if name:
+        try:
+            return load_snapshot(name)
+        except (SnapshotError, IndexMismatchError) as e:
+            logging.warning(f"Refusing index version {e}—building a new one.")
+    else:
+        rag = build_pipeline(index_dir=INDEX_DIR)
+        if rag.index.exists():
+            logging.info(f"Serving the legacy index in {INDEX_DIR} (no snapshot manifest).")
+            try:
+                rag.index.load()
+                return rag
+            except IndexMismatchError as e:
+                logging.warning(f"{e}—building a new index version.")
+    return build_snapshot()
+
+
+def list_snapshots() -> List[Dict]:
+    """Every index version on disk with its manifest summary, oldest first"""
+    current = current_version(INDEX_DIR)
+    out = []
+    for name in list_versions(INDEX_DIR):
+        entry = {"version": name, "current": name == current}
+        try:
+            manifest = check_snapshot(version_dir(INDEX_DIR, name))
+            entry.update(valid=True, created_at=manifest.get("created_at"),
+                         vectors=manifest.get("vectors"),
+                         embedding_backend=manifest.get("embedding_backend"))
+        except SnapshotError as e:
+            entry.update(valid=False, problem=str(e))
+        out.append(entry)
+    return out
+
+
+# Global RAG pipeline instance
+_rag_pipeline = None
+_pipeline_lock = threading.RLock()  # re-entered when the first build prunes versions
+# Background rebuild state (see start_rebuild)
+_rebuild_thread: threading.Thread = None
+_rebuild_status: Dict = {"state": "idle"}
+_building: RAGPipeline = None
+# (version name, weak reference) of pipelines swapped out while requests may
+# still hold them; the reference dies once the last of those requests ends
+_retired: List[Tuple[str, "weakref.ref"]] = []
+
+
+def get_rag_pipeline() -> RAGPipeline:
+    """Get or create the global RAG pipeline instance
+
+    Callers keep the returned object for the whole request, so a request
+    that started before a hot swap finishes on the index it started with.
+    """
+    global _rag_pipeline
+    rag = _rag_pipeline
+    if rag is not None:
+        return rag
+    with _pipeline_lock:
+        if _rag_pipeline is None:
+            try:
+                rag = open_pipeline()
+                logging.info(
+                    f"✅ RAG pipeline initialized successfully ({rag.embedder.backend_id})")
+            except Exception as e:
+                logging.error(f"❌ Failed to initialize RAG pipeline: {e}")
+                raise
+            _rag_pipeline = rag
+        return _rag_pipeline
+
+
+def _set_rebuild_status(**fields):
+    with _pipeline_lock:
+        _rebuild_status.update(fields)
+
+
+def _version_name(rag: RAGPipeline) -> str:
+    return rag.index_dir.name if rag.index_dir != INDEX_DIR else LEGACY_VERSION
+
+
+def _swap_pipeline(rag: RAGPipeline):
+    """Serve rag from now on and retire the previous pipeline"""
+    global _rag_pipeline
+    with _pipeline_lock:
+        old, _rag_pipeline = _rag_pipeline, rag
+        if old is not None:
+            _retired.append((_version_name(old), weakref.ref(old)))
+    del old
+    # Free the old index now if no request holds it (reference cycles included)
+    gc.collect()
+
+
+def _draining_versions() -> List[str]:
+    """Retired versions some in-flight request still holds"""
+    with _pipeline_lock:
+        _retired[:] = [(n, ref) for n, ref in _retired if ref() is not None]
+        return [n for n, _ in _retired]
+
+
+def _run_rebuild(name: str, incremental: bool):
+    global _building
+    started = time.perf_counter()
+
+    def building(rag: RAGPipeline):
+        global _building
+        _building = rag
+        _set_rebuild_status(stage="ingesting")
+
+    try:
+        _set_rebuild_status(stage="copying" if incremental else "starting")
+        rag = build_snapshot(incremental=incremental, reuse=_rag_pipeline, name=name,
+                             on_pipeline=building)
+        _set_rebuild_status(stage="swapping")
+        _swap_pipeline(rag)
+        logging.info(f"✅ Index version {name} is live ({rag.index.ntotal} vectors, "
+                     f"{time.perf_counter() - started:.1f}s)")
+        _set_rebuild_status(state="succeeded", stage="done", vectors=rag.index.ntotal)
+    except Exception as e:
+        logging.error(f"❌ Index rebuild {name} failed, still serving the previous index: {e}")
+        _set_rebuild_status(state="failed", error=str(e))
+    finally:
+        _building = None
+        _set_rebuild_status(finished_at=time.time(),
+                            elapsed_seconds=round(time.perf_counter() - started, 2))
+
+
+def start_rebuild(incremental: bool = True) -> Tuple[bool, Dict]:
+    """Rebuild the index into a new version in a background thread
+
+    The running pipeline keeps serving until the new version validates;
+    then the global pipeline is swapped. Returns (started, status); False
+    when a rebuild is already running.
+    """
+    global _rebuild_thread
+    with _pipeline_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            started = False
+        else:
+            name = new_version_name()
+            _rebuild_status.clear()
+            _rebuild_status.update(state="running", stage="starting", version=name,
+                                   mode="incremental" if incremental else "full",
+                                   started_at=time.time())
+            _rebuild_thread = threading.Thread(
+                target=_run_rebuild, args=(name, incremental), name=f"rebuild-{name}", daemon=True)
+            _rebuild_thread.start()
+            started = True
+    return started, rebuild_status()
+
+
+def rebuild_status() -> Dict:
+    """Progress of the last background rebuild plus the served / draining versions"""
+    draining = _draining_versions()
+    with _pipeline_lock:
+        status = dict(_rebuild_status)
+        building = _building
+    if building is not None:
+        status["progress"] = dict(building.ingest_progress)
+    status["current_version"] = current_version(INDEX_DIR) or LEGACY_VERSION
+    status["draining_versions"] = draining
+    return status
+
+
+def rollback(name: str = None) -> str:
+    """Make an earlier index version CURRENT again; returns its name
+
+    Without a name, the newest valid version older than CURRENT. The
+    version is validated before CURRENT moves; in a running service the
+    global pipeline is hot-swapped to it as well.
+    """
+    current = current_version(INDEX_DIR)
+    if name is None:
+        names = list_versions(INDEX_DIR)
+        for candidate in reversed(names[:names.index(current)] if current in names else names):
+            try:
+                check_snapshot(version_dir(INDEX_DIR, candidate))
+            except SnapshotError as e:
+                logging.info(f"Skipping {e}")
+                continue
+            name = candidate
+            break
+        else:
+            raise SnapshotError("No earlier valid index version to roll back to")
+    if name == current:
+        return name
+    live = _rag_pipeline
+    rag = load_snapshot(name, reuse=live)
+    set_current_version(INDEX_DIR, name)
+    if live is not None:
+        _swap_pipeline(rag)
+    logging.info(f"Rolled back to index version {name} (was {current or LEGACY_VERSION})")
+    return name
+
+
+# What the answer_question* helpers return when the pipeline fails
+ERROR_ANSWER = ("I apologize, but I'm having trouble processing your question right now. "
+                "Please try again later.")
+
+
+def _error_result(question: str) -> Dict:
+    return {"query": question, "answer": ERROR_ANSWER, "retrieved": [], "confidence": 0.0}
+
+
+def _error_events(question: str, sent_sources: bool) -> List[Tuple[str, Any]]:
+    """_error_result() as the rest of an answer stream"""
+    events = [] if sent_sources else [
+        ("sources", {"retrieved": [], "confidence": 0.0, "cache_hit": False})]
+    return events + [("token", ERROR_ANSWER), ("done", _error_result(question))]
+
+
+def answer_question(question: str) -> Dict:
+    """Answer a question using the RAG pipeline"""
+    try:
+        rag = get_rag_pipeline()
+        return rag.answer(question)
+    except Exception as e:
+        logging.error(f"Error answering question: {e}")
+        return _error_result(question)
+
+
+def answer_question_stream(question: str) -> Iterator[Tuple[str, Any]]:
+    """answer_question() as RAGPipeline.answer_stream() events"""
+    sent_sources = False
+    try:
+        rag = get_rag_pipeline()
+        for event, payload in rag.answer_stream(question):
+            sent_sources = sent_sources or event == "sources"
+            yield event, payload
+    except Exception as e:
+        logging.error(f"Error answering question: {e}")
+        yield from _error_events(question, sent_sources)
+
+
+async def answer_question_async(question: str) -> Dict:
+    """answer_question() for the async serving mode"""
+    try:
+        rag = _rag_pipeline or await asyncio.to_thread(get_rag_pipeline)
+        return await rag.answer_async(question)
+    except Exception as e:
+        logging.error(f"Error answering question: {e}")
+        return _error_result(question)
+
+
+async def answer_question_stream_async(question: str) -> AsyncIterator[Tuple[str, Any]]:
+    """answer_question_stream() for the async serving mode"""
+    sent_sources = False
+    try:
+        rag = _rag_pipeline or await asyncio.to_thread(get_rag_pipeline)
+        async for event, payload in rag.answer_stream_async(question):
+            sent_sources = sent_sources or event == "sources"
+            yield event, payload
+    except Exception as e:
+        logging.error(f"Error answering question: {e}")
+        for event in _error_events(question, sent_sources):
+            yield event
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Egypt Labour Law RAG pipeline")
+    parser.add_argument("--ingest", action="store_true",
+                        help="build/update the index and exit")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="force a full rebuild (with --ingest)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-process changed sources (with --ingest)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="discard batches checkpointed by a failed build (with --ingest)")
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="also index the HTML/Markdown/text/PDF files under this directory")
+    parser.add_argument("--offline", action="store_true",
+                        help="leave out the web URLS (with --corpus: build without network access)")
+    parser.add_argument("--snapshots", action="store_true",
+                        help="list the index versions on disk and exit")
+    parser.add_argument("--rollback", nargs="?", const="", default=None, metavar="VERSION",
+                        help="make an earlier index version current (default: the previous one)")
+    parser.add_argument("--verify", nargs="?", const="", default=None, metavar="VERSION",
+                        help="re-hash an index version's files against its manifest")
+    parser.add_argument("--profile", action="store_true",
+                        help="time a full build stage by stage without publishing it "
+                             f"(report in {INGEST_PROFILE_PATH.name})")
+    args = parser.parse_args(argv)
+
+    if args.snapshots:
+        for snap in list_snapshots():
+            mark = "*" if snap["current"] else " "
+            if snap["valid"]:
+                print(f"{mark} {snap['version']}  {snap['vectors']} vectors  "
+                      f"{snap['embedding_backend']}  {snap['created_at']}")
+            else:
+                print(f"{mark} {snap['version']}  INVALID: {snap['problem']}")
+        return
+
+    if args.rollback is not None:
+        print(f"✅ Current index version: {rollback(args.rollback or None)}")
+        return
+
+    if args.verify is not None:
+        name = args.verify or current_version(INDEX_DIR)
+        if not name:
+            print(f"❌ No index version in {INDEX_DIR}")
+            sys.exit(1)
+        bad = verify_checksums(version_dir(INDEX_DIR, name))
+        if bad:
+            print(f"❌ {name}: checksum mismatch in {', '.join(bad)}")
+            sys.exit(1)
+        print(f"✅ {name}: all checksums match")
+        return
+
+    if args.profile:
+        # The table is logged by the ingest itself
+        profile_ingest(configured_sources(args.corpus, web=False if args.offline else None))
+        print(f"✅ Ingest profile written to {INGEST_PROFILE_PATH}")
+        return
+
+    if args.ingest:
+        if args.rebuild or args.incremental or not current_version(INDEX_DIR):
+            build_snapshot(configured_sources(args.corpus, web=False if args.offline else None),
+                           incremental=args.incremental and not args.rebuild,
+                           resume=not args.no_resume)
+        else:
+            load_snapshot(current_version(INDEX_DIR))
+            logging.info("Index version is valid—nothing to do (use --incremental or --rebuild).")
+        return
+
+    # Test the RAG pipeline
+    print("🧪 Testing RAG Pipeline...")
+
+    test_questions = [
+        "What are the key changes in Egypt's Labour Law 14/2025?",
+        "What are the rules for maternity leave in Egypt?",
+        "What are the working hours regulations?"
+    ]
+
+    for question in test_questions:
+        print(f"\n{'='*80}")
+        print(f"Q: {question}")
+        print("-" * 80)
+
+        result = answer_question(question)
+        print(f"A: {result['answer']}")
+        print(f"Confidence: {result['confidence']:.3f}")
+
+        if result['retrieved']:
+            print("\nTop sources:")
+            for score, doc in result['retrieved'][:3]:
+                print(
+                    f"  - {', '.join(source_urls(doc))} | {doc.get('section', 'N/A')} | Score: {score:.3f}")
+
+        print("=" * 80)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""
+Client-side rate limiting for the OpenAI APIs
+A token bucket per budget (requests/min and tokens/min), refilled
+continuously, shared by every thread that calls the API
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Optional
+
+
+class TokenBucketLimiter:
+    """Blocking limiter for a requests/min and a tokens/min budget (0 = unlimited)"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        # Buckets start full, so a short job runs at full speed
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until the request fits; takes it from the buckets when it already does"""
+        if self._paused_until > now:
+            return self._paused_until - now
+        short_requests = max(0.0, 1 - self._requests) if self.rpm else 0.0
+        short_tokens = max(0.0, tokens - self._tokens) if self.tpm else 0.0
+        if not short_requests and not short_tokens:
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            return 0.0
+        return max(short_requests * 60.0 / self.rpm if self.rpm else 0.0,
+                   short_tokens * 60.0 / self.tpm if self.tpm else 0.0)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """0 once the request is taken from the buckets, else seconds to wait"""
+        if self.tpm:
+            # A request bigger than the whole bucket can only wait for a full one
+            tokens = min(tokens, self.tpm)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait_time(tokens, now)
+            if wait > 0:
+                self.waited_seconds += wait
+                self.throttled += 1
+            return wait
+
+    def acquire(self, tokens: int = 0):
+        """Block until one request of `tokens` tokens is within both budgets"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """acquire() for coroutines: waits without blocking the event loop"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every caller back, e.g. after the server answered 429"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        return {
+            "requests_per_minute": self.rpm,
+            "tokens_per_minute": self.tpm,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0,
+                  retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter; a server Retry-After wins when given"""
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
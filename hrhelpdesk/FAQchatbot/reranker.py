@@ -0,0 +1,171 @@
+"""
+Second-stage reranking of retrieved chunks on CPU
+The index over-fetches candidates and a reranker reorders them by a finer
+query-chunk relevance score, so a few well-chosen chunks can go into the
+prompt instead of many roughly ranked ones
+
+Backends:
+    lexical         dense similarity blended with IDF-weighted query-term
+                    coverage and phrase (bigram) matches; pure numpy, well
+                    under a millisecond for 30 candidates
+    cross-encoder   sentence-transformers CrossEncoder reading query and
+                    chunk together (optional dependency)
+
+Candidates are scored in batches, best dense rank first. Once the latency
+budget is spent the remaining candidates are not scored and keep their
+retrieval order after the scored ones.
+"""
+
+import math
+import time
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from lexical_index import tokenize
+
+Hit = Tuple[float, Dict]
+
+
+class Reranker:
+    """Scores (query, chunk) pairs; subclasses implement score_batches()"""
+
+    name = "none"
+
+    def __init__(self, batch_size: int = 16):
+        self.batch_size = max(1, batch_size)
+
+    def score_batches(self, query: str, hits: List[Hit]) -> Iterator[np.ndarray]:
+        """Scores of hits in order, one array per batch of batch_size"""
+        raise NotImplementedError
+
+    def rerank(self, query: str, hits: List[Hit], top_k: int,
+               budget_s: float = None) -> Tuple[List[Hit], Dict]:
+        """The top_k hits by rerank score, and what was scored in how long
+
+        At least the first batch is always scored; a further batch is only
+        started if the previous batch's time still fits the budget.
+        """
+        t0 = time.perf_counter()
+        scores: List[float] = []
+        batches = self.score_batches(query, hits)
+        try:
+            while len(scores) < len(hits):
+                t_batch = time.perf_counter()
+                try:
+                    scores.extend(float(s) for s in next(batches))
+                except StopIteration:
+                    break
+                if budget_s is not None and len(scores) < len(hits):
+                    now = time.perf_counter()
+                    if now - t0 + (now - t_batch) > budget_s:
+                        break
+        finally:
+            batches.close()
+
+        scored = sorted(range(len(scores)), key=lambda i: -scores[i])
+        order = scored + list(range(len(scores), len(hits)))
+        info = {
+            "reranker": self.name,
+            "candidates": len(hits),
+            "scored": len(scores),
+            "over_budget": len(scores) < len(hits),
+            "ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+        return [hits[i] for i in order[:top_k]], info
+
+
+class LexicalReranker(Reranker):
+    """Dense similarity blended with query-term coverage and phrase matches
+
+    Term weights are IDF over the candidate pool, so a term every candidate
+    contains (usually the topic itself) counts little and the terms that tell
+    the candidates apart decide.
+    """
+
+    name = "lexical"
+
+    def __init__(self, lexical_weight: float = 0.35, phrase_weight: float = 0.25,
+                 batch_size: int = 64):
+        super().__init__(batch_size)
+        self.lexical_weight = lexical_weight
+        self.phrase_weight = phrase_weight
+
+    def score_batches(self, query: str, hits: List[Hit]) -> Iterator[np.ndarray]:
+        q_tokens = tokenize(query)
+        q_terms = set(q_tokens)
+        q_bigrams = set(zip(q_tokens, q_tokens[1:]))
+        docs = [tokenize(m.get("text", "")) for _, m in hits]
+        doc_terms = [set(d) for d in docs]
+
+        n = len(hits)
+        idf = {t: math.log1p((n - df + 0.5) / (df + 0.5))
+               for t, df in ((t, sum(t in d for d in doc_terms)) for t in q_terms)}
+        idf_total = sum(idf.values())
+
+        for start in range(0, n, self.batch_size):
+            out = np.empty(min(self.batch_size, n - start), dtype=np.float32)
+            for j in range(len(out)):
+                i = start + j
+                coverage = (sum(idf[t] for t in q_terms & doc_terms[i]) / idf_total
+                            if idf_total else 0.0)
+                phrase = 0.0
+                if q_bigrams:
+                    d = docs[i]
+                    phrase = len(q_bigrams & set(zip(d, d[1:]))) / len(q_bigrams)
+                lexical = (1 - self.phrase_weight) * coverage + self.phrase_weight * phrase
+                out[j] = (1 - self.lexical_weight) * hits[i][0] + self.lexical_weight * lexical
+            yield out
+
+
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers cross-encoder running on CPU"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 512,
+                 threads: int = 0):
+        super().__init__(batch_size)
+        try:
+            import torch
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise RuntimeError(
+                "The cross-encoder reranker needs sentence-transformers (pip install -r requirements.txt)") from e
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self._torch = torch
+        self.name = f"cross-encoder:{model_name}"
+        logging.info(f"Using cross-encoder reranker: {model_name} ({torch.get_num_threads()} threads)")
+
+    def score_batches(self, query: str, hits: List[Hit]) -> Iterator[np.ndarray]:
+        for start in range(0, len(hits), self.batch_size):
+            pairs = [(query, m.get("text", "")) for _, m in hits[start:start + self.batch_size]]
+            with self._torch.inference_mode():
+                scores = self._model.predict(pairs, batch_size=self.batch_size,
+                                             show_progress_bar=False)
+            # Yield outside the context: inference mode is thread-local state
+            # and must not stay switched on while the caller runs
+            yield np.asarray(scores, dtype=np.float32)
+
+
+def make_reranker(mode: str, model_name: str = None, batch_size: int = 16,
+                  threads: int = 0) -> Reranker:
+    """Reranker for a RAG_RERANK setting, or None for "off"
+
+    A cross-encoder that can't be loaded falls back to the lexical reranker.
+    """
+    if mode in ("", "off", "none"):
+        return None
+    if mode == "lexical":
+        return LexicalReranker()
+    if mode == "cross-encoder":
+        try:
+            return CrossEncoderReranker(model_name, batch_size=batch_size, threads=threads)
+        except Exception as e:
+            logging.warning(f"Cross-encoder reranker unavailable ({e}); using the lexical reranker")
+            return LexicalReranker()
+    raise ValueError(f"Unknown RAG_RERANK mode {mode!r} (expected off, lexical or cross-encoder)")
@@ -0,0 +1,131 @@
+"""
+Single-flight coalescing of identical concurrent calls
+The first caller for a key runs the work; callers arriving with the same key
+while it is in flight wait for that run and get its result (or its
+exception) instead of repeating it. Nothing is cached: once the run
+finishes, the next call for the key runs again.
+
+SingleFlight is for threads (the Flask service), AsyncSingleFlight for one
+event loop (the ASGI service). Both services coalesce /ask only: a streamed
+answer (/ask/stream) is generated per connection, and repeats of it are left
+to the semantic answer cache once the first stream has finished.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Counters:
+    """calls / executions / collapsed counts shared by both variants"""
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+        self.failures = 0
+        self.max_waiters = 0
+
+    def stats(self, in_flight: int) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "collapse_rate": round(self.collapsed / self.calls, 4) if self.calls else 0.0,
+            "failures": self.failures,
+            "max_waiters": self.max_waiters,
+            "in_flight": in_flight,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-safe single-flight group"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._counters = _Counters()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(fn()'s result, whether it came from another caller's run)"""
+        with self._lock:
+            self._counters.calls += 1
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                call.waiters += 1
+                self._counters.collapsed += 1
+                self._counters.max_waiters = max(self._counters.max_waiters, call.waiters)
+            else:
+                call = self._calls[key] = _Call()
+                self._counters.executions += 1
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._counters.failures += 1
+            raise
+        finally:
+            # Later callers start a fresh run
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return self._counters.stats(len(self._calls))
+
+
+class AsyncSingleFlight:
+    """Single-flight group for coroutines on one event loop
+
+    The run is a task of its own, so a caller that is cancelled (e.g. its
+    client disconnected) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._counters = _Counters()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(await fn()'s result, whether it came from another caller's run)"""
+        self._counters.calls += 1
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self._counters.collapsed += 1
+            self._waiters[key] += 1
+            self._counters.max_waiters = max(self._counters.max_waiters, self._waiters[key])
+        else:
+            self._counters.executions += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            del self._waiters[key]
+        if task.cancelled() or task.exception() is not None:
+            self._counters.failures += 1
+
+    def stats(self) -> Dict:
+        return self._counters.stats(len(self._tasks))
@@ -99,7 +99,7 @@ def check_database_connection():
 def test_rag_pipeline():
     """Test RAG pipeline initialization"""
     try:
-        from rag_pipeline import get_rag_pipeline
+        from rag_service import get_rag_pipeline
         print("🔄 Initializing RAG pipeline...")
         rag = get_rag_pipeline()
         print("✅ RAG pipeline initialized successfully")
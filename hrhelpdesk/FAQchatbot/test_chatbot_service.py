@@ -0,0 +1,117 @@
+"""
+Tests for the Flask service's /ask/stream endpoint (Server-Sent Events)
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("deep_translator")
+
+import chatbot_service  # noqa: E402
+from chatbot_common import LOW_CONFIDENCE_ANSWERS  # noqa: E402
+
+DOC = {"id": "https://hr.example/leave::sec0::chunk0", "url": "https://hr.example/leave",
+       "section": "Annual leave", "text": "Employees get 21 days of annual leave."}
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Questions stored by the service, instead of writing them to PostgreSQL"""
+    rows = []
+
+    def store_question(question_text, answer_text, status, confidence_score=0.0):
+        rows.append({"question": question_text, "answer": answer_text, "status": status,
+                     "confidence": confidence_score})
+        return len(rows)
+
+    monkeypatch.setattr(chatbot_service, "store_question", store_question)
+    return rows
+
+
+def fake_stream(confidence, tokens, fail_after=None):
+    def answer_question_stream(question):
+        yield "sources", {"retrieved": [(confidence, DOC)], "confidence": confidence}
+        for i, token in enumerate(tokens):
+            if i == fail_after:
+                raise RuntimeError("LLM connection reset")
+            yield "token", token
+        yield "done", {"query": question, "answer": "".join(tokens), "confidence": confidence}
+    return answer_question_stream
+
+
+def sse_events(response):
+    """(event, data) pairs of an SSE body, comments skipped"""
+    events = []
+    for message in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.splitlines()
+                      if line and not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def ask(question, language="ar"):
+    client = chatbot_service.app.test_client()
+    return client.post("/ask/stream", json={"question": question, "language": language,
+                                            "session_id": "s1"})
+
+
+def test_stream_sends_sources_tokens_then_done(monkeypatch, stored):
+    monkeypatch.setattr(chatbot_service, "answer_question_stream",
+                        fake_stream(0.82, ["Twenty ", "one ", "days."]))
+    response = ask("كم يوم إجازة سنوية؟")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    events = sse_events(response)
+    assert [e for e, _ in events] == ["sources", "token", "token", "token", "done"]
+    sources = events[0][1]
+    assert sources["confidence"] == 0.82 and sources["session_id"] == "s1"
+    assert sources["rag_sources"][0]["url"] == DOC["url"]
+    assert "".join(d["text"] for e, d in events if e == "token") == "Twenty one days."
+    done = events[-1][1]
+    assert done["answers"] == ["Twenty one days."] and done["status"] == "answered"
+    assert done["question_id"] == 1
+    assert stored == [{"question": "كم يوم إجازة سنوية؟", "answer": "Twenty one days.",
+                       "status": "answered", "confidence": 0.82}]
+
+
+def test_low_confidence_hands_off_without_generating(monkeypatch, stored):
+    generated = []
+
+    def answer_question_stream(question):
+        yield "sources", {"retrieved": [(0.1, DOC)], "confidence": 0.1}
+        generated.append(True)  # must not be reached: no completion for low confidence
+        yield "token", "guess"
+
+    monkeypatch.setattr(chatbot_service, "answer_question_stream", answer_question_stream)
+    events = sse_events(ask("What is the pension for pilots?", language="en"))
+
+    assert [e for e, _ in events] == ["sources", "token", "done"]
+    assert events[1][1]["text"] == LOW_CONFIDENCE_ANSWERS["en"]
+    assert events[2][1]["status"] == "pending"
+    assert generated == []
+    assert stored == [{"question": "What is the pension for pilots?",
+                       "answer": LOW_CONFIDENCE_ANSWERS["en"], "status": "pending",
+                       "confidence": 0.1}]
+
+
+def test_failure_mid_stream_sends_error_and_keeps_the_question(monkeypatch, stored):
+    monkeypatch.setattr(chatbot_service, "answer_question_stream",
+                        fake_stream(0.82, ["Twenty ", "one ", "days."], fail_after=2))
+    events = sse_events(ask("كم يوم إجازة سنوية؟"))
+
+    assert [e for e, _ in events] == ["sources", "token", "token", "error"]
+    assert events[-1][1] == {"error": "Internal server error"}
+    # What was generated goes to the HR team
+    assert stored == [{"question": "كم يوم إجازة سنوية؟", "answer": "Twenty one ",
+                       "status": "pending", "confidence": 0.82}]
+
+
+def test_missing_question_is_rejected(stored):
+    response = chatbot_service.app.test_client().post("/ask/stream", json={"language": "en"})
+    assert response.status_code == 400
+    assert stored == []
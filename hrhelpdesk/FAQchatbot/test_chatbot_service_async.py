@@ -0,0 +1,106 @@
+"""
+Smoke tests for the ASGI service (Quart test client, database pool stubbed)
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("asyncpg")
+pytest.importorskip("deep_translator")
+
+import chatbot_service_async  # noqa: E402
+
+DOC = {"id": "https://hr.example/leave::sec0::chunk0", "url": "https://hr.example/leave",
+       "section": "Annual leave", "text": "Employees get 21 days of annual leave."}
+
+
+class FakePool:
+    """asyncpg pool stand-in: INSERT ... RETURNING question_id hands out ids"""
+
+    def __init__(self):
+        self.rows = []
+
+    async def fetchval(self, query, *args):
+        if query.strip().startswith("SELECT"):
+            return 1
+        self.rows.append(args)
+        return len(self.rows)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_db_pool():
+        return pool
+
+    monkeypatch.setattr(chatbot_service_async, "get_db_pool", get_db_pool)
+    return pool
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    async def answer_question_async(question):
+        return {"query": question, "answer": "Twenty one days.", "retrieved": [(0.82, DOC)],
+                "confidence": 0.82}
+
+    async def answer_question_stream_async(question):
+        yield "sources", {"retrieved": [(0.82, DOC)], "confidence": 0.82}
+        for token in ("Twenty ", "one ", "days."):
+            yield "token", token
+        yield "done", {"query": question, "answer": "Twenty one days.", "confidence": 0.82}
+
+    monkeypatch.setattr(chatbot_service_async, "answer_question_async", answer_question_async)
+    monkeypatch.setattr(chatbot_service_async, "answer_question_stream_async",
+                        answer_question_stream_async)
+
+
+def request(method, path, **kwargs):
+    """(status, body text) of one request through the Quart test client"""
+    async def send():
+        client = chatbot_service_async.app.test_client()
+        response = await getattr(client, method)(path, **kwargs)
+        return response.status_code, await response.get_data(as_text=True)
+    return asyncio.run(send())
+
+
+def test_ask(pool, answers):
+    status, body = request("post", "/ask", json={"question": "كم يوم إجازة سنوية؟",
+                                                 "language": "ar", "session_id": "s1"})
+    assert status == 200
+    reply = json.loads(body)
+    assert reply["answers"] == ["Twenty one days."] and reply["status"] == "answered"
+    assert reply["question_id"] == 1 and reply["rag_sources"][0]["url"] == DOC["url"]
+    assert pool.rows[0][:4] == ("كم يوم إجازة سنوية؟", "Twenty one days.", "answered", 0.82)
+
+
+def test_ask_stream(pool, answers):
+    status, body = request("post", "/ask/stream", json={"question": "كم يوم إجازة سنوية؟",
+                                                        "language": "ar"})
+    assert status == 200
+    events = [m.split("\n")[0] for m in body.split("\n\n") if m.startswith("event: ")]
+    assert events == ["event: sources"] + ["event: token"] * 3 + ["event: done"]
+    assert len(pool.rows) == 1 and pool.rows[0][2] == "answered"
+
+
+def test_ask_without_question(pool):
+    assert request("post", "/ask", json={})[0] == 400
+    assert request("post", "/ask/stream", json={})[0] == 400
+    assert pool.rows == []
+
+
+def test_admin_routes_need_the_token(monkeypatch):
+    monkeypatch.setattr(chatbot_service_async, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(chatbot_service_async, "rollback", lambda version: version or "v1")
+
+    assert request("get", "/admin/snapshots")[0] == 403
+    assert request("post", "/admin/rollback", headers={"X-Admin-Token": "wrong"})[0] == 403
+    status, body = request("post", "/admin/rollback", json={"version": "v7"},
+                           headers={"X-Admin-Token": "secret"})
+    assert status == 200 and json.loads(body) == {"current_version": "v7"}
+    status, _ = request("post", "/admin/rebuild", json={"mode": "partial"},
+                        headers={"X-Admin-Token": "secret"})
+    assert status == 400
@@ -0,0 +1,71 @@
+"""
+Tests for the memory-mapped chunk metadata store
+"""
+
+import numpy as np
+import pytest
+
+from conftest import fake_vector
+from chunk_store import ChunkStore, write_chunk_store
+
+
+def chunk(fid, text, urls=None):
+    url = f"https://hr.example/page{fid % 3}"
+    return {
+        "id": f"{url}::sec0::chunk{fid}",
+        "url": url,
+        "section": "إجازات" if fid % 2 else "Leave",
+        "text": text,
+        "urls": urls or [url],
+        "chunk_id": fid,
+    }
+
+
+METADATA = {
+    907: chunk(907, "Annual leave is 30 days."),
+    12: chunk(12, "الإجازة السنوية ٣٠ يوماً"),
+    -5: chunk(-5, "Shared text", urls=["https://a.example", "https://b.example"]),
+    40: chunk(40, ""),
+}
+
+
+def test_round_trip(tmp_path):
+    write_chunk_store(tmp_path / "chunks", METADATA)
+    store = ChunkStore(tmp_path / "chunks")
+
+    assert len(store) == len(METADATA)
+    assert list(store) == sorted(METADATA)
+    assert store.to_dict() == METADATA
+    for fid, m in METADATA.items():
+        assert fid in store
+        assert store[fid] == m
+    assert 13 not in store
+    with pytest.raises(KeyError):
+        store[13]
+
+
+def test_vectors_round_trip(tmp_path):
+    vecs = {fid: fake_vector(m["text"], 8) for fid, m in METADATA.items()}
+    write_chunk_store(tmp_path / "chunks", METADATA, vector_of=vecs.__getitem__, dim=8)
+    store = ChunkStore(tmp_path / "chunks")
+
+    for fid, v in vecs.items():
+        np.testing.assert_array_equal(store.vector(fid), v)
+    assert store.vector(13) is None
+
+
+def test_rewrite_replaces_store(tmp_path):
+    write_chunk_store(tmp_path / "chunks", METADATA)
+    old = ChunkStore(tmp_path / "chunks")
+    write_chunk_store(tmp_path / "chunks", {1: chunk(1, "Only chunk")})
+
+    assert ChunkStore(tmp_path / "chunks").to_dict() == {1: chunk(1, "Only chunk")}
+    assert ChunkStore(tmp_path / "chunks").vector(1) is None
+    # A reader that mapped the old files keeps seeing them
+    assert old[907] == METADATA[907]
+
+
+def test_empty_store(tmp_path):
+    write_chunk_store(tmp_path / "chunks", {})
+    store = ChunkStore(tmp_path / "chunks")
+    assert len(store) == 0 and store.to_dict() == {}
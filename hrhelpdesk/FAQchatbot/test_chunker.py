@@ -0,0 +1,130 @@
+"""
+Tests for the sentence/token-aware chunker
+"""
+
+from functools import reduce
+
+import pytest
+
+from chunker import chunk_text, count_tokens, merge_overlapping
+from rag_pipeline import TextProcessor
+
+SENTENCES = [
+    f"Rule {i}: employees in grade {i % 7} must submit form HR-{100 + i} before the deadline."
+    for i in range(40)
+]
+TEXT = " ".join(SENTENCES)
+
+
+def baseline_chunk_text(text, max_len=350, overlap=60):
+    """TextProcessor.chunk_text before chunk policies existed"""
+    text = text.strip()
+    if len(text) <= max_len:
+        return [text]
+    out, start = [], 0
+    while start < len(text):
+        end = min(start + max_len, len(text))
+        out.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(0, end - overlap)
+    return out
+
+
+def sentence_span(chunk):
+    """(first, last + 1) indexes into SENTENCES of a chunk made of whole sentences"""
+    for i, s in enumerate(SENTENCES):
+        if chunk.startswith(s):
+            for j in range(i + 1, len(SENTENCES) + 1):
+                if " ".join(SENTENCES[i:j]) == chunk:
+                    return i, j
+    raise AssertionError(f"not whole sentences: {chunk!r}")
+
+
+@pytest.mark.parametrize("max_tokens", [30, 64, 200])
+def test_chunks_stay_within_budget(max_tokens):
+    assert max(count_tokens(s) for s in SENTENCES) <= max_tokens
+    chunks = chunk_text(TEXT, max_tokens=max_tokens, overlap_tokens=max_tokens // 4)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= max_tokens for c in chunks)
+
+
+def test_overlap_is_whole_sentences():
+    chunks = chunk_text(TEXT, max_tokens=80, overlap_tokens=30)
+    spans = [sentence_span(c) for c in chunks]
+    assert spans[0][0] == 0 and spans[-1][1] == len(SENTENCES)
+    for (start, end), (nxt_start, _) in zip(spans, spans[1:]):
+        assert start < nxt_start < end  # overlaps by at least one sentence, always advances
+        overlap = " ".join(SENTENCES[nxt_start:end])
+        assert count_tokens(overlap) <= 30
+
+
+def test_no_overlap_when_budget_is_zero():
+    spans = [sentence_span(c) for c in chunk_text(TEXT, max_tokens=80, overlap_tokens=0)]
+    assert all(end == nxt for (_, end), (nxt, _) in zip(spans, spans[1:]))
+
+
+def one_per_chunk_budget(pieces):
+    """Token budget that fits each piece alone but no two neighbours"""
+    budget = max(count_tokens(p) for p in pieces)
+    assert all(count_tokens(f"{a} {b}") > budget for a, b in zip(pieces, pieces[1:]))
+    return budget
+
+
+def test_arabic_sentence_boundaries():
+    sentences = ["ما هي مدة الإجازة السنوية؟", "المدة ثلاثون يوماً؛",
+                 "وتحسب بأيام العمل، وليس بأيام التقويم."]
+    text = " ".join(sentences)
+    budget = one_per_chunk_budget(sentences)
+    assert chunk_text(text, max_tokens=budget, overlap_tokens=0) == sentences
+
+    # The Arabic comma only ends a clause
+    clauses = sentences[:2] + ["وتحسب بأيام العمل،", "وليس بأيام التقويم."]
+    budget = one_per_chunk_budget(clauses)
+    assert chunk_text(text, policy="clause", max_tokens=budget, overlap_tokens=0) == clauses
+
+
+def test_overlong_sentence_is_split_on_clauses_then_words():
+    sentence = ", ".join(f"clause number {i} of the policy" for i in range(30)) + "."
+    chunks = chunk_text(sentence, max_tokens=20, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 20 for c in chunks)
+    words = " ".join(["word"] * 100)
+    assert all(count_tokens(c) <= 20 for c in chunk_text(words, max_tokens=20, overlap_tokens=0))
+
+
+@pytest.mark.parametrize("text", [
+    TEXT,
+    "short text",
+    "x" * 350,
+    "x" * 351,
+    "الإجازة السنوية " * 60,
+    "  padded   " + "y" * 700 + "   ",
+])
+def test_chars_policy_matches_baseline(text):
+    assert chunk_text(text, policy="chars") == baseline_chunk_text(text)
+    assert TextProcessor.chunk_text(text, policy="chars") == baseline_chunk_text(text)
+
+
+def test_chars_policy_keeps_max_len_and_overlap():
+    text = "x" * 200 + "y" * 200
+    expected = baseline_chunk_text(text, max_len=120, overlap=20)
+    assert TextProcessor.chunk_text(text, 120, 20, policy="chars") == expected
+    assert TextProcessor.chunk_text(text, max_len=120, overlap=20, policy="chars") == expected
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError, match="Unknown chunk policy"):
+        chunk_text(TEXT, policy="paragraph")
+
+
+def test_merge_overlapping_round_trips_packed_chunks():
+    chunks = chunk_text(TEXT, max_tokens=80, overlap_tokens=30)
+    assert reduce(merge_overlapping, chunks) == TEXT
+
+
+def test_merge_overlapping_without_shared_text():
+    assert merge_overlapping("First chunk.", "Second chunk.") == "First chunk.\nSecond chunk."
+    # A shared tail shorter than min_overlap is not treated as overlap
+    assert merge_overlapping("ends with the", "the start") == "ends with the\nthe start"
+    assert merge_overlapping("only", "") == "only"
@@ -0,0 +1,145 @@
+"""
+Tests for picking the prompt context: MMR order, merging adjacent chunks
+and the token budget
+"""
+
+import numpy as np
+import pytest
+
+import rag_pipeline
+from chunker import chunk_text, count_tokens
+from conftest import FakeEmbedder, fake_vector
+from rag_pipeline import FaissIndex, RAGPipeline, merge_adjacent_chunks, mmr_order
+
+URL = "https://hr.example/leave"
+SECTION = " ".join(
+    f"Clause {i}: an employee with {i} years of service receives {20 + i} days of leave."
+    for i in range(12))
+
+
+def section_docs(url=URL, sec=0, text=SECTION):
+    """Chunks of one section, ids as make_docs_from_text builds them"""
+    return [{"id": f"{url}::sec{sec}::chunk{i}", "url": url, "section": f"Section {sec}",
+             "chunk_id": i, "text": chunk, "urls": [url]}
+            for i, chunk in enumerate(chunk_text(text, max_tokens=90, overlap_tokens=35))]
+
+
+def other_docs(n):
+    return [{"id": f"https://hr.example/page{i}::sec0::chunk0", "url": f"https://hr.example/page{i}",
+             "section": "Other", "chunk_id": 0, "urls": [f"https://hr.example/page{i}"],
+             "text": f"Topic {i}: " + " ".join(["policy", "detail", str(i)] * 15)}
+            for i in range(n)]
+
+
+def make_rag(tmp_path, docs, vectors):
+    index = FaissIndex(vectors.shape[1], tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                       index_type="flat")
+    index.create(np.zeros((0, vectors.shape[1]), dtype=np.float32))
+    index.add(vectors, docs)
+    return RAGPipeline([], FakeEmbedder(dim=vectors.shape[1]), index, generator=None)
+
+
+def vectors_for(docs, dim=32):
+    return np.vstack([fake_vector(d["text"], dim) for d in docs])
+
+
+def context_tokens(rag, blocks):
+    return sum(count_tokens(rag._format_block(b)) for b in blocks)
+
+
+def test_mmr_without_vectors_is_relevance_order():
+    assert mmr_order([0.2, 0.9, 0.5], None, 0.7) == [1, 2, 0]
+
+
+def test_mmr_prefers_a_diverse_candidate():
+    a = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    near_a = np.array([0.9, 0.436, 0.0], dtype=np.float32)
+    other = np.array([0.0, 0.0, 1.0], dtype=np.float32)
+    vectors = np.vstack([a, near_a, other])
+    scores = [0.9, 0.85, 0.8]
+    assert mmr_order(scores, vectors, lam=1.0) == [0, 1, 2]
+    assert mmr_order(scores, vectors, lam=0.5) == [0, 2, 1]
+
+
+def test_mmr_drops_near_repeats():
+    v = fake_vector("a", 16)
+    vectors = np.vstack([v, v, fake_vector("b", 16)])
+    assert mmr_order([0.9, 0.9, 0.5], vectors, lam=0.7, redundancy=0.95) == [0, 2]
+
+
+def test_merge_adjacent_chunks_keeps_overlap_once():
+    docs = section_docs()
+    assert len(docs) >= 3
+    hits = [(0.7, docs[2]), (0.9, docs[0]), (0.5, other_docs(1)[0]), (0.8, docs[1])]
+
+    merged = merge_adjacent_chunks(hits)
+
+    assert len(merged) == 2
+    score, block = merged[0]  # takes the place of its first hit
+    assert score == 0.9
+    shared = docs[0]["text"].split(". ")[-1]
+    assert docs[1]["text"].startswith(shared)  # the chunks do overlap
+    assert SECTION.startswith(block["text"])
+    assert block["text"].count(shared) == 1
+    assert block["chunk_ids"] == [0, 1, 2]
+    assert merged[1] == hits[2]
+
+
+def test_merge_adjacent_chunks_only_merges_consecutive_chunks_of_a_section():
+    docs = section_docs()
+    elsewhere = section_docs(sec=1)
+    hits = [(0.9, docs[0]), (0.8, docs[2]), (0.7, elsewhere[1])]
+    assert merge_adjacent_chunks(hits) == hits
+
+
+def test_merged_block_keeps_every_source_url():
+    docs = section_docs()
+    second = dict(docs[1], urls=[URL, "https://mirror.example/leave"])
+    _, block = merge_adjacent_chunks([(0.9, docs[0]), (0.8, second)])[0]
+    assert block["urls"] == [URL, "https://mirror.example/leave"]
+
+
+@pytest.mark.parametrize("budget", [120, 250, 500])
+def test_select_context_never_exceeds_the_budget(tmp_path, budget):
+    docs = other_docs(10)
+    rag = make_rag(tmp_path, docs, vectors_for(docs))
+    retrieved = [(1.0 - i / 20, d) for i, d in enumerate(docs)]
+
+    blocks = rag.select_context(retrieved, max_tokens=budget)
+
+    assert blocks and blocks[0] == retrieved[0]
+    assert context_tokens(rag, blocks) <= budget
+    assert len(blocks) < len(docs)
+
+
+def test_best_hit_goes_in_even_over_budget(tmp_path):
+    docs = other_docs(3)
+    rag = make_rag(tmp_path, docs, vectors_for(docs))
+    blocks = rag.select_context([(0.9, docs[0]), (0.8, docs[1])], max_tokens=5)
+    assert blocks == [(0.9, docs[0])]
+
+
+def test_select_context_drops_near_identical_neighbour(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "CONTEXT_REDUNDANCY", 0.95)
+    docs = other_docs(3)
+    vectors = vectors_for(docs)
+    vectors[1] = vectors[0] + 0.01 * fake_vector("noise", 32)  # cosine ~0.9999 to docs[0]
+    rag = make_rag(tmp_path, docs, vectors)
+
+    blocks = rag.select_context([(0.9, docs[0]), (0.89, docs[1]), (0.5, docs[2])],
+                                max_tokens=10_000)
+    assert [m["id"] for _, m in blocks] == [docs[0]["id"], docs[2]["id"]]
+
+
+def test_select_context_merges_adjacent_chunks(tmp_path):
+    docs = section_docs()
+    rag = make_rag(tmp_path, docs, vectors_for(docs))
+    retrieved = [(0.9 - i / 100, d) for i, d in enumerate(docs)]
+
+    blocks = rag.select_context(retrieved, max_tokens=10_000)
+
+    assert len(blocks) == 1
+    assert blocks[0][1]["text"] == SECTION
+    # Sent once, the merged section costs less than its overlapping chunks
+    separate = sum(count_tokens(rag._format_block(h)) for h in retrieved)
+    assert context_tokens(rag, blocks) < separate
@@ -0,0 +1,67 @@
+"""
+Tests for MinHash/LSH near-duplicate detection
+"""
+
+import pytest
+
+from dedup import DedupReport, NearDupIndex, _lsh_shape
+
+CLAUSE = ("The employee is entitled to annual leave of no less than twenty one days "
+          "with full pay, increased to thirty days after five years of continuous service")
+OTHER = ("Overtime hours are compensated at one and a half times the basic hourly wage "
+         "and must be approved in advance by the direct manager")
+
+
+def test_exact_duplicate_maps_to_kept_id():
+    index = NearDupIndex()
+    assert index.add("site-a::chunk0", CLAUSE) == (None, 0.0)
+    assert index.add("site-b::chunk3", CLAUSE) == ("site-a::chunk0", 1.0)
+    assert len(index) == 1  # the duplicate is not indexed itself
+
+
+def test_normalized_variants_are_duplicates():
+    index = NearDupIndex()
+    index.add("ar0", "المادة ١٠٩: يستحق العامل إجازة سنوية لا تقل مدتها عن واحد وعشرين يوماً")
+    dup_of, sim = index.add("ar1", "المادة 109: يستحق العامل إجازة سنويّة لا تقل مدتها عن واحد وعشرين يوما")
+    assert dup_of == "ar0" and sim == 1.0
+
+
+def test_near_duplicate_above_threshold():
+    index = NearDupIndex(threshold=0.5)
+    index.add("kept", CLAUSE)
+    dup_of, sim = index.add("edited", CLAUSE.replace("thirty days", "thirty calendar days"))
+    assert dup_of == "kept" and 0.5 <= sim < 1.0
+
+
+def test_disjoint_text_is_not_a_duplicate():
+    index = NearDupIndex()
+    index.add("clause", CLAUSE)
+    assert index.add("other", OTHER) == (None, 0.0)
+    assert len(index) == 2
+
+
+@pytest.mark.parametrize("text", ["", "   ", "!! -- ؟"])
+def test_empty_text_is_never_a_duplicate(text):
+    index = NearDupIndex()
+    assert index.add("first", text) == (None, 0.0)
+    assert index.add("second", text) == (None, 0.0)
+    assert index.add("third", CLAUSE) == (None, 0.0)
+
+
+def test_lsh_shape_for_default_threshold():
+    bands, rows = _lsh_shape(128, 0.85)
+    assert (bands, rows) == (9, 14)
+    assert bands * rows <= 128
+    assert abs((1 / bands) ** (1 / rows) - 0.85) < 0.02
+    index = NearDupIndex()
+    assert (index.bands, index.rows) == (bands, rows)
+
+
+def test_report_summary():
+    report = DedupReport(0.85)
+    report.checked = 4
+    report.record("a::0", "https://a", {"id": "b::0", "url": "https://b", "text": CLAUSE}, 1.0)
+    report.record("a::0", "https://a", {"id": "a::5", "url": "https://a", "text": CLAUSE}, 0.9)
+    s = report.summary()
+    assert s["merged"] == 2 and s["merged_across_sources"] == 1 and s["merged_ratio"] == 0.5
+    assert report.to_dict()["merges"][0]["dropped_text"] == CLAUSE[:160]
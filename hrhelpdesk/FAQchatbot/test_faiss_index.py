@@ -0,0 +1,185 @@
+"""
+Tests for the configurable FAISS index types and vector dtypes
+"""
+
+import faiss
+import numpy as np
+import pytest
+
+import rag_pipeline
+from conftest import FakeEmbedder, fake_vector
+from rag_pipeline import INDEX_TYPES, VECTOR_DTYPES, FaissIndex, IndexMismatchError, make_index
+
+DIM = 32
+
+
+def corpus(n):
+    docs = [{"id": f"https://hr.example/page{i}::sec0::chunk0", "url": f"https://hr.example/page{i}",
+             "section": "Policy", "chunk_id": 0, "text": f"Policy clause {i}"}
+            for i in range(n)]
+    return docs, np.vstack([fake_vector(d["text"], DIM) for d in docs])
+
+
+def built_index(tmp_path, index_type, n=300, params=None):
+    docs, vectors = corpus(n)
+    index = FaissIndex(DIM, tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                       index_type=index_type, params=params, backend_id=FakeEmbedder.backend_id)
+    index.build(vectors, docs)
+    return index, docs, vectors
+
+
+@pytest.mark.parametrize("index_type, base_class", [
+    ("flat", faiss.IndexFlatIP),
+    ("hnsw", faiss.IndexHNSWFlat),
+    ("ivf_flat", faiss.IndexIVFFlat),
+    ("ivf_pq", faiss.IndexIVFPQ),
+])
+def test_make_index_per_type(index_type, base_class):
+    _, vectors = corpus(300)
+    index, params = make_index(index_type, DIM, vectors)
+
+    assert params["type"] == index_type
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    assert isinstance(inner, base_class)
+    if index_type.startswith("ivf"):
+        assert 1 <= params["nlist"] <= len(vectors) // 39
+        assert faiss.extract_index_ivf(index).nprobe == params["nprobe"]
+    if index_type == "ivf_pq":
+        assert DIM % params["pq_m"] == 0
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError, match="Unknown index type"):
+        make_index("lsh", DIM, corpus(10)[1])
+
+
+@pytest.mark.parametrize("index_type, n", [("ivf_pq", 255), ("ivf_flat", 38)])
+def test_too_few_vectors_to_train_falls_back_to_flat(index_type, n):
+    index, params = make_index(index_type, DIM, corpus(n)[1])
+    assert params["type"] == "flat"
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP)
+
+
+@pytest.mark.parametrize("index_type, base_class", [
+    ("flat", faiss.IndexScalarQuantizer),
+    ("hnsw", faiss.IndexHNSWSQ),
+    ("ivf_flat", faiss.IndexIVFScalarQuantizer),
+])
+@pytest.mark.parametrize("vector_dtype", ["float16", "int8"])
+def test_make_index_with_scalar_quantizer(index_type, base_class, vector_dtype):
+    index, params = make_index(index_type, DIM, corpus(300)[1], {"vector_dtype": vector_dtype})
+    assert params["vector_dtype"] == vector_dtype
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    assert isinstance(inner, base_class)
+
+
+def test_ivf_pq_ignores_vector_dtype():
+    _, params = make_index("ivf_pq", DIM, corpus(300)[1], {"vector_dtype": "int8"})
+    assert params["vector_dtype"] == "float32"
+
+
+def test_unknown_vector_dtype():
+    with pytest.raises(ValueError, match="Unknown vector dtype"):
+        make_index("flat", DIM, corpus(10)[1], {"vector_dtype": "int4"})
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+@pytest.mark.parametrize("vector_dtype", list(VECTOR_DTYPES))
+def test_every_type_finds_the_query_chunk(tmp_path, index_type, vector_dtype):
+    index, docs, vectors = built_index(tmp_path, index_type, params={"vector_dtype": vector_dtype})
+    assert index.ntotal == len(docs)
+
+    hits = index.search_batch(vectors[:20], top_k=5)
+    found = sum(doc["id"] in [m["id"] for _, m in row] for doc, row in zip(docs, hits))
+    assert found >= 19  # approximate types may miss the odd one
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+@pytest.mark.parametrize("vector_dtype", ["float32", "int8"])
+def test_removed_ids_are_never_returned(tmp_path, index_type, vector_dtype):
+    index, docs, vectors = built_index(tmp_path, index_type, params={"vector_dtype": vector_dtype})
+    assert index.supports_updates
+
+    gone = [d["id"] for d in docs[:10]]
+    assert index.remove(gone) == 10
+    assert index.ntotal == len(docs) - 10
+
+    _, ids = index.search_ids(vectors[:10], top_k=10)
+    assert (ids != -1).all()  # every query still gets neighbours from the rest
+    returned = {index.metadata[int(i)]["id"] for i in ids.ravel()}
+    assert not returned & set(gone)
+    assert not {m["id"] for row in index.search_batch(vectors[:10]) for _, m in row} & set(gone)
+
+
+def test_hnsw_does_not_support_removal(tmp_path):
+    index, docs, _ = built_index(tmp_path, "hnsw")
+    assert not index.supports_updates
+    with pytest.raises(RuntimeError, match="in-place removal"):
+        index.remove([docs[0]["id"]])
+
+
+@pytest.mark.parametrize("vector_dtype", ["float16", "int8"])
+def test_rescore_returns_exact_order_and_scores(tmp_path, vector_dtype):
+    index, docs, vectors = built_index(tmp_path, "flat", params={"vector_dtype": vector_dtype})
+    assert index.keep_full_precision
+    queries = vectors[:5] + 0.3 * np.vstack([fake_vector(f"noise {i}", DIM) for i in range(5)])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    scores, ids = index.search_ids(queries, top_k=8)
+
+    exact = queries @ vectors.T
+    fid_rows = {fid: row for row, fid in enumerate(index.metadata)}
+    for q, (row_scores, row_ids) in enumerate(zip(scores, ids)):
+        rows = [fid_rows[int(i)] for i in row_ids]
+        np.testing.assert_allclose(row_scores, exact[q, rows], rtol=1e-5, atol=1e-6)
+        assert list(row_scores) == sorted(row_scores, reverse=True)
+        assert rows == list(np.argsort(-exact[q])[:8])
+
+
+def test_rescore_can_be_disabled(tmp_path, monkeypatch):
+    index, _, vectors = built_index(tmp_path, "flat", params={"vector_dtype": "int8"})
+    exact_scores, _ = index.search_ids(vectors[:3], top_k=4)
+    monkeypatch.setattr(rag_pipeline, "RESCORE_FULL_PRECISION", False)
+    raw_scores, _ = index.search_ids(vectors[:3], top_k=4)
+    np.testing.assert_allclose(exact_scores[:, 0], 1.0, rtol=1e-5)
+    assert not np.allclose(raw_scores, exact_scores, rtol=1e-6, atol=0)
+
+
+def test_precision_report_streams_row_blocks(tmp_path):
+    index, _, vectors = built_index(tmp_path, "hnsw")
+    whole = index.precision_report(vectors, sample=50)
+    blocks = index.precision_report([vectors[:120], vectors[120:121], vectors[121:]], sample=50)
+    assert blocks == whole
+    assert whole["vectors"] == len(vectors) and whole[f"recall@{rag_pipeline.TOP_K}"] > 0.9
+
+
+def reopen(tmp_path, dim=DIM, backend_id=FakeEmbedder.backend_id):
+    return FaissIndex(dim, tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                      backend_id=backend_id)
+
+
+def test_load_checks_the_embedding_backend(tmp_path):
+    index, docs, _ = built_index(tmp_path, "flat", n=20)
+    index.save()
+
+    with pytest.raises(IndexMismatchError, match="built with embeddings from 'fake:test'"):
+        reopen(tmp_path, backend_id="text-embedding-3-small").load()
+    with pytest.raises(IndexMismatchError, match="32-d vectors but the embedder produces 384-d"):
+        reopen(tmp_path, dim=384).load()
+
+    same = reopen(tmp_path)
+    same.load()
+    assert same.ntotal == len(docs)
+    unchecked = reopen(tmp_path, backend_id=None)  # no backend recorded by the caller
+    unchecked.load()
+    assert unchecked.ntotal == len(docs)
+
+
+def test_index_without_params_is_assumed_openai(tmp_path):
+    index, _, _ = built_index(tmp_path, "flat", n=20)
+    index.save()
+    (tmp_path / "index_params.json").unlink()
+
+    with pytest.raises(IndexMismatchError, match="'text-embedding-3-small'"):
+        reopen(tmp_path).load()
+    reopen(tmp_path, backend_id="text-embedding-3-small").load()
@@ -0,0 +1,167 @@
+"""
+Tests for HtmlFetcher against a fake transport: revalidation, backoff,
+the stale-copy fallback and max_age
+"""
+
+import pytest
+import requests
+
+import html_fetcher
+from html_fetcher import HtmlFetcher
+
+URL = "https://hr.example/leave"
+PAGE = "<html><body><h1>الإجازة السنوية</h1><p>21 days.</p></body></html>"
+
+
+def response(status, body="", headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r.reason = {200: "OK", 304: "Not Modified", 404: "Not Found", 429: "Too Many Requests",
+                503: "Service Unavailable"}.get(status, "")
+    r._content = body.encode("utf-8")
+    r.encoding = "utf-8"
+    r.headers.update(headers or {})
+    r.url = URL
+    return r
+
+
+class FakeSession:
+    """Replays queued responses (or raises queued exceptions), recording each request"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.requests.append({"url": url, "timeout": timeout, "headers": dict(headers or {})})
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(html_fetcher.time, "sleep", slept.append)
+    return slept
+
+
+def fetcher(tmp_path, *replies, **kwargs):
+    kwargs.setdefault("workers", 2)
+    f = HtmlFetcher(tmp_path / "html_cache", **kwargs)
+    f.session = FakeSession(*replies)
+    return f
+
+
+def test_revalidates_with_etag_and_last_modified(tmp_path, sleeps):
+    validators = {"ETag": '"v1"', "Last-Modified": "Wed, 01 Oct 2025 08:00:00 GMT"}
+    f = fetcher(tmp_path, response(200, PAGE, validators), response(304))
+
+    assert f.fetch(URL) == PAGE
+    assert f.session.requests[0]["headers"] == {}
+    assert f.fetch(URL) == PAGE  # body served from the cache
+    assert f.session.requests[1]["headers"] == {"If-None-Match": '"v1"',
+                                                "If-Modified-Since": validators["Last-Modified"]}
+    assert f.stats_snapshot() == {"downloaded": 1, "not_modified": 1, "fresh": 0, "stale": 0,
+                                  "failed": 0}
+
+
+def test_changed_page_replaces_the_cached_copy(tmp_path, sleeps):
+    f = fetcher(tmp_path, response(200, PAGE, {"ETag": '"v1"'}),
+                response(200, "<p>22 days.</p>", {"ETag": '"v2"'}), response(304))
+    f.fetch(URL)
+    assert f.fetch(URL) == "<p>22 days.</p>"
+    assert f.fetch(URL) == "<p>22 days.</p>"
+    assert f.session.requests[2]["headers"] == {"If-None-Match": '"v2"'}
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_with_backoff_on_throttling_and_server_errors(tmp_path, sleeps, monkeypatch, status):
+    delays = []
+
+    def backoff_delay(attempt, base, cap, retry_after):
+        delays.append((attempt, base, cap, retry_after))
+        return 0.5 * (attempt + 1)
+
+    monkeypatch.setattr(html_fetcher, "backoff_delay", backoff_delay)
+    f = fetcher(tmp_path, response(status), response(status, headers={"Retry-After": "7"}),
+                response(200, PAGE), retries=4, backoff_base=2.0, backoff_max=10.0)
+
+    assert f.fetch(URL) == PAGE
+    assert len(f.session.requests) == 3
+    assert delays == [(0, 2.0, 10.0, None), (1, 2.0, 10.0, 7.0)]
+    assert sleeps == [0.5, 1.0]
+
+
+def test_backoff_honours_retry_after_up_to_the_cap(tmp_path):
+    f = fetcher(tmp_path, backoff_max=5.0)
+    assert f._backoff(0, "3") == 3.0
+    assert f._backoff(0, "120") == 5.0
+    assert all(0 <= f._backoff(attempt, "soon") <= 5.0 for attempt in range(6))
+
+
+def test_client_error_is_not_retried(tmp_path, sleeps):
+    f = fetcher(tmp_path, response(404), retries=4)
+    with pytest.raises(RuntimeError, match="Could not fetch"):
+        f.fetch(URL)
+    assert len(f.session.requests) == 1 and sleeps == []
+    assert f.stats_snapshot()["failed"] == 1
+
+
+def test_falls_back_to_the_stale_copy(tmp_path, sleeps):
+    down = requests.ConnectionError("connection refused")
+    f = fetcher(tmp_path, response(200, PAGE, {"ETag": '"v1"'}), down, response(503), down,
+                retries=3)
+    f.fetch(URL)
+    assert f.fetch(URL) == PAGE
+    assert len(f.session.requests) == 4 and len(sleeps) == 2
+    assert f.stats_snapshot()["stale"] == 1
+
+
+def test_retries_and_timeout_can_be_overridden_per_call(tmp_path, sleeps):
+    f = fetcher(tmp_path, response(503), response(503), retries=5, timeout=30)
+    with pytest.raises(RuntimeError):
+        f.fetch(URL, retries=2, timeout=3)
+    assert [r["timeout"] for r in f.session.requests] == [3, 3]
+
+
+def test_max_age_skips_revalidation_until_it_expires(tmp_path, sleeps, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(html_fetcher.time, "time", lambda: now[0])
+    f = fetcher(tmp_path, response(200, PAGE, {"ETag": '"v1"'}), response(304),
+                response(200, "<p>22 days.</p>"), max_age=3600)
+
+    f.fetch(URL)
+    now[0] += 3599
+    assert f.fetch(URL) == PAGE
+    assert len(f.session.requests) == 1
+    now[0] += 2
+    assert f.fetch(URL) == PAGE  # expired: revalidated, 304 restarts the clock
+    assert len(f.session.requests) == 2
+    now[0] += 3599
+    assert f.fetch(URL) == PAGE
+    now[0] += 2
+    assert f.fetch(URL) == "<p>22 days.</p>"
+    assert f.stats_snapshot()["fresh"] == 2
+
+
+def test_fetch_all_reports_each_run(tmp_path, sleeps):
+    urls = [f"https://hr.example/page{i}" for i in range(3)]
+    f = fetcher(tmp_path, *[response(200, PAGE, {"ETag": '"v1"'}) for _ in urls],
+                *[response(304) for _ in urls], workers=1)  # replies are consumed in order
+
+    first = f.fetch_all(urls)
+    assert first == {u: PAGE for u in urls}
+    assert f.last_run_stats["downloaded"] == 3
+    f.fetch_all(urls)
+    assert f.last_run_stats == {"downloaded": 0, "not_modified": 3, "fresh": 0, "stale": 0,
+                                "failed": 0}
+    assert f.stats_snapshot()["downloaded"] == 3  # totals stay cumulative
+
+
+def test_fetch_all_returns_failures(tmp_path, sleeps):
+    f = fetcher(tmp_path, response(404), workers=1)
+    result = f.fetch_all([URL])
+    assert isinstance(result[URL], RuntimeError)
+    assert f.last_run_stats["failed"] == 1
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Golden-output test for TextProcessor.html_to_text_keep_headers
+Checks the lxml extractor against saved outputs of the BeautifulSoup reference
+on synthetic fixture pages (see test_fixtures/html_to_text/README.txt)
+
+Usage:
+    python test_html_to_text.py              # run the checks
+    python test_html_to_text.py --update     # regenerate *.expected.txt from the reference
+    python test_html_to_text.py --download   # replace the fixtures with live URLS pages, then --update
+"""
+
+import sys
+import pathlib
+import argparse
+
+from rag_pipeline import URLS, TextProcessor
+
+FIXTURE_DIR = pathlib.Path(__file__).parent / "test_fixtures" / "html_to_text"
+# Synthetic stand-ins for the pipeline sources (fixture name -> URL they imitate)
+SOURCE_FIXTURES = {
+    "andersen_labour_law_14_2025": URLS[0],
+    "manshurat_labour_law_2025": URLS[1],
+}
+
+# Markup the reference extractor emits twice; the lxml one emits it once
+DUPLICATION_CASES = [
+    ("<h2>Title <span><h3>Inner</h3></span></h2>", "## Title Inner"),
+    ("<div><h3><h4>Term</h4> definition</h3></div>", "### Term definition"),
+]
+
+
+def expected_path(name: str) -> pathlib.Path:
+    return FIXTURE_DIR / f"{name}.expected.txt"
+
+
+def production_input(html: str) -> str:
+    """The extractor always runs on readability output in the pipeline"""
+    return TextProcessor.readability_clean(html)
+
+
+def download_fixtures():
+    """Overwrite the synthetic fixtures with live copies of the source pages"""
+    for name, url in SOURCE_FIXTURES.items():
+        html = TextProcessor.fetch_html(url)
+        (FIXTURE_DIR / f"{name}.html").write_text(html, encoding="utf-8")
+        print(f"💾 {url} → {name}.html ({len(html)} chars)")
+
+
+def update_expected():
+    """Regenerate golden outputs with the BeautifulSoup reference"""
+    for html_path in sorted(FIXTURE_DIR.glob("*.html")):
+        html = html_path.read_text(encoding="utf-8")
+        text = TextProcessor.html_to_text_keep_headers_bs4(production_input(html))
+        expected_path(html_path.stem).write_text(text + "\n", encoding="utf-8")
+        print(f"💾 {html_path.stem}.expected.txt ({len(text)} chars)")
+
+
+def test_golden_outputs():
+    """lxml extractor == saved reference output on every fixture page"""
+    pages = sorted(FIXTURE_DIR.glob("*.html"))
+    assert pages, f"No fixtures in {FIXTURE_DIR}"
+    for html_path in pages:
+        exp_path = expected_path(html_path.stem)
+        assert exp_path.exists(), f"{html_path.stem}: missing {exp_path.name} (run with --update)"
+        expected = exp_path.read_text(encoding="utf-8").rstrip("\n")
+        got = TextProcessor.html_to_text_keep_headers(
+            production_input(html_path.read_text(encoding="utf-8")))
+        assert got.splitlines() == expected.splitlines(), html_path.stem
+
+
+def test_no_duplicate_blocks():
+    """Nested headings / paragraphs come out once"""
+    for html, expected in DUPLICATION_CASES:
+        assert TextProcessor.html_to_text_keep_headers(html) == expected, html
+
+
+def test_empty_input():
+    """Empty or text-free HTML gives empty text instead of raising"""
+    for html in ("", "   ", "<html><body><script>x()</script></body></html>"):
+        assert TextProcessor.html_to_text_keep_headers(html) == "", repr(html)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Golden-output test for html_to_text_keep_headers")
+    parser.add_argument("--update", action="store_true",
+                        help="regenerate expected outputs from the BeautifulSoup reference")
+    parser.add_argument("--download", action="store_true",
+                        help="re-download the source pages before --update")
+    args = parser.parse_args()
+
+    if args.download:
+        download_fixtures()
+    if args.download or args.update:
+        update_expected()
+        sys.exit(0)
+
+    print("🚀 Testing HTML to text extraction")
+    print("=" * 50)
+    failed = 0
+    for test in (test_golden_outputs, test_no_duplicate_blocks, test_empty_input):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed += 1
+
+    print("=" * 50)
+    if failed:
+        print("❌ Some tests failed. Check the errors above.")
+        sys.exit(1)
+    print("🎉 All tests passed!")
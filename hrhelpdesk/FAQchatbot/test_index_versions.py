@@ -0,0 +1,143 @@
+"""
+Tests for index snapshot validation, rollback and pruning
+"""
+
+import json
+import os
+
+import pytest
+
+import rag_pipeline
+from conftest import FakeEmbedder
+from index_versions import (MANIFEST_FILE, SnapshotError, check_snapshot, current_version,
+                            list_versions, prune_versions, set_current_version,
+                            verify_checksums, version_dir)
+
+
+def edit_manifest(directory, **fields):
+    path = directory / MANIFEST_FILE
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    manifest.update(fields)
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def test_fresh_snapshot_is_valid(service):
+    rag = service.build_snapshot()
+    manifest = check_snapshot(rag.index_dir, service.snapshot_requirements(rag.embedder))
+    assert manifest["vectors"] == rag.index.ntotal == 3
+    assert manifest["embedding_backend"] == FakeEmbedder.backend_id and manifest["dim"] == 32
+    assert verify_checksums(rag.index_dir) == []
+    assert service.load_snapshot(rag.index_dir.name).index.ntotal == 3
+
+
+def test_tampered_vector_count_is_refused(service):
+    rag = service.build_snapshot()
+    edit_manifest(rag.index_dir, vectors=rag.index.ntotal + 1)
+    with pytest.raises(SnapshotError, match="3 vectors loaded, manifest says 4"):
+        service.load_snapshot(rag.index_dir.name)
+
+
+def test_resized_file_is_refused(service):
+    rag = service.build_snapshot()
+    with open(rag.index_dir / "faiss.index", "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(SnapshotError, match="faiss.index changed"):
+        check_snapshot(rag.index_dir)
+    with pytest.raises(SnapshotError):
+        service.load_snapshot(rag.index_dir.name)
+
+
+def test_same_size_edit_is_caught_by_checksums(service):
+    rag = service.build_snapshot()
+    path = rag.index_dir / "sources.json"
+    st = path.stat()
+    data = bytearray(path.read_bytes())
+    data[0:1] = b" " if data[0:1] != b" " else b"\n"
+    path.write_bytes(bytes(data))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    check_snapshot(rag.index_dir)  # size and mtime still match
+    assert verify_checksums(rag.index_dir) == ["sources.json"]
+
+
+@pytest.mark.parametrize("embedder", [
+    FakeEmbedder(dim=16),
+    type("OtherModel", (FakeEmbedder,), {"backend_id": "fake:other"})(),
+])
+def test_snapshot_for_another_embedder_is_refused(service, monkeypatch, embedder):
+    built = service.build_snapshot()
+    monkeypatch.setattr(rag_pipeline, "make_embedder", lambda cache=None: embedder)
+
+    with pytest.raises(SnapshotError, match="built with (dim|embedding_backend)="):
+        service.load_snapshot(built.index_dir.name)
+    # The service refuses it and builds a version for the embedder it has
+    rag = service.open_pipeline()
+    assert rag.index_dir.name != built.index_dir.name
+    assert rag.index_dir.name == current_version(service.INDEX_DIR)
+    assert rag.index.index.d == embedder.dim
+
+
+def test_rollback_skips_invalid_versions(service):
+    oldest = service.build_snapshot().index_dir.name
+    broken = service.build_snapshot().index_dir
+    newest = service.build_snapshot().index_dir.name
+    (broken / "faiss.index").unlink()
+
+    assert service.rollback() == oldest
+    assert current_version(service.INDEX_DIR) == oldest
+    assert list_versions(service.INDEX_DIR) == [oldest, broken.name, newest]
+
+    set_current_version(service.INDEX_DIR, newest)
+    with pytest.raises(SnapshotError, match="faiss.index is missing"):
+        service.rollback(broken.name)
+    assert current_version(service.INDEX_DIR) == newest
+
+
+def test_rollback_without_an_earlier_valid_version(service):
+    service.build_snapshot()
+    with pytest.raises(SnapshotError, match="No earlier valid index version"):
+        service.rollback()
+
+
+def test_rollback_swaps_the_served_pipeline(service):
+    first = service.build_snapshot().index_dir.name
+    served = service.build_snapshot()
+    service._swap_pipeline(served)
+
+    assert service.rollback() == first
+    rolled_back = service.get_rag_pipeline()
+    assert rolled_back is not served and rolled_back.index_dir.name == first
+    assert rolled_back.embedder is served.embedder
+
+
+def test_prune_keeps_current_and_protected(tmp_path):
+    names = ["v1", "v2", "v3", "v4", "v5"]
+    for name in names:
+        version_dir(tmp_path, name).mkdir(parents=True)
+    set_current_version(tmp_path, "v2")
+
+    removed = prune_versions(tmp_path, keep=1, protect=["v3"])
+    assert removed == ["v1", "v4"]
+    assert list_versions(tmp_path) == ["v2", "v3", "v5"]
+    assert prune_versions(tmp_path, keep=5) == []
+
+
+def test_rebuild_keeps_versions_still_being_served(service, monkeypatch):
+    monkeypatch.setattr(service, "INDEX_KEEP_VERSIONS", 1)
+    in_flight = service.get_rag_pipeline()  # a request holding the served pipeline
+    held = in_flight.index_dir.name
+
+    for _ in range(2):
+        service._swap_pipeline(service.build_snapshot(reuse=service.get_rag_pipeline()))
+
+    # Only the draining request protects `held` now (the middle version was
+    # served while the last build ran, so it is kept as well)
+    held_then, middle, newest = list_versions(service.INDEX_DIR)
+    assert held_then == held
+    assert current_version(service.INDEX_DIR) == newest
+
+    del in_flight
+    service._swap_pipeline(service.build_snapshot(reuse=service.get_rag_pipeline()))
+    versions = list_versions(service.INDEX_DIR)
+    assert held not in versions and middle not in versions
+    assert versions == [newest, current_version(service.INDEX_DIR)]
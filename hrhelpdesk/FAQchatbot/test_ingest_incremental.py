@@ -0,0 +1,130 @@
+"""
+Tests for incremental ingest: only changed chunks are re-embedded
+"""
+
+import pytest
+
+import local_corpus
+import rag_pipeline
+from conftest import FakeEmbedder
+from local_corpus import file_hash, source_id
+from rag_pipeline import FaissIndex, RAGPipeline
+
+LEAVE = """# Annual leave
+Employees accrue two and a half days of annual leave for every month worked.
+
+# Sick leave
+Sick leave requires a medical certificate after the second consecutive day.
+
+# Carry over
+Up to ten unused leave days can be carried over into the next calendar year.
+"""
+
+PAYROLL = """# Pay day
+Salaries are paid on the twenty-fifth of every month by bank transfer.
+
+# Payslips
+Payslips are published in the self-service portal two days before pay day.
+"""
+
+
+@pytest.fixture(autouse=True)
+def offline_corpus(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "CORPUS_WORKERS", 1)  # parse in-process
+    monkeypatch.setattr(rag_pipeline, "DEDUP_MODE", "off")
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "corpus"
+    root.mkdir()
+    (root / "leave.md").write_text(LEAVE, encoding="utf-8")
+    (root / "payroll.md").write_text(PAYROLL, encoding="utf-8")
+    return root
+
+
+def make_pipeline(tmp_path, sources, embedder=None):
+    index_dir = tmp_path / "index"
+    index_dir.mkdir(exist_ok=True)
+    index = FaissIndex(32, index_dir / "faiss.index", index_dir / "metadata.pkl",
+                       index_type="flat", backend_id=FakeEmbedder.backend_id)
+    rag = RAGPipeline(sources, embedder or FakeEmbedder(), index, generator=None)
+    rag.checkpoint_dir = tmp_path / "checkpoints"
+    return rag
+
+
+def indexed_ids(rag):
+    return sorted(m["id"] for m in rag.index.metadata.values())
+
+
+def test_changed_source_reembeds_only_changed_chunks(tmp_path, corpus):
+    sources = [source_id(corpus / "leave.md"), source_id(corpus / "payroll.md")]
+    make_pipeline(tmp_path, sources).ingest(force_rebuild=True)
+
+    edited = LEAVE.replace("after the second consecutive day", "after the third consecutive day")
+    (corpus / "leave.md").write_text(edited, encoding="utf-8")
+    embedder = FakeEmbedder()
+    rag = make_pipeline(tmp_path, sources, embedder)
+    rag.ingest(incremental=True)
+
+    assert embedder.embedded == [
+        d["text"] for d in rag.index.metadata.values() if "third consecutive" in d["text"]]
+    assert len(embedder.embedded) == 1
+    assert rag.index.ntotal == 5
+
+
+def test_removed_source_drops_its_ids(tmp_path, corpus):
+    leave, payroll = source_id(corpus / "leave.md"), source_id(corpus / "payroll.md")
+    full = make_pipeline(tmp_path, [leave, payroll])
+    full.ingest(force_rebuild=True)
+    payroll_ids = [i for i in indexed_ids(full) if i.startswith(payroll)]
+    assert len(payroll_ids) == 2
+
+    embedder = FakeEmbedder()
+    rag = make_pipeline(tmp_path, [leave], embedder)
+    rag.ingest(incremental=True)
+
+    assert all(i.startswith(leave) for i in indexed_ids(rag))
+    assert rag.index.ntotal == 3
+    assert payroll not in rag._load_sources()
+    assert embedder.calls == []
+
+
+def test_unchanged_sources_make_no_embed_calls(tmp_path, corpus):
+    sources = [source_id(corpus / "leave.md"), source_id(corpus / "payroll.md")]
+    first = make_pipeline(tmp_path, sources)
+    first.ingest(force_rebuild=True)
+    before = indexed_ids(first)
+
+    embedder = FakeEmbedder()
+    rag = make_pipeline(tmp_path, sources, embedder)
+    rag.ingest(incremental=True)
+
+    assert embedder.calls == []
+    assert indexed_ids(rag) == before
+
+
+def test_unchanged_files_are_not_parsed_again(tmp_path, corpus, monkeypatch):
+    sources = [source_id(corpus / "leave.md"), source_id(corpus / "payroll.md")]
+    make_pipeline(tmp_path, sources).ingest(force_rebuild=True)
+    parsed = []
+    real_parse = local_corpus.parse_file
+
+    def counting_parse(source, html_to_text):
+        parsed.append(source)
+        return real_parse(source, html_to_text)
+
+    monkeypatch.setattr(local_corpus, "parse_file", counting_parse)
+
+    # Rewritten with the same bytes: a new mtime, but the same SHA-256
+    (corpus / "leave.md").write_text(LEAVE, encoding="utf-8")
+    (corpus / "payroll.md").write_text(PAYROLL.replace("twenty-fifth", "last day"), encoding="utf-8")
+    embedder = FakeEmbedder()
+    rag = make_pipeline(tmp_path, sources, embedder)
+    rag.ingest(incremental=True)
+
+    assert parsed == [source_id(corpus / "payroll.md")]
+    assert len(embedder.calls) == 1 and all("last day" in t for t in embedder.calls[0])
+    saved = rag._load_sources()
+    assert saved[sources[1]]["file_hash"] == file_hash(corpus / "payroll.md")
+    assert saved[sources[0]]["file_hash"] == file_hash(corpus / "leave.md")
@@ -0,0 +1,121 @@
+"""
+Tests for the per-stage ingest profile, on a fake clock
+"""
+
+import json
+
+import pytest
+
+import ingest_profile
+from ingest_profile import IngestProfiler
+
+
+class FakeClock:
+    """perf_counter / process_time / thread_time that only move when told to"""
+
+    def __init__(self):
+        self.wall = 100.0
+        self.cpu = 10.0
+
+    def advance(self, wall: float, cpu: float = 0.0):
+        self.wall += wall
+        self.cpu += cpu
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ingest_profile.time, "perf_counter", lambda: clock.wall)
+    monkeypatch.setattr(ingest_profile.time, "process_time", lambda: clock.cpu)
+    monkeypatch.setattr(ingest_profile.time, "thread_time", lambda: clock.cpu)
+    monkeypatch.setattr(ingest_profile, "peak_rss_mb", lambda: 256.0)
+    return clock
+
+
+def test_phases_accumulate(clock):
+    profiler = IngestProfiler()
+    clock.advance(1.0)
+    with profiler.phase("add", items=10):
+        clock.advance(2.0, cpu=1.5)
+    clock.advance(0.5)
+    with profiler.phase("add", items=5):
+        clock.advance(1.0, cpu=1.0)
+
+    add = profiler.report()["stages"][0]
+    assert add == {"stage": "add", "kind": "phase", "wall_s": 3.0, "cpu_s": 2.5, "items_in": 0,
+                   "items_out": 15, "items_per_s": 5.0, "rss_mb": 256.0, "span_s": 3.5}
+
+
+def test_phase_is_recorded_when_it_raises(clock):
+    profiler = IngestProfiler()
+    with pytest.raises(RuntimeError):
+        with profiler.phase("save"):
+            clock.advance(0.25)
+            raise RuntimeError("disk full")
+    assert profiler.report()["stages"][0]["wall_s"] == 0.25
+
+
+def test_stream_stage_excludes_waits_on_its_neighbours(clock):
+    profiler = IngestProfiler()
+
+    def upstream():
+        for page in ("a", "b", "c"):
+            clock.advance(5.0)  # the stage before is slow
+            yield page
+
+    def chunk(pages):
+        for page in pages:
+            clock.advance(1.0, cpu=0.5)
+            yield page + "1"
+            yield page + "2"
+
+    timed = profiler.wrap("chunk", chunk)
+    out = []
+    for item in timed(upstream()):
+        clock.advance(3.0)  # the stage after is slow
+        out.append(item)
+
+    assert out == ["a1", "a2", "b1", "b2", "c1", "c2"]
+    st = profiler.report()["stages"][0]
+    assert st["kind"] == "stream"
+    assert st["wall_s"] == 3.0 and st["cpu_s"] == 1.5
+    assert (st["items_in"], st["items_out"]) == (3, 6)
+    assert st["items_per_s"] == 2.0
+    assert st["span_s"] == 3 * 5.0 + 3 * 1.0 + 6 * 3.0
+
+
+def test_report_orders_stages_by_start_and_saves(clock, tmp_path):
+    profiler = IngestProfiler()
+    profiler.wrap("unused", lambda items: items)  # a stage that never ran
+    clock.advance(1.0)
+    with profiler.phase("train"):
+        clock.advance(4.0, cpu=8.0)
+    timed = profiler.wrap("fetch", lambda items: iter(["page"]))
+    list(timed(iter([])))
+    profiler.extra.update(mode="full", vectors=3)
+
+    report = profiler.report()
+    assert [s["stage"] for s in report["stages"]] == ["train", "fetch", "unused"]
+    assert report["total_wall_s"] == 5.0 and report["total_cpu_s"] == 8.0
+    assert report["mode"] == "full" and report["vectors"] == 3
+    assert "span_s" not in report["stages"][2] and report["stages"][2]["items_per_s"] is None
+
+    profiler.save(tmp_path / "ingest_profile.json")
+    assert json.loads((tmp_path / "ingest_profile.json").read_text(encoding="utf-8")) == report
+    lines = profiler.format().splitlines()
+    assert lines[0] == "Ingest profile: 5.00s wall, 8.00s CPU, peak RSS 256 MB"
+    assert lines[3].split() == ["train", "4.000", "8.000", "0", "0", "-", "256"]
+
+
+def test_trace_memory_reports_python_peaks(clock):
+    profiler = IngestProfiler(trace_memory=True)
+    try:
+        with profiler.phase("alloc"):
+            block = bytearray(8 * 1024 * 1024)
+            del block
+        report = profiler.report()
+    finally:
+        profiler.close()
+    assert report["traced_memory"] is True
+    assert report["stages"][0]["py_peak_mb"] >= 7.9
+    assert "py peak MB" in profiler.format()
@@ -0,0 +1,205 @@
+"""
+Tests for the threaded ingest stages and batch checkpoints
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import rag_pipeline
+from conftest import FakeEmbedder, fake_vector
+from ingest_stages import BatchCheckpoint, StagePipeline
+from local_corpus import source_id
+from rag_pipeline import FaissIndex, RAGPipeline
+
+
+def run_with_timeout(fn, seconds=10.0):
+    """fn() in a thread; fails the test instead of hanging"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["value"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(seconds)
+    assert not t.is_alive(), "pipeline hung"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def double(items):
+    for x in items:
+        yield 2 * x
+
+
+def fail_on_three(items):
+    for x in items:
+        if x == 6:
+            raise ValueError("bad item")
+        yield x
+
+
+def test_stages_run_in_order():
+    stages = StagePipeline([("double", double), ("inc", lambda xs: (x + 1 for x in xs))],
+                           maxsize=2)
+    assert run_with_timeout(lambda: list(stages.run(range(20)))) == [2 * x + 1 for x in range(20)]
+    assert stages.counts == {"double": 20, "inc": 20}
+
+
+@pytest.mark.parametrize("sequential", [False, True])
+def test_middle_stage_failure_is_reraised(sequential):
+    def endless():
+        n = 0
+        while True:  # only stops if the pipeline tears the source stage down
+            yield n
+            n += 1
+
+    stages = StagePipeline([("double", double), ("check", fail_on_three), ("last", double)],
+                           maxsize=1, sequential=sequential)
+    source = range(100) if sequential else endless()
+    with pytest.raises(RuntimeError, match="stage 'check' failed: bad item") as err:
+        run_with_timeout(lambda: list(stages.run(source)))
+    assert isinstance(err.value.__cause__, ValueError)
+
+
+def test_consumer_stopping_early_stops_the_stages():
+    stages = StagePipeline([("double", double)], maxsize=1)
+
+    def first_three():
+        it = stages.run(iter(range(10 ** 9)))
+        out = [next(it) for _ in range(3)]
+        it.close()
+        return out
+
+    assert run_with_timeout(first_three) == [0, 2, 4]
+
+
+def batch(n, start=0):
+    docs = [{"id": f"doc{i}", "text": f"text {i}"} for i in range(start, start + n)]
+    vectors = np.vstack([fake_vector(d["text"], 8) for d in docs])
+    return vectors, docs, {f"url{start}": {"hash": str(start)}}
+
+
+def test_checkpoint_round_trip(tmp_path):
+    ckpt = BatchCheckpoint(tmp_path / "ckpt", {"backend": "fake"})
+    first, second = batch(2), batch(3, start=2)
+    ckpt.append(*first)
+    ckpt.append(*second, extra={"merges": [{"dropped_id": "x"}]})
+
+    done = BatchCheckpoint(tmp_path / "ckpt", {"backend": "fake"}).load()
+    assert len(done) == 2
+    for (vectors, docs, sources, _), expected in zip(done, (first, second)):
+        np.testing.assert_array_equal(vectors, expected[0])
+        assert docs == expected[1] and sources == expected[2]
+    assert done[1][3] == {"merges": [{"dropped_id": "x"}]}
+
+
+def test_checkpoint_with_other_fingerprint_is_discarded(tmp_path):
+    BatchCheckpoint(tmp_path / "ckpt", {"backend": "a"}).append(*batch(2))
+    assert BatchCheckpoint(tmp_path / "ckpt", {"backend": "b"}).load() == []
+    assert not (tmp_path / "ckpt").exists()
+
+
+def test_unlisted_batch_is_not_resumed(tmp_path):
+    ckpt = BatchCheckpoint(tmp_path / "ckpt", {})
+    ckpt.append(*batch(2))
+    # A crash after writing a batch's files but before state.json lists it
+    np.save(tmp_path / "ckpt" / "batch_00001.npy", batch(1, start=9)[0])
+    assert len(BatchCheckpoint(tmp_path / "ckpt", {}).load()) == 1
+
+
+def test_checkpoint_is_used_by_one_build_at_a_time(tmp_path):
+    ckpt = BatchCheckpoint(tmp_path / "ckpt", {})
+    with ckpt.locked():
+        with pytest.raises(RuntimeError, match="Another build is using"):
+            with BatchCheckpoint(tmp_path / "ckpt", {}).locked():
+                pass
+        ckpt.append(*batch(2))
+    with BatchCheckpoint(tmp_path / "ckpt", {}).locked() as again:
+        assert len(again.load()) == 1
+
+
+def test_fingerprint_covers_sources_and_index_settings(tmp_path):
+    def fingerprint(urls, index_type="flat", params=None):
+        index = FaissIndex(32, tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                           index_type=index_type, params=params)
+        return RAGPipeline(urls, FakeEmbedder(), index, generator=None)._checkpoint_fingerprint()
+
+    base = fingerprint(["a", "b"])
+    assert fingerprint(["b", "a"]) == base
+    assert fingerprint(["a", "b", "c"]) != base
+    assert fingerprint(["a", "b"], index_type="hnsw") != base
+    assert fingerprint(["a", "b"], params={"vector_dtype": "int8"}) != base
+
+
+def checkpointed_batches(directory):
+    try:
+        with open(directory / "state.json", "r", encoding="utf-8") as f:
+            return json.load(f)["batches"]
+    except (OSError, ValueError):
+        return []
+
+
+class FailingEmbedder(FakeEmbedder):
+    """Raises on the backend call after `fail_after` successful ones
+
+    Batches still queued behind a failing stage are dropped, so the failure
+    waits until the earlier batches are checkpointed to keep the test exact.
+    """
+
+    def __init__(self, fail_after: int, checkpoint_dir):
+        super().__init__()
+        self.fail_after = fail_after
+        self.checkpoint_dir = checkpoint_dir
+
+    def _encode_uncached(self, texts):
+        if len(self.calls) >= self.fail_after:
+            deadline = time.monotonic() + 10
+            while len(checkpointed_batches(self.checkpoint_dir)) < self.fail_after:
+                assert time.monotonic() < deadline, "batches were never checkpointed"
+                time.sleep(0.01)
+            raise ConnectionError("embedding API unavailable")
+        return super()._encode_uncached(texts)
+
+
+def test_full_ingest_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "CORPUS_WORKERS", 1)
+    monkeypatch.setattr(rag_pipeline, "DEDUP_MODE", "off")
+    monkeypatch.setattr(rag_pipeline, "INGEST_BATCH", 1)  # one source per batch
+    sources = []
+    for name in ("leave", "payroll", "travel"):
+        path = tmp_path / f"{name}.md"
+        path.write_text(f"# {name.title()}\nThe {name} policy applies to every permanent employee.\n",
+                        encoding="utf-8")
+        sources.append(source_id(path))
+    (tmp_path / "index").mkdir()
+
+    def make_pipeline(embedder):
+        index = FaissIndex(32, tmp_path / "index" / "faiss.index", tmp_path / "index" / "metadata.pkl",
+                           index_type="flat", backend_id=FakeEmbedder.backend_id)
+        rag = RAGPipeline(sources, embedder, index, generator=None)
+        rag.checkpoint_dir = tmp_path / "checkpoints"
+        return rag
+
+    failing = FailingEmbedder(fail_after=2, checkpoint_dir=tmp_path / "checkpoints")
+    with pytest.raises(RuntimeError, match="stage 'embed' failed"):
+        make_pipeline(failing).ingest(force_rebuild=True)
+    assert len(checkpointed_batches(tmp_path / "checkpoints")) == 2
+
+    embedder = FakeEmbedder()
+    rag = make_pipeline(embedder)
+    rag.ingest(force_rebuild=True)
+
+    # Only the source whose batch never reached the checkpoint is embedded again
+    assert len(embedder.calls) == 1
+    assert embedder.embedded[0] not in failing.embedded
+    assert rag.index.ntotal == 3
+    assert sorted(m["url"] for m in rag.index.metadata.values()) == sorted(sources)
@@ -0,0 +1,76 @@
+"""
+Tests for the BM25 lexical index and Arabic normalization
+"""
+
+import pytest
+
+from lexical_index import BM25Index, normalize_arabic, tokenize
+
+DOCS = {
+    101: "Article 74 of the labour law: annual leave is 21 days",
+    202: "المادة ٧٤ من نظام العمل: الإجازة السنوية واحد وعشرون يوماً",
+    303: "Sick leave needs a medical certificate",
+    404: "مكافأة نهاية الخدمة تحسب على أساس آخر أجر",
+    505: "Overtime is paid at 150% of the hourly wage",
+}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("الإِجَازَةُ", "الاجازه"),       # diacritics stripped, alef folded
+    ("أجر", "اجر"),
+    ("آخر", "اخر"),
+    ("ٱلعمل", "العمل"),
+    ("مستشفى", "مستشفي"),            # alef maksura -> ya
+    ("مكافأة", "مكافاه"),            # ta marbuta -> ha
+    ("الســـلام", "السلام"),          # tatweel
+    ("المادة ٧٤", "الماده 74"),       # Arabic-Indic digits
+    ("۱۲۳", "123"),                   # Persian digits
+    ("Article 74", "Article 74"),     # Latin text untouched
+])
+def test_normalize_arabic(raw, expected):
+    assert normalize_arabic(raw) == expected
+
+
+def test_tokenize_folds_spelling_variants():
+    assert tokenize("الإجازة السنويّة") == tokenize("الاجازه السنويه")
+    assert tokenize("Annual LEAVE, 21 days") == ["annual", "leave", "21", "days"]
+
+
+def build():
+    return BM25Index.build(list(DOCS), list(DOCS.values()))
+
+
+def test_search_finds_exact_terms():
+    index = build()
+    assert index.search("article 74", 5)[0][1] == 101
+    # Arabic-Indic digits in the document, Western digits in the query
+    assert index.search("المادة 74", 5)[0][1] == 202
+    assert index.search("مكافاة نهايه الخدمه", 1)[0][1] == 404
+    assert index.search("unknown words", 5) == []
+
+
+def test_search_ranks_and_truncates():
+    hits = build().search("leave", 1)
+    assert len(hits) == 1
+    scores = [s for s, _ in build().search("annual leave days", 5)]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("query", [
+    "annual leave", "المادة ٧٤", "sick medical certificate", "أجر", "paid wage 150",
+])
+def test_save_load_returns_same_ranking(tmp_path, query):
+    index = build()
+    index.save(tmp_path / "bm25")
+    assert BM25Index.exists(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25")
+
+    assert len(loaded) == len(index)
+    assert loaded.search(query, 5) == index.search(query, 5)
+
+
+def test_empty_index(tmp_path):
+    index = BM25Index.build([], [])
+    assert index.search("leave", 5) == []
+    index.save(tmp_path / "bm25")
+    assert BM25Index.load(tmp_path / "bm25").search("leave", 5) == []
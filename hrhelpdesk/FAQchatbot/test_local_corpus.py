@@ -0,0 +1,158 @@
+"""
+Tests for the local-directory corpus: scanning, parsing and file hashes
+"""
+
+import hashlib
+import os
+
+import pytest
+
+import local_corpus
+from local_corpus import (CorpusParser, decode_bytes, markdown_to_text, parse_file, scan_corpus,
+                          source_id, source_path)
+
+
+def write(path, text, encoding="utf-8"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text.encode(encoding))
+    return path
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "corpus"
+    for name in ("leave.md", "Policies/payroll.HTML", "Policies/notes.txt", "scan.pdf",
+                 "old.htm", "guide.markdown", "sub dir/الإجازات.md"):
+        write(root / name, "x")
+    for name in ("budget.xlsx", "data.json", "README", ".draft.md", ".git/HEAD.md",
+                 "Policies/.cache/page.html"):
+        write(root / name, "x")
+    return root
+
+
+def test_scan_keeps_supported_files_and_skips_hidden_ones(tree):
+    found = [source_path(s).relative_to(tree.resolve()).as_posix() for s in scan_corpus(tree)]
+    assert sorted(found) == sorted(["leave.md", "Policies/payroll.HTML", "Policies/notes.txt",
+                                    "scan.pdf", "old.htm", "guide.markdown",
+                                    "sub dir/الإجازات.md"])
+
+
+def test_scan_is_sorted_and_repeatable(tree):
+    first = scan_corpus(tree)
+    assert first == sorted(first) == scan_corpus(str(tree))
+
+
+def test_source_id_is_stable(tree, monkeypatch):
+    path = tree / "sub dir" / "الإجازات.md"
+    sid = source_id(path)
+    assert sid.startswith("file://") and " " not in sid
+    assert source_path(sid) == path.resolve()
+    monkeypatch.chdir(tree)
+    assert source_id(tree / "sub dir" / ".." / "sub dir" / "الإجازات.md") == sid
+    assert source_id(type(path)("sub dir/الإجازات.md")) == sid
+
+
+def test_scan_of_missing_directory(tmp_path):
+    with pytest.raises(FileNotFoundError, match="Corpus directory not found"):
+        scan_corpus(tmp_path / "nowhere")
+
+
+def test_markdown_keeps_headings():
+    md = """---
+title: Leave policy
+---
+Leave Policy
+============
+
+## Annual leave
+Employees get **21 days**, see [the handbook](https://hr.example/handbook).
+
+Carry over
+----------
+![chart](chart.png)
+<!-- internal note -->
+```
+Up to _ten_ days.
+```
+### الإجازة المرضية
+"""
+    assert markdown_to_text(md).splitlines() == [
+        "# Leave Policy",
+        "",
+        "## Annual leave",
+        "Employees get 21 days, see the handbook.",
+        "",
+        "## Carry over",
+        "",
+        "Up to _ten_ days.",
+        "",
+        "### الإجازة المرضية",
+    ]
+
+
+def test_decode_falls_back_to_windows_arabic():
+    assert decode_bytes("\ufeffإجازة".encode("utf-8")) == "إجازة"
+    assert decode_bytes("إجازة".encode("cp1256")) == "إجازة"
+
+
+def fake_html_to_text(html):
+    return f"html:{html}"
+
+
+def test_parse_file_dispatches_on_extension(tmp_path):
+    page = write(tmp_path / "page.HTM", "<p>Leave</p>")
+    notes = write(tmp_path / "notes.txt", "Line one\r\n\r\n\r\n\r\nLine two\r\n", encoding="cp1256")
+    md = write(tmp_path / "leave.md", "Leave\n=====\nText")
+
+    text, digest = parse_file(source_id(page), fake_html_to_text)
+    assert text == "html:<p>Leave</p>"
+    assert digest == hashlib.sha256(page.read_bytes()).hexdigest()
+    assert parse_file(source_id(notes), fake_html_to_text)[0] == "Line one\n\nLine two"
+    assert parse_file(source_id(md), fake_html_to_text)[0] == "# Leave\nText"
+    with pytest.raises(ValueError, match="Unsupported corpus file type"):
+        parse_file(source_id(write(tmp_path / "data.json", "{}")), fake_html_to_text)
+
+
+def test_pdf_without_pypdf_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_corpus, "PdfReader", None)
+    pdf = write(tmp_path / "scan.pdf", "%PDF-1.4")
+    with pytest.raises(RuntimeError, match="pypdf is not installed"):
+        parse_file(source_id(pdf), fake_html_to_text)
+
+
+def test_pdf_pages_are_joined(tmp_path, monkeypatch):
+    class FakePage:
+        def __init__(self, text):
+            self.text = text
+
+        def extract_text(self):
+            return self.text
+
+    class FakeReader:
+        def __init__(self, stream):
+            assert stream.read() == b"%PDF-1.4"
+            self.pages = [FakePage(" Article 1:\tLeave "), FakePage(None), FakePage("Article 2")]
+
+    monkeypatch.setattr(local_corpus, "PdfReader", FakeReader)
+    pdf = write(tmp_path / "scan.pdf", "%PDF-1.4")
+    assert parse_file(source_id(pdf), fake_html_to_text)[0] == "Article 1: Leave\n\nArticle 2"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parser_returns_failures_in_place(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(local_corpus, "PdfReader", None)
+    good = source_id(write(tmp_path / "a.txt", "alpha"))
+    pdf = source_id(write(tmp_path / "b.pdf", "%PDF-1.4"))
+    gone = source_id(tmp_path / "c.md")
+
+    with CorpusParser(fake_html_to_text, workers=workers) as parser:
+        results = parser.parse_all([good, pdf, gone])
+
+    assert list(results) == [good, pdf, gone]
+    assert results[good][0] == "alpha"
+    assert isinstance(results[gone], FileNotFoundError)
+    assert isinstance(results[pdf], Exception)  # unreadable PDF, or no pypdf in the worker
+
+
+def test_parser_defaults_to_one_worker_per_cpu():
+    assert CorpusParser(fake_html_to_text).workers == (os.cpu_count() or 1)
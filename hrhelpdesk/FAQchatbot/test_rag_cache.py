@@ -0,0 +1,208 @@
+"""
+Tests for the caches in rag_cache.py
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+import rag_cache
+from conftest import FakeEmbedder, fake_vector
+from rag_cache import (EmbeddingCache, QueryEmbeddingCache, SemanticAnswerCache, content_key,
+                       open_embedding_cache)
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.sqlite")
+    vecs = np.vstack([fake_vector("a", 8), fake_vector("b", 8)])
+    cache.put_many("m", ["a", "b"], vecs)
+
+    got = cache.get_many("m", ["b", "x", "a"])
+    assert sorted(got) == [0, 2]
+    np.testing.assert_array_equal(got[0], vecs[1])
+    np.testing.assert_array_equal(got[2], vecs[0])
+    assert got[0].dtype == np.float32
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_counts_concurrent_lookups(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.sqlite")
+    cache.put_many("m", ["a"], fake_vector("a", 8)[None])
+
+    def lookups():
+        for _ in range(200):
+            cache.get_many("m", ["a", "missing"])
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 8 * 200
+
+
+def test_embedding_cache_is_keyed_on_model(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.sqlite")
+    cache.put_many("model-a", ["text"], fake_vector("text", 8)[None])
+    assert cache.get_many("model-b", ["text"]) == {}
+    assert content_key("model-a", "text") != content_key("model-b", "text")
+
+
+def test_embedding_cache_persists_across_reopen(tmp_path):
+    path = tmp_path / "emb.sqlite"
+    cache = EmbeddingCache(path)
+    cache.put_many("m", ["a"], fake_vector("a", 8)[None])
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert len(reopened) == 1
+    np.testing.assert_array_equal(reopened.get_many("m", ["a"])[0], fake_vector("a", 8))
+
+
+def test_unusable_cache_file_disables_the_cache(tmp_path):
+    (tmp_path / "emb.sqlite").mkdir()  # a directory where the database should be
+    assert open_embedding_cache(tmp_path / "emb.sqlite") is None
+
+
+def test_embedder_only_sends_cache_misses(tmp_path):
+    embedder = FakeEmbedder(EmbeddingCache(tmp_path / "emb.sqlite"))
+    first = embedder.encode(["a", "b", "a"])
+    assert embedder.calls == [["a", "b"]]  # duplicates within a call embedded once
+
+    second = embedder.encode(["b", "c", "a"])
+    assert embedder.calls[-1] == ["c"]
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[2], first[0])
+
+    embedder.encode(["a", "b", "c"])
+    assert len(embedder.calls) == 2  # all hits, no backend call
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_query_cache_normalizes_queries():
+    cache = QueryEmbeddingCache(dim=8, capacity=4)
+    cache.put("  What are the WORKING hours? ", fake_vector("q", 8))
+    got = cache.get("what are the working   hours?")
+    assert got.shape == (1, 8)
+    np.testing.assert_array_equal(got[0], fake_vector("q", 8))
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(dim=8, capacity=2)
+    cache.put("a", fake_vector("a", 8))
+    cache.put("b", fake_vector("b", 8))
+    assert cache.get("a") is not None  # "b" is now the LRU entry
+    cache.put("c", fake_vector("c", 8))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_query_cache_entries_expire(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rag_cache.time, "monotonic", clock)
+    cache = QueryEmbeddingCache(dim=8, capacity=2, ttl_seconds=60)
+    cache.put("a", fake_vector("a", 8))
+
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 2
+    assert cache.get("a") is None
+    # The expired slot is reused without evicting anything
+    cache.put("b", fake_vector("b", 8))
+    cache.put("c", fake_vector("c", 8))
+    assert cache.stats()["evictions"] == 0
+
+
+def test_query_cache_returns_copies():
+    cache = QueryEmbeddingCache(dim=8, capacity=2)
+    cache.put("a", fake_vector("a", 8))
+    cache.get("a")[0, 0] = 99.0
+    assert cache.get("a")[0, 0] != 99.0
+
+
+def near(vector, noise, amount):
+    """vector nudged towards `noise` by `amount`, renormalized"""
+    v = vector + amount * noise
+    return v / np.linalg.norm(v)
+
+
+ANSWER = {"answer": "Twenty one days.", "sources": []}
+
+
+def test_answer_cache_similarity_threshold():
+    cache = SemanticAnswerCache(dim=32, capacity=4, threshold=0.95)
+    q = fake_vector("How many days of annual leave?", 32)
+    cache.store(q, ANSWER, tokens=120, index_version="v1")
+
+    close = near(q, fake_vector("noise", 32), 0.1)
+    far = near(q, fake_vector("noise", 32), 1.0)
+    assert float(close @ q) >= 0.95 > float(far @ q)
+
+    hit = cache.lookup(close, "v1")
+    assert hit["answer"] == ANSWER["answer"] and hit["cache_hit"] is True
+    assert hit["cache_similarity"] == pytest.approx(float(close @ q), rel=1e-5)
+    assert cache.lookup(far, "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["saved_tokens"] == 120
+
+
+def test_answer_cache_entries_expire(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rag_cache.time, "monotonic", clock)
+    cache = SemanticAnswerCache(dim=32, capacity=2, ttl_seconds=60)
+    q = fake_vector("q", 32)
+    cache.store(q, ANSWER, tokens=None, index_version="v1")
+
+    clock.now += 59
+    assert cache.lookup(q, "v1") is not None
+    assert cache.stats()["unmetered_hits"] == 1
+    clock.now += 2
+    assert cache.lookup(q, "v1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_answer_cache_only_matches_its_index_version():
+    cache = SemanticAnswerCache(dim=32, capacity=4)
+    q = fake_vector("q", 32)
+    cache.store(q, ANSWER, tokens=10, index_version="v1")
+
+    assert cache.lookup(q, "v2") is None
+    cache.store(q, {"answer": "Thirty days."}, tokens=10, index_version="v2")
+    # Requests on either side of a hot swap keep their own entries
+    for _ in range(3):
+        assert cache.lookup(q, "v1")["answer"] == "Twenty one days."
+        assert cache.lookup(q, "v2")["answer"] == "Thirty days."
+    assert cache.stats()["size"] == 2 and cache.stats()["invalidations"] == 0
+
+
+def test_answer_cache_reuses_old_version_slots_first(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rag_cache.time, "monotonic", clock)
+    cache = SemanticAnswerCache(dim=32, capacity=3)
+    old = [fake_vector(f"old {i}", 32) for i in range(2)]
+    for v in old:
+        cache.store(v, ANSWER, tokens=1, index_version="v1")
+        clock.now += 1
+    current = fake_vector("current", 32)
+    cache.store(current, ANSWER, tokens=1, index_version="v2")
+    clock.now += 1
+    assert cache.lookup(old[1], "v1") is not None  # old[0] is now the LRU v1 entry
+
+    for i in range(2):
+        clock.now += 1
+        cache.store(fake_vector(f"new {i}", 32), ANSWER, tokens=1, index_version="v2")
+
+    assert cache.stats()["invalidations"] == 2
+    assert cache.lookup(current, "v2") is not None  # older than the v1 entries, still kept
+    assert cache.lookup(old[0], "v1") is None and cache.lookup(old[1], "v1") is None
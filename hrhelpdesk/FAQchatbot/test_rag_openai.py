@@ -5,7 +5,7 @@ Test RAG pipeline with OpenAI API
 
 import os
 from dotenv import load_dotenv
-from rag_pipeline import answer_question
+from rag_service import answer_question
 
 # Load environment variables
 load_dotenv()
@@ -0,0 +1,108 @@
+"""
+Tests for background rebuilds and the hot swap of the served pipeline
+"""
+
+import asyncio
+
+import pytest
+
+from conftest import CORPUS
+from index_versions import current_version, list_versions
+from rag_pipeline import RAGPipeline
+
+
+def rebuild(service, incremental=True):
+    started, _ = service.start_rebuild(incremental=incremental)
+    assert started
+    service._rebuild_thread.join(30)
+    assert not service._rebuild_thread.is_alive()
+    return service.rebuild_status()
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_failed_rebuild_keeps_serving_the_old_pipeline(service, monkeypatch, incremental):
+    served = service.get_rag_pipeline()
+    version = current_version(service.INDEX_DIR)
+
+    def broken_ingest(self, *args, **kwargs):
+        raise RuntimeError("source unreachable")
+
+    monkeypatch.setattr(RAGPipeline, "ingest", broken_ingest)
+    status = rebuild(service, incremental)
+
+    assert status["state"] == "failed" and "source unreachable" in status["error"]
+    assert service._rag_pipeline is served
+    assert service.get_rag_pipeline() is served
+    assert current_version(service.INDEX_DIR) == version
+    assert list_versions(service.INDEX_DIR) == [version]  # the failed version is removed
+    assert served.retrieve("working hours")
+
+
+def test_successful_rebuild_swaps_the_pipeline(service, tmp_path):
+    served = service.get_rag_pipeline()
+    old_version = current_version(service.INDEX_DIR)
+    (tmp_path / "corpus" / "leave.md").write_text(
+        CORPUS["leave.md"].replace("second day", "third day"), encoding="utf-8")
+
+    status = rebuild(service)
+
+    new = service.get_rag_pipeline()
+    assert status["state"] == "succeeded"
+    assert new is not served
+    assert new.index_dir.name == status["version"] == current_version(service.INDEX_DIR)
+    assert old_version in list_versions(service.INDEX_DIR)  # kept for rollback
+    texts = [m["text"] for m in new.index.metadata.values()]
+    assert any("third day" in t for t in texts)
+    assert not any("second day" in t for t in texts)
+    # A request that started before the swap still holds the old index
+    assert any("second day" in m["text"] for m in served.index.metadata.values())
+    # Embedder and caches carry over to the new pipeline
+    assert new.embedder is served.embedder
+
+
+def test_rebuild_already_running(service, monkeypatch):
+    service.get_rag_pipeline()
+
+    class Running:
+        def is_alive(self):
+            return True
+
+    monkeypatch.setattr(service, "_rebuild_thread", Running())
+    started, status = service.start_rebuild()
+    assert not started and status["state"] == "idle"
+
+
+def test_moved_names_still_import_from_rag_pipeline():
+    import rag_pipeline
+    import rag_service
+
+    for name in ("answer_question", "get_rag_pipeline", "start_rebuild", "rollback", "main"):
+        assert getattr(rag_pipeline, name) is getattr(rag_service, name)
+    from rag_pipeline import answer_question_stream  # noqa: F401
+    with pytest.raises(AttributeError):
+        rag_pipeline.no_such_name
+
+
+@pytest.fixture
+def broken_pipeline(service, monkeypatch):
+    def fail():
+        raise RuntimeError("index missing")
+
+    monkeypatch.setattr(service, "get_rag_pipeline", fail)
+    monkeypatch.setattr(service, "_rag_pipeline", None)
+    return service
+
+
+def test_failure_gives_the_same_fallback_everywhere(broken_pipeline):
+    service = broken_pipeline
+    expected = {"query": "q", "answer": service.ERROR_ANSWER, "retrieved": [], "confidence": 0.0}
+
+    async def collect(stream):
+        return [event async for event in stream]
+
+    assert service.answer_question("q") == expected
+    assert asyncio.run(service.answer_question_async("q")) == expected
+    events = [("sources", {"retrieved": [], "confidence": 0.0, "cache_hit": False}),
+              ("token", service.ERROR_ANSWER), ("done", expected)]
+    assert list(service.answer_question_stream("q")) == events
+    assert asyncio.run(collect(service.answer_question_stream_async("q"))) == events
@@ -0,0 +1,176 @@
+"""
+Tests for the token-bucket rate limiter and the embedding retries, on an
+injected clock
+"""
+
+import asyncio
+import logging
+import re
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+import rag_pipeline
+import rate_limit
+from rate_limit import TokenBucketLimiter, backoff_delay
+
+
+class FakeClock:
+    """time.monotonic replacement; sleeping only advances the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float):
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", clock.async_sleep)
+    return clock
+
+
+def test_full_bucket_does_not_wait(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=0)
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.sleeps == []
+    assert limiter.stats()["throttled"] == 0
+
+
+def test_requests_per_minute(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=0)
+    start = clock.now
+    for _ in range(60 + 30):
+        limiter.acquire()
+    # The first minute's budget is spent at once, then one request per second
+    assert clock.now - start == pytest.approx(30.0)
+    assert limiter.stats()["throttled"] == 30
+
+
+def test_tokens_per_minute(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=0, tokens_per_minute=6000)
+    limiter.acquire(6000)
+    limiter.acquire(1500)
+    assert clock.sleeps == [pytest.approx(15.0)]
+    # Bigger than the whole bucket: waits for a full bucket instead of forever
+    limiter.acquire(10_000)
+    assert clock.now - 1000.0 == pytest.approx(75.0)
+
+
+def test_both_budgets_wait_for_the_slower_one(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=600)
+    limiter.acquire(600)
+    limiter.acquire(60)  # the request bucket still has room, the token bucket needs 6 s
+    assert clock.sleeps == [pytest.approx(6.0)]
+
+
+def test_bucket_refills_while_idle(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=0)
+    for _ in range(60):
+        limiter.acquire()
+    clock.now += 3600  # refills up to the bucket size, not beyond
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_pause_holds_every_caller(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=0, tokens_per_minute=0)
+    limiter.pause(20)
+    limiter.pause(5)  # a shorter pause does not cut the longer one
+    limiter.acquire()
+    assert clock.now == pytest.approx(1020.0)
+    assert limiter.stats()["waited_seconds"] == pytest.approx(20.0)
+
+
+def test_acquire_async(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=2, tokens_per_minute=0)
+
+    async def three():
+        for _ in range(3):
+            await limiter.acquire_async()
+
+    asyncio.run(three())
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_backoff_delay(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda lo, hi: hi)
+    assert [backoff_delay(a) for a in range(6)] == [1, 2, 4, 8, 16, 30]
+    assert backoff_delay(3, retry_after=2.5) == 2.5
+    assert backoff_delay(0, retry_after=120) == 30
+
+
+class FakeEmbeddings:
+    """openai.embeddings stand-in that fails `failures` times, then answers"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def create(self, model, input):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.test"))
+        data = [type("Item", (), {"index": i, "embedding": [1.0] * 4}) for i in range(len(input))]
+        return type("Response", (), {"data": data})
+
+
+@pytest.fixture
+def embedder(monkeypatch, clock):
+    monkeypatch.setattr(rag_pipeline, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(rag_pipeline, "EMB_DIM", 4)
+    monkeypatch.setattr(rag_pipeline, "EMB_MAX_RETRIES", 2)
+    monkeypatch.setattr(rag_pipeline.time, "sleep", clock.sleep)
+    return rag_pipeline.Embedder()
+
+
+def test_embedding_retries_log_every_attempt(embedder, monkeypatch, caplog):
+    fake = FakeEmbeddings(failures=2)
+    monkeypatch.setattr(openai, "embeddings", fake)
+    with caplog.at_level(logging.WARNING):
+        vectors = embedder.encode(["a", "b"])
+
+    assert vectors.shape == (2, 4) and fake.calls == 3
+    attempts = [re.search(r"failed \((\d+/\d+)\)", r.getMessage()).group(1)
+                for r in caplog.records]
+    assert attempts == ["1/3", "2/3"]  # EMB_MAX_RETRIES retries after the first try
+
+
+def test_embedding_gives_up_after_the_last_retry(embedder, monkeypatch):
+    fake = FakeEmbeddings(failures=3)
+    monkeypatch.setattr(openai, "embeddings", fake)
+    with pytest.raises(openai.APIConnectionError):
+        embedder.encode(["a"])
+    assert fake.calls == 3
+
+
+def test_encoding_nothing_skips_backend_and_cache(embedder, monkeypatch):
+    fake = FakeEmbeddings(failures=0)
+    monkeypatch.setattr(openai, "embeddings", fake)
+
+    class NoCache:
+        def get_many(self, *args):
+            raise AssertionError("cache queried for no texts")
+
+    embedder.cache = NoCache()
+    vectors = embedder.encode([])
+    assert vectors.shape == (0, 4) and vectors.dtype == np.float32
+    assert fake.calls == 0
@@ -0,0 +1,185 @@
+"""
+Tests for second-stage reranking: ordering, the latency budget and how the
+pipeline uses it
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+import rag_pipeline
+import reranker
+from conftest import FakeEmbedder, fake_vector
+from rag_pipeline import FaissIndex, RAGPipeline
+from reranker import CrossEncoderReranker, LexicalReranker, Reranker, make_reranker
+
+
+def hits(n):
+    return [(1.0 - i / 100, {"id": f"doc{i}", "text": f"clause {i}"}) for i in range(n)]
+
+
+class FakeTorch:
+    """torch stand-in that tracks whether inference mode is on"""
+
+    def __init__(self):
+        self.inference = False
+
+    @contextmanager
+    def inference_mode(self):
+        self.inference = True
+        try:
+            yield
+        finally:
+            self.inference = False
+
+
+class FakeCrossEncoder:
+    """Scores a pair by a fixed per-text table"""
+
+    def __init__(self, torch, scores):
+        self.torch = torch
+        self.scores = scores
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        assert self.torch.inference
+        self.batches.append(len(pairs))
+        return [self.scores[text] for _, text in pairs]
+
+
+def cross_encoder(scores, batch_size=4):
+    ce = CrossEncoderReranker.__new__(CrossEncoderReranker)  # no model download
+    Reranker.__init__(ce, batch_size)
+    ce._torch = FakeTorch()
+    ce._model = FakeCrossEncoder(ce._torch, scores)
+    return ce
+
+
+def test_cross_encoder_reorders_stably_by_score():
+    candidates = hits(6)
+    scores = {"clause 0": 0.1, "clause 1": 0.9, "clause 2": 0.5, "clause 3": 0.9,
+              "clause 4": -2.0, "clause 5": 0.5}
+    ce = cross_encoder(scores)
+
+    top, info = ce.rerank("q", candidates, top_k=5)
+
+    # Ties keep their retrieval order
+    assert [m["id"] for _, m in top] == ["doc1", "doc3", "doc2", "doc5", "doc0"]
+    assert top[0] is candidates[1]  # hits keep their retrieval score
+    assert ce._model.batches == [4, 2]
+    assert info == {"reranker": ce.name, "candidates": 6, "scored": 6, "over_budget": False,
+                    "ms": info["ms"]}
+
+
+def test_cross_encoder_yields_outside_inference_mode():
+    ce = cross_encoder({f"clause {i}": float(i) for i in range(6)}, batch_size=2)
+    batches = ce.score_batches("q", hits(6))
+    for batch in batches:
+        assert not ce._torch.inference
+        assert batch.dtype == np.float32
+
+
+def test_budget_stops_scoring_and_keeps_the_rest_in_order(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(reranker.time, "perf_counter", lambda: now[0])
+
+    class SlowReranker(Reranker):
+        def score_batches(self, query, hits):
+            for start in range(0, len(hits), self.batch_size):
+                now[0] += 0.04  # 40 ms per batch
+                yield np.arange(len(hits[start:start + self.batch_size]), dtype=np.float32)
+
+    candidates = hits(10)
+    top, info = SlowReranker(batch_size=3).rerank("q", candidates, top_k=10, budget_s=0.1)
+
+    # After two batches (80 ms) a third would take the total past 100 ms
+    assert info["scored"] == 6 and info["over_budget"]
+    assert [m["id"] for _, m in top] == ["doc2", "doc5", "doc1", "doc4", "doc0", "doc3",
+                                         "doc6", "doc7", "doc8", "doc9"]
+
+
+def test_first_batch_is_scored_even_over_budget(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(reranker.time, "perf_counter", lambda: now[0])
+
+    class VerySlow(Reranker):
+        def score_batches(self, query, hits):
+            now[0] += 5.0
+            yield np.zeros(self.batch_size, dtype=np.float32)
+            raise AssertionError("second batch started over budget")
+
+    _, info = VerySlow(batch_size=2).rerank("q", hits(4), top_k=4, budget_s=0.001)
+    assert info["scored"] == 2 and info["over_budget"]
+
+
+def test_lexical_reranker_prefers_query_terms():
+    candidates = [(0.80, {"text": "Employees receive a transport allowance."}),
+                  (0.78, {"text": "Annual leave is twenty one days per year."})]
+    top, _ = LexicalReranker().rerank("annual leave days", candidates, top_k=2)
+    assert top[0] is candidates[1]
+
+
+def test_make_reranker_modes(monkeypatch):
+    assert make_reranker("off") is None and make_reranker("") is None
+    assert isinstance(make_reranker("lexical"), LexicalReranker)
+    with pytest.raises(ValueError, match="Unknown RAG_RERANK mode"):
+        make_reranker("colbert")
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("The cross-encoder reranker needs sentence-transformers")
+
+    monkeypatch.setattr(reranker, "CrossEncoderReranker", unavailable)
+    assert isinstance(make_reranker("cross-encoder", "some/model"), LexicalReranker)
+
+
+DOCS = [{"id": f"https://hr.example/page{i}::sec0::chunk0", "url": f"https://hr.example/page{i}",
+         "section": "Policy", "chunk_id": 0, "text": f"Clause {i} on leave for grade {i % 5}"}
+        for i in range(40)]
+
+
+def make_rag(tmp_path, rerank):
+    index = FaissIndex(32, tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                       index_type="flat", backend_id=FakeEmbedder.backend_id)
+    index.build(np.vstack([fake_vector(d["text"], 32) for d in DOCS]), DOCS)
+    return RAGPipeline([], FakeEmbedder(), index, generator=None, reranker=rerank)
+
+
+class Reverse(Reranker):
+    """Scores candidates in reverse retrieval order, recording how many it saw"""
+
+    name = "reverse"
+
+    def __init__(self):
+        super().__init__(batch_size=100)
+        self.seen = []
+
+    def score_batches(self, query, hits):
+        self.seen.append(len(hits))
+        yield np.arange(len(hits), dtype=np.float32)
+
+
+@pytest.fixture
+def rerank_settings(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "HYBRID_MODE", "off")
+    monkeypatch.setattr(rag_pipeline, "RERANK_CANDIDATES", 12)
+    monkeypatch.setattr(rag_pipeline, "RERANK_TOP_K", 3)
+
+
+def test_pipeline_fetches_the_candidate_budget(tmp_path, rerank_settings):
+    rerank = Reverse()
+    rag = make_rag(tmp_path, rerank)
+    query = "Clause 7 on leave"
+    dense = rag.index.search_batch(rag._embed_query(query), top_k=12)[0]
+
+    got = rag.retrieve(query)
+
+    assert rerank.seen == [12]
+    assert [m["id"] for _, m in got] == [m["id"] for _, m in dense[::-1][:3]]
+
+
+def test_pipeline_without_reranker_passes_hits_through(tmp_path, rerank_settings):
+    rag = make_rag(tmp_path, None)
+    got = rag.retrieve("Clause 7 on leave")
+    assert len(got) == rag_pipeline.TOP_K
+    assert [s for s, _ in got] == sorted((s for s, _ in got), reverse=True)
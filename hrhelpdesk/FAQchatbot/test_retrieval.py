@@ -0,0 +1,83 @@
+"""
+Tests that batched retrieval returns what per-query retrieval does
+"""
+
+import numpy as np
+import pytest
+
+import rag_pipeline
+from conftest import FakeEmbedder, fake_vector
+from rag_cache import QueryEmbeddingCache
+from rag_pipeline import FaissIndex, RAGPipeline, fuse_rankings
+
+TOPICS = ["annual leave", "sick leave", "overtime pay", "working hours", "end of service",
+          "الإجازة السنوية", "ساعات العمل", "مكافأة نهاية الخدمة"]
+DOCS = [{"id": f"https://hr.example/page{i}::sec0::chunk0", "url": f"https://hr.example/page{i}",
+         "section": "Policy", "chunk_id": 0,
+         "text": f"Clause {i} on {TOPICS[i % len(TOPICS)]} for grade {i % 5} employees"}
+        for i in range(100)]
+QUERIES = ["How many days of annual leave?", "overtime pay grade 3", "ساعات العمل",
+           "How many days of annual leave?", "end of service for grade 1 employees"]
+
+
+def make_rag(tmp_path, query_cache=None):
+    index = FaissIndex(32, tmp_path / "faiss.index", tmp_path / "metadata.pkl",
+                       index_type="flat", backend_id=FakeEmbedder.backend_id)
+    index.build(np.vstack([fake_vector(d["text"], 32) for d in DOCS]), DOCS)
+    index.save()  # also builds the BM25 index
+    return RAGPipeline([], FakeEmbedder(), index, generator=None, query_cache=query_cache)
+
+
+def assert_same_hits(batched, single):
+    assert len(batched) == len(single)
+    for got, want in zip(batched, single):
+        assert [m["id"] for _, m in got] == [m["id"] for _, m in want]
+        np.testing.assert_allclose([s for s, _ in got], [s for s, _ in want], rtol=1e-5)
+
+
+@pytest.mark.parametrize("hybrid_mode", ["off", "rrf", "weighted"])
+def test_retrieve_many_matches_retrieve(tmp_path, monkeypatch, hybrid_mode):
+    monkeypatch.setattr(rag_pipeline, "HYBRID_MODE", hybrid_mode)
+    # Few dense candidates, so fused lists include BM25-only hits whose
+    # cosine is computed from reconstructed vectors
+    monkeypatch.setattr(rag_pipeline, "HYBRID_CANDIDATES", rag_pipeline.TOP_K)
+    rag = make_rag(tmp_path)
+    assert rag.index.lexical is not None and len(rag.index.lexical) == len(DOCS)
+
+    batched = rag.retrieve_many(QUERIES)
+
+    assert_same_hits(batched, [rag.retrieve(q) for q in QUERIES])
+    assert all(len(hits) == rag_pipeline.TOP_K for hits in batched)
+
+
+def test_hybrid_results_differ_from_dense_only(tmp_path, monkeypatch):
+    rag = make_rag(tmp_path)
+    monkeypatch.setattr(rag_pipeline, "HYBRID_MODE", "off")
+    dense = rag.retrieve_many(QUERIES)
+    monkeypatch.setattr(rag_pipeline, "HYBRID_MODE", "rrf")
+    assert rag.retrieve_many(QUERIES) != dense
+
+
+def test_retrieve_many_embeds_each_distinct_query_once(tmp_path):
+    rag = make_rag(tmp_path, QueryEmbeddingCache(dim=32, capacity=16))
+
+    batched = rag.retrieve_many(QUERIES)
+
+    assert rag.embedder.calls == [list(dict.fromkeys(QUERIES))]
+    # Served from the query cache now, and still the same hits
+    assert_same_hits(batched, [rag.retrieve(q) for q in QUERIES])
+    assert len(rag.embedder.calls) == 1
+
+
+def test_unknown_hybrid_mode_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "HYBRID_MODE", "bm25")
+    with pytest.raises(ValueError, match="Unknown hybrid mode 'bm25'"):
+        make_rag(tmp_path)
+    with pytest.raises(ValueError, match="Unknown hybrid mode"):
+        fuse_rankings([(0.9, 1)], [(3.2, 2)], "bm25", top_k=2)
+
+
+def test_retrieve_many_without_queries(tmp_path):
+    rag = make_rag(tmp_path)
+    assert rag.retrieve_many([]) == []
+    assert rag.embedder.calls == []
@@ -0,0 +1,159 @@
+"""
+Tests for single-flight coalescing of identical concurrent calls
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+STATS_KEYS = {"calls", "executions", "collapsed", "collapse_rate", "failures",
+              "max_waiters", "in_flight"}
+
+
+def wait_until(condition, seconds=5.0):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def run_threads(flight, fn, n=5, key="q"):
+    """Call flight.do(key, fn) from n threads; returns each thread's (result, shared) or error"""
+    outcomes = [None] * n
+
+    def worker(i):
+        try:
+            outcomes[i] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, outcomes
+
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def answer():
+        runs.append(1)
+        release.wait(5)
+        return {"answer": 42}
+
+    threads, outcomes = run_threads(flight, answer)
+    wait_until(lambda: flight.stats()["collapsed"] == 4)
+    assert flight.stats()["in_flight"] == 1
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(runs) == 1
+    assert [shared for _, shared in outcomes].count(False) == 1
+    assert all(result is outcomes[0][0] for result, _ in outcomes)
+    assert flight.stats() == {"calls": 5, "executions": 1, "collapsed": 4, "collapse_rate": 0.8,
+                              "failures": 0, "max_waiters": 4, "in_flight": 0}
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ConnectionError("LLM unavailable")
+
+    def failing():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = run_threads(flight, failing)
+    wait_until(lambda: flight.stats()["collapsed"] == 4)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert all(o is error for o in outcomes)
+    assert flight.stats()["failures"] == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_finished_call_is_not_cached():
+    flight = SingleFlight()
+    counter = iter(range(10))
+    assert flight.do("q", lambda: next(counter)) == (0, False)
+    assert flight.do("q", lambda: next(counter)) == (1, False)
+    assert flight.do("other", lambda: next(counter)) == (2, False)
+    assert flight.stats()["collapsed"] == 0 and flight.stats()["collapse_rate"] == 0.0
+
+
+def test_stats_contract():
+    assert SingleFlight().stats() == {"calls": 0, "executions": 0, "collapsed": 0,
+                                      "collapse_rate": 0.0, "failures": 0, "max_waiters": 0,
+                                      "in_flight": 0}
+    assert set(AsyncSingleFlight().stats()) == STATS_KEYS
+
+
+def test_async_concurrent_calls_run_once():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        runs = []
+
+        async def answer():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", answer) for _ in range(5)))
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(r == "answer" for r, _ in results)
+    assert flight.stats() == {"calls": 5, "executions": 1, "collapsed": 4, "collapse_rate": 0.8,
+                              "failures": 0, "max_waiters": 4, "in_flight": 0}
+
+
+def test_async_exception_reaches_every_waiter():
+    async def scenario():
+        flight = AsyncSingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad prompt")
+
+        results = await asyncio.gather(*(flight.do("q", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats()["failures"] == 1 and flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("cancel_first", [True, False])
+def test_cancelled_waiter_does_not_cancel_the_run(cancel_first):
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def answer():
+            await release.wait()
+            return "answer"
+
+        callers = [asyncio.ensure_future(flight.do("q", answer)) for _ in range(3)]
+        await asyncio.sleep(0)  # all three are waiting on the run
+        gone = callers[0] if cancel_first else callers[1]
+        gone.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        rest = await asyncio.gather(*(c for c in callers if c is not gone))
+        return flight, gone, rest
+
+    flight, gone, rest = asyncio.run(scenario())
+    assert gone.cancelled()
+    assert [r for r, _ in rest] == ["answer", "answer"]
+    assert flight.stats()["failures"] == 0 and flight.stats()["executions"] == 1
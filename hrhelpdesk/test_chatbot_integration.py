@@ -151,7 +151,7 @@ def test_rag_pipeline():
         import os
         sys.path.append(os.path.join(os.path.dirname(__file__), 'FAQchatbot'))
 
-        from rag_pipeline import answer_question
+        from rag_service import answer_question
 
         test_question = "What are the working hours in Egypt?"
         result = answer_question(test_question)